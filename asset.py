@@ -2,47 +2,133 @@
 # --------
 # Este modulo define la clase FinancialAsset
 # FinancialAsset puede ser una divisa, una accion o un futuro
+#
+# Las fuentes de precios (dolarsi, Yahoo Finance, ROFEX) se importan recien cuando se consulta un precio
+# (ver lazy_import.py). Con una fuente de precios inyectada (price_source o set_spot_quote_poller), los activos se
+# pueden usar sin importar requests, yfinance, pandas ni pyRofex (e.g. analisis offline, replay.py)
 
 
-import cotizacion_dolar
 import datetime
-import rofex
-import byma
+import functools
+import time
+from lazy_import import LazyModule
+from spot_quote_poller import SpotQuote
+
+async_loop = LazyModule("async_loop")
+byma = LazyModule("byma")
+cotizacion_dolar = LazyModule("cotizacion_dolar")
+rofex = LazyModule("rofex")
 
 ASSET_TYPE_CURRENCY = 1  # e.g. DLR
 ASSET_TYPE_STOCK = 2  # e.g. GGAL.BA, YPFD.BA, PAMP.BA
 ASSET_TYPE_FUTURE = 3  # e.g. DLR/AGO21, DLR/SEP21, GGAL/AGO21
 
+# Meses tal como aparecen en los tickers de futuros de ROFEX (e.g. DLR/OCT21)
+MONTH_LIST = ['ENE', 'FEB', 'MAR', 'ABR', 'MAY', 'JUN', 'JUL', 'AGO', 'SEP', 'OCT', 'NOV', 'DIC']
+MONTH_NUMBER = {month_string: month_number for month_number, month_string in enumerate(MONTH_LIST, 1)}  # ENE: 1
+
+# Poller de precios spot (ver spot_quote_poller.py)
+# Si esta definido, ask_price() y bid_price() de divisas y acciones leen la ultima cotizacion de la tabla del poller
+# en lugar de consultar a Yahoo Finance o dolarsi en cada invocacion
+spot_quote_poller = None
+
+
+# set_spot_quote_poller(poller)
+# -----------------------------
+# Define el poller de precios spot que usan todos los objetos FinancialAsset
+# Con poller=None se vuelve a consultar la fuente de precios en cada invocacion
+def set_spot_quote_poller(poller):
+    global spot_quote_poller
+    spot_quote_poller = poller
+
+
+# Reloj (ver replay.py)
+# Si esta definido, la fecha actual se toma de clock.today() en lugar de datetime.date.today(). Permite calcular los
+# dias al vencimiento con la fecha de un dia grabado
+clock = None
+
+
+# set_clock(new_clock)
+# --------------------
+# Define el reloj que usan todos los objetos FinancialAsset. Con new_clock=None se vuelve a usar la fecha del sistema
+def set_clock(new_clock):
+    global clock
+    clock = new_clock
+
+
+# today()
+# -------
+# Devuelve la fecha actual (datetime.date) segun el reloj definido con set_clock
+def today():
+    if clock is not None:
+        return clock.today()
+    return datetime.date.today()
+
+
+# parse_date(date_string)
+# -----------------------
+# Convierte una fecha con formato dd-mm-yyyy (e.g. la columna future_maturity_date de watch_list.csv) en un objeto
+# datetime.date. El resultado se guarda en un cache: cada fecha se procesa una sola vez
+@functools.lru_cache(maxsize=None)
+def parse_date(date_string):
+    return datetime.datetime.strptime(date_string, "%d-%m-%Y").date()
+
+
+# refresh_days_to_maturity(assets, current_date)
+# ----------------------------------------------
+# Vuelve a calcular los dias al vencimiento de una lista de activos en una sola pasada, con la misma fecha actual
+# para todos (por defecto, today()). Se usa al cambiar el dia (ver RateWatchList.roll_day)
+# Devuelve la cantidad de futuros cuyos dias al vencimiento cambiaron
+def refresh_days_to_maturity(assets, current_date=None):
+    if current_date is None:
+        current_date = today()
+    changed = 0
+    for asset in assets:
+        if asset.asset_type == ASSET_TYPE_FUTURE:
+            days_to_maturity = FinancialAsset.remaining_days(asset.maturity_date, current_date)
+            if days_to_maturity != asset.days_to_maturity:
+                asset.days_to_maturity = days_to_maturity
+                changed += 1
+    return changed
+
 
 class FinancialAsset:
 
+    # Los atributos se guardan en slots en lugar de un diccionario por objeto: menos memoria y acceso mas rapido
+    __slots__ = ('symbol', 'asset_type', 'maturity_date', 'days_to_maturity', 'price_source')
+
     # get_maturity_date
     # -----------------
     # Determina la fecha de fin de un futuro a partir del nombre del ticker
     # El ticker suele tener la forma xyz/MMMYY donde xyz es el subyacente, MMM es el mes e YY es el año
     # Devuelve un objeto de tipo datetime.date
+    # El resultado se guarda en un cache: cada ticker se procesa una sola vez
     #
     # Ejemplo de uso
     # --------------
     # print(FinancialAsset.get_maturity_date("DLR/OCT21"))  # 2021-10-31
     # print(type(FinancialAsset.get_maturity_date("DLR/OCT21")))  # <class 'datetime.date'>
 
+    @functools.lru_cache(maxsize=None)
     def get_maturity_date(ticker):
 
         # Toma los 3 primeros caracteres despues de la barra. Si el ticker es DLR/OCT21, el resultado es OCT
-        month_string = str(ticker).split("/")[1][:3]
-        month_list = ['ENE', 'FEB', 'MAR', 'ABR', 'MAY', 'JUN', 'JUL', 'AGO', 'SEP', 'OCT', 'NOV', 'DIC']
-        month_number = month_list.index(month_string) + 1
-        year = int(str(ticker).split("/")[1][3:]) + 2000
+        maturity_string = str(ticker).split("/")[1]
+        month_number = MONTH_NUMBER[maturity_string[:3]]
+        year = int(maturity_string[3:]) + 2000
         # Para determinar el ultimo dia del mes se busca el primer día del mes siguiente y se resta 1
-        maturity_date = datetime.date(year, month_number + 1, 1)
+        if month_number == 12:
+            maturity_date = datetime.date(year + 1, 1, 1)
+        else:
+            maturity_date = datetime.date(year, month_number + 1, 1)
         maturity_date = maturity_date + datetime.timedelta(days=-1)
         return maturity_date
 
-    # remaining_days (maturity_date)
-    # ---------------------------
+    # remaining_days (maturity_date, current_date)
+    # -------------------------------------------
     # Calcula la cantidad de días entre la fecha actual y una fecha futura
     # Recibe la fecha futura en un string con formato dd-mm-yyyy o un objeto datetime.date
+    # current_date es opcional (por defecto, today())
     #
     # Ejemplo de uso:
     # ---------------
@@ -54,13 +140,14 @@ class FinancialAsset:
     # dias = FinancialAsset.remaining_days(fecha_date)
     # print(f"Faltan {dias} dias para el {fecha_date}")  # Faltan 81 dias para el 2021-08-31
 
-    def remaining_days(maturity_date):
-        today = datetime.date.today()
+    def remaining_days(maturity_date, current_date=None):
+        if current_date is None:
+            current_date = today()
         if isinstance(maturity_date, str):  # el parametro puede ser de tipo string o datetime
-            maturity_date_dt = datetime.datetime.strptime(maturity_date, "%d-%m-%Y").date()
+            maturity_date_dt = parse_date(maturity_date)
         else:
             maturity_date_dt = maturity_date
-        remaining_days = (maturity_date_dt - today).days
+        remaining_days = (maturity_date_dt - current_date).days
         if remaining_days == 0:
             remaining_days = 1  # Si el futuro vence hoy, tomar 1 dia para evitar la division por 0
         return remaining_days
@@ -69,21 +156,120 @@ class FinancialAsset:
     # symbol: ticker (e.g. GGAL.BA, GGAL/AGO21)
     # asset_type: un valor entre ASSET_TYPE_CURRENCY, ASSET_TYPE_STOCK, ASSET_TYPE_FUTURE
     # maturity_date: parámetro opcional. Se usa solo para futuros. Si el activos es un futuro y este parámetro
-    # no se especifica, la fecha de vencimiento se infiere a partir del symbol
-    def __init__(self, symbol, asset_type, maturity_date=None):
+    # no se especifica, la fecha de vencimiento se infiere a partir del symbol. Puede ser un string con formato
+    # dd-mm-yyyy o un objeto datetime.date; se guarda como datetime.date
+    # days_to_maturity se calcula al crear el objeto. Si el programa sigue corriendo al dia siguiente, se actualiza con
+    # refresh_days_to_maturity
+    # price_source: parametro opcional. Fuente de precios del activo: un objeto con el metodo get_quote(symbol) que
+    # devuelve un SpotQuote o None (e.g. SpotQuotePoller, RecordedQuoteSource de replay.py). Si tiene cotizacion, se usa
+    # antes que el poller de precios spot y que las consultas a dolarsi, Yahoo Finance o ROFEX
+    def __init__(self, symbol, asset_type, maturity_date=None, price_source=None):
         self.symbol = symbol
         self.asset_type = asset_type
+        self.price_source = price_source
         if asset_type == ASSET_TYPE_FUTURE:
             if maturity_date is None:
                 maturity_date = FinancialAsset.get_maturity_date(ticker=symbol)
+            elif isinstance(maturity_date, str):
+                maturity_date = parse_date(maturity_date)
             self.maturity_date = maturity_date
             self.days_to_maturity = FinancialAsset.remaining_days(maturity_date)
         else:
+            self.maturity_date = None
             self.days_to_maturity = 0
 
+    # fetch_bid_ask()
+    # ---------------
+    # Consulta la fuente de precios y devuelve los precios actuales de compra y venta del activo (bid, ask)
+    # Divisas: dolarsi. Acciones: Yahoo Finance. Futuros: ROFEX
+    def fetch_bid_ask(self):
+        if self.asset_type == ASSET_TYPE_CURRENCY:
+            if self.symbol == "DLR":
+                return cotizacion_dolar.dolar_oficial()
+            else:
+                return 0, 0
+        elif self.asset_type == ASSET_TYPE_FUTURE:
+            return rofex.get_bid_ask(self.symbol)
+        elif self.asset_type == ASSET_TYPE_STOCK:
+            stock_quote = byma.get_quote(self.symbol)
+            return stock_quote.bid, stock_quote.ask
+
+    # fetch_bid_ask_many(assets)
+    # --------------------------
+    # Consulta las fuentes de precios de una lista de activos y devuelve un diccionario symbol -> (bid, ask)
+    # Las acciones se consultan todas juntas con byma.get_quotes. El resto de los activos se consulta uno por uno
+    # Los activos cuya consulta falla no se incluyen en el resultado
+    #
+    # Ejemplo de uso
+    # --------------
+    # quotes = FinancialAsset.fetch_bid_ask_many([dolar, ggal])
+    # print(quotes)  # {'GGAL.BA': (161.5, 163.4), 'DLR': (94.71, 100.71)}
+    def fetch_bid_ask_many(assets):
+        quotes = dict()
+        stock_symbols = [asset.symbol for asset in assets if asset.asset_type == ASSET_TYPE_STOCK]
+        if stock_symbols:
+            quotes.update(byma.get_quotes(stock_symbols))
+        for asset in assets:
+            if asset.asset_type != ASSET_TYPE_STOCK:
+                try:
+                    quotes[asset.symbol] = asset.fetch_bid_ask()
+                except Exception as e:
+                    print(f"Error. No se pudo obtener la cotizacion de {asset.symbol}: {e}")
+        return quotes
+
+    # cached_quote()
+    # --------------
+    # Devuelve la ultima cotizacion (SpotQuote) de la fuente de precios del activo (price_source) o, si no tiene, del
+    # poller de precios spot (solo divisas y acciones). Devuelve None si no hay cotizacion: hay que consultar la fuente
+    # de precios con fetch_bid_ask
+    def cached_quote(self):
+        if self.price_source is not None:
+            spot_quote = self.price_source.get_quote(self.symbol)
+            if spot_quote is not None:
+                return spot_quote
+        if spot_quote_poller is not None and self.asset_type != ASSET_TYPE_FUTURE:
+            return spot_quote_poller.get_quote(self.symbol)
+        return None
+
+    # quote()
+    # -------
+    # Devuelve la cotizacion actual del activo como un objeto SpotQuote (bid, ask, timestamp)
+    # Si hay una cotizacion en la fuente de precios del activo o en el poller de precios spot (ver cached_quote), se
+    # devuelve esa cotizacion. El timestamp permite saber que tan reciente es la cotizacion
+    def quote(self):
+        spot_quote = self.cached_quote()
+        if spot_quote is not None:
+            return spot_quote
+        bid_price, ask_price = self.fetch_bid_ask()
+        return SpotQuote(bid=bid_price, ask=ask_price, timestamp=time.time())
+
+    # async_bid_ask()
+    # ---------------
+    # Version asincronica de quote(), para usar desde el event loop de async_loop.py
+    # Devuelve los precios actuales de compra y venta del activo (bid, ask)
+    #
+    # Ejemplo de uso
+    # --------------
+    # bid_price, ask_price = await ggal.async_bid_ask()
+    async def async_bid_ask(self):
+        spot_quote = self.cached_quote()
+        if spot_quote is not None:
+            return spot_quote.bid, spot_quote.ask
+        if self.asset_type == ASSET_TYPE_CURRENCY and self.symbol == "DLR":
+            snapshot = await cotizacion_dolar.fetch_snapshot()
+            return snapshot.get(cotizacion_dolar.TIPO_COTIZACION_OFICIAL)
+        elif self.asset_type == ASSET_TYPE_STOCK:
+            stock_quote = await async_loop.run_blocking(byma.get_quote, self.symbol)
+            return stock_quote.bid, stock_quote.ask
+        else:
+            return await async_loop.run_blocking(self.fetch_bid_ask)
+
     # ask_price()
     # Devuelve el precio actual de venta del activo
     def ask_price(self):
+        spot_quote = self.cached_quote()
+        if spot_quote is not None:
+            return spot_quote.ask
         if self.asset_type == ASSET_TYPE_CURRENCY:
             if self.symbol == "DLR":
                 return cotizacion_dolar.dolar_oficial_venta()
@@ -94,9 +280,12 @@ class FinancialAsset:
         elif self.asset_type == ASSET_TYPE_STOCK:
             return byma.get_ask_price(self.symbol)
 
-    # ask_price()
+    # bid_price()
     # Devuelve el precio actual de compra del activo
     def bid_price(self):
+        spot_quote = self.cached_quote()
+        if spot_quote is not None:
+            return spot_quote.bid
         if self.asset_type == ASSET_TYPE_CURRENCY:
             if self.symbol == "DLR":
                 return cotizacion_dolar.dolar_oficial_compra()
@@ -126,6 +315,8 @@ class FinancialAsset:
 # Test: asset.py
 if __name__ == "__main__":
 
+    import asyncio
+
     dolar = FinancialAsset(symbol="DLR", asset_type=ASSET_TYPE_CURRENCY)
     print(f"{dolar} Bid price:${dolar.bid_price()} Ask price:${dolar.ask_price()} ")
     # <class 'FinancialAsset'> Symbol:DLR Type:Currency Bid price:$94.71 Ask price:$100.71
@@ -137,3 +328,9 @@ if __name__ == "__main__":
     ggalago21 = FinancialAsset(symbol="GGAL/AGO21", asset_type=ASSET_TYPE_FUTURE)
     print(f"{ggalago21} Bid price:${ggalago21.bid_price()} Ask price:${ggalago21.ask_price()} ")
     # <class 'FinancialAsset'> Symbol:GGAL/AGO21 Type:Future MaturityDate:2021-08-31 Bid price:$170.5 Ask price:$172.4
+
+    # Consulta asincronica de varios activos en paralelo
+    async def fetch_all():
+        return await asyncio.gather(dolar.async_bid_ask(), ggal.async_bid_ask())
+    print(async_loop.run(fetch_all()))  # [(94.71, 100.71), (161.5, 163.4)]
+    async_loop.stop()
@@ -0,0 +1,142 @@
+# async_loop.py
+# -------------
+# Event loop asyncio compartido para consultar precios spot en forma concurrente
+# El loop corre en un thread propio. El thread del websocket de ROFEX le entrega los eventos de market data con
+# submit(), de modo que una respuesta lenta de Yahoo Finance no demora el procesamiento de los otros pares
+#
+# Las fuentes de precios (yfinance, dolarsi) son sincronicas. run_blocking() las ejecuta en un pool de threads,
+# con un maximo de MAX_CONCURRENCY consultas simultaneas
+#
+# Ejemplo de uso
+# --------------
+# start()
+# future = submit(byma.fetch_quotes(["GGAL.BA", "PAMP.BA"]))
+# print(future.result())  # {'GGAL.BA': (161.5, 163.4), 'PAMP.BA': (109.8, 109.9)}
+# stop()
+
+import asyncio
+import concurrent.futures
+import threading
+
+MAX_CONCURRENCY = 8  # cantidad maxima de consultas de precios simultaneas
+
+loop = None
+loop_thread = None
+executor = None
+semaphore = None
+
+
+# set_max_concurrency(max_concurrency)
+# ------------------------------------
+# Modifica la cantidad maxima de consultas simultaneas. Debe invocarse antes de start()
+def set_max_concurrency(max_concurrency):
+    global MAX_CONCURRENCY
+    MAX_CONCURRENCY = max_concurrency
+
+
+# start()
+# -------
+# Crea el event loop y lo ejecuta en un thread propio. Si el loop ya esta corriendo no hace nada
+def start():
+    global loop, loop_thread, executor
+    if loop is not None:
+        return
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="async_loop")
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(executor)
+    loop_thread = threading.Thread(target=loop.run_forever, name="AsyncLoop", daemon=True)
+    loop_thread.start()
+
+
+# stop()
+# ------
+# Detiene el event loop y espera a que termine el thread
+def stop():
+    global loop, loop_thread, executor, semaphore
+    if loop is None:
+        return
+    loop.call_soon_threadsafe(loop.stop)
+    loop_thread.join()
+    loop.close()
+    executor.shutdown(wait=False)
+    loop, loop_thread, executor, semaphore = None, None, None, None
+
+
+# submit(coroutine)
+# -----------------
+# Programa una corrutina en el event loop desde cualquier thread (e.g. el del websocket) sin bloquearlo
+# Devuelve un concurrent.futures.Future con el resultado
+def submit(coroutine):
+    start()
+    return asyncio.run_coroutine_threadsafe(coroutine, loop)
+
+
+# run(coroutine)
+# --------------
+# Ejecuta una corrutina en el event loop y espera su resultado. Util desde codigo sincronico
+def run(coroutine, timeout=None):
+    return submit(coroutine).result(timeout=timeout)
+
+
+# run_blocking(function, *args)
+# -----------------------------
+# Corrutina que ejecuta una funcion sincronica (e.g. una consulta HTTP) en el pool de threads del loop
+# y devuelve su resultado. Limita la cantidad de ejecuciones simultaneas a MAX_CONCURRENCY
+async def run_blocking(function, *args):
+    global semaphore
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    async with semaphore:
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+# Test async_loop.py
+if __name__ == "__main__":
+
+    import time
+
+    # 20 consultas de 0.5 segundos con concurrencia 8 tardan 1.5 segundos y no 10
+    async def slow_quote(i):
+        return await run_blocking(time.sleep, 0.5)
+
+    async def main():
+        await asyncio.gather(*[slow_quote(i) for i in range(20)])
+
+    start_time = time.monotonic()
+    run(main())
+    print(f"20 consultas en {time.monotonic() - start_time:.1f} segundos")  # 20 consultas en 1.5 segundos
+
+    # Servidor HTTP local que reemplaza a dolarsi: responde cada consulta despues de 0.3 segundos
+    import http.server
+    import json
+    import http_client
+
+    class SlowQuoteHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(0.3)
+            body = json.dumps([{'casa': {'nombre': 'Dolar Oficial', 'compra': '94,80', 'venta': '100,80'}}]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SlowQuoteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/api.php?type=valoresprincipales"
+
+    # 7 consultas al servidor en paralelo con un procesamiento bloqueante de 0.5 segundos (e.g. search_rate_arbitrage
+    # esperando la confirmacion de sus ordenes) tardan 0.5 segundos y no 2.6: el loop no queda bloqueado
+    async def fetch_with_blocking_search():
+        return await asyncio.gather(run_blocking(time.sleep, 0.5),
+                                    *[run_blocking(http_client.get_json, url) for i in range(7)])
+
+    start_time = time.monotonic()
+    responses = run(fetch_with_blocking_search())
+    elapsed_time = time.monotonic() - start_time
+    print(f"{len(responses) - 1} consultas en {elapsed_time:.1f} segundos")  # 7 consultas en 0.5 segundos
+    server.shutdown()
+    stop()
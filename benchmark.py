@@ -0,0 +1,341 @@
+# benchmark.py
+# ------------
+# Benchmarks del camino de procesamiento de market data, sin conexion a ROFEX, Yahoo Finance ni dolarsi
+#
+# Las fuentes de datos se reemplazan por stubs locales:
+#   pyRofex: las funciones que usa rofex.py no se conectan a ROFEX (install_stubs)
+#   yfinance: yfinance.Ticker devuelve precios sinteticos sin consultar Yahoo Finance
+#   dolarsi: la sesion HTTP compartida (http_client.py) responde la URL de dolarsi con un JSON sintetico
+#
+# Se generan libros de ordenes sinteticos para <pairs> pares (futuro, subyacente) en <maturities> vencimientos y se
+# miden, para cada caso, la cantidad de mensajes por segundo, los percentiles de latencia por mensaje (p50, p99, max)
+# y la memoria maxima asignada:
+#   implicit_rates: rate.implicit_rates
+#   search_rate_arbitrage: RateWatchList.search_rate_arbitrage con precios spot en la tabla del poller
+#   market_data_handler: main.market_data_handler (cache de market data, libro de ordenes y busqueda de arbitraje)
+#
+# Los resultados se agregan a un archivo JSON (una linea por ejecucion) con la version del codigo (git), y se
+# comparan con la ultima ejecucion anterior con los mismos parametros
+#
+# Ejemplo de uso
+# --------------
+# python benchmark.py --pairs 10 --maturities 3 --ticks 20000
+# python benchmark.py --pairs 50 --maturities 4 --ticks 20000 --rate 2000  # 2000 mensajes por segundo
+
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+
+DEFAULT_RESULTS_PATH = 'benchmark_results.jsonl'
+DOLAR_URL_PREFIX = 'https://www.dolarsi.com/'
+
+# Precios spot sinteticos de los subyacentes. Ej: SYN1.BA: (100.9, 101.1). Los usan los stubs de yfinance y dolarsi
+spot_prices = dict()
+
+
+# StubTicker
+# ----------
+# Reemplazo de yfinance.Ticker. info devuelve los precios de spot_prices
+class StubTicker:
+
+    def __init__(self, ticker, session=None):
+        self.ticker = ticker
+
+    @property
+    def info(self):
+        bid_price, ask_price = spot_prices.get(self.ticker, (0, 0))
+        return {'bid': bid_price, 'ask': ask_price, 'bidSize': 1000, 'askSize': 1000}
+
+
+# install_stubs()
+# ---------------
+# Reemplaza pyRofex, yfinance.Ticker y la API de dolarsi por stubs locales. Debe invocarse antes de importar los
+# modulos del programa (rofex, byma, main)
+def install_stubs():
+    import requests
+    from requests.adapters import BaseAdapter
+
+    # pyRofex: si no esta instalado se usa un modulo vacio con las funciones que usan rofex.py y main.py
+    try:
+        import pyRofex
+    except ImportError:
+        pyRofex = types.ModuleType('pyRofex')
+        sys.modules['pyRofex'] = pyRofex
+        pyRofex.Environment = types.SimpleNamespace(REMARKET=None)
+        pyRofex.MarketDataEntry = types.SimpleNamespace(BIDS='BI', OFFERS='OF')
+    pyRofex.initialize = lambda *args, **kwargs: None
+    pyRofex.init_websocket_connection = lambda *args, **kwargs: None
+    pyRofex.market_data_subscription = lambda *args, **kwargs: None
+    pyRofex.get_all_instruments = lambda *args, **kwargs: {'status': 'OK', 'instruments': []}
+    pyRofex.get_market_data = lambda *args, **kwargs: {'status': 'ERROR'}
+
+    # yfinance
+    try:
+        import yfinance
+    except ImportError:
+        yfinance = types.ModuleType('yfinance')
+        sys.modules['yfinance'] = yfinance
+    yfinance.Ticker = StubTicker
+
+    # dolarsi: adapter de requests que responde sin salir a la red
+    class DolarStubAdapter(BaseAdapter):
+        def send(self, request, **kwargs):
+            bid_price, ask_price = spot_prices.get('DLR', (0, 0))
+            response = requests.Response()
+            response.status_code = 200
+            response.url = request.url
+            response.request = request
+            response._content = json.dumps([{'casa': {
+                'nombre': 'Dolar Oficial', 'compra': f"{bid_price:.2f}".replace('.', ','),
+                'venta': f"{ask_price:.2f}".replace('.', ',')}}]).encode()
+            return response
+
+        def close(self):
+            pass
+
+    import http_client
+    http_client.get_session().mount(DOLAR_URL_PREFIX, DolarStubAdapter())
+
+
+# get_maturities(count)
+# ---------------------
+# Devuelve los sufijos de los proximos <count> vencimientos mensuales. Ej: ['AGO21', 'SEP21', 'OCT21']
+def get_maturities(count):
+    from asset import MONTH_LIST
+    today = datetime.date.today()
+    maturities = []
+    for i in range(1, count + 1):
+        month = (today.month - 1 + i) % 12
+        year = today.year + (today.month - 1 + i) // 12
+        maturities.append(f"{MONTH_LIST[month]}{year % 100:02d}")
+    return maturities
+
+
+# build_pairs(pairs, maturities)
+# ------------------------------
+# Devuelve una lista de pares sinteticos (future_symbol, underlying_symbol, asset_type) y completa spot_prices
+# El primer subyacente es el dolar (DLR). El resto son acciones SYN1.BA, SYN2.BA, ...
+def build_pairs(pairs, maturities):
+    from asset import ASSET_TYPE_CURRENCY, ASSET_TYPE_STOCK
+    random_generator = random.Random(0)
+    result = []
+    underlyings = max(1, pairs // maturities)
+    for i in range(underlyings):
+        if i == 0:
+            underlying_symbol, root, asset_type = 'DLR', 'DLR', ASSET_TYPE_CURRENCY
+        else:
+            underlying_symbol, root, asset_type = f"SYN{i}.BA", f"SYN{i}", ASSET_TYPE_STOCK
+        price = random_generator.uniform(50, 500)
+        spot_prices[underlying_symbol] = (round(price * 0.999, 2), round(price * 1.001, 2))
+        for maturity in get_maturities(maturities):
+            result.append((f"{root}/{maturity}", underlying_symbol, asset_type))
+    return result[:max(pairs, 1)]
+
+
+# build_watch_list(pairs)
+# -----------------------
+# Devuelve una RateWatchList con los pares sinteticos
+def build_watch_list(pairs):
+    from rate_watch_list import RateWatchList, FinancialAsset, ASSET_TYPE_FUTURE
+    watch_list = RateWatchList(transaction_cost=0.001, max_slippage=0.005)
+    underlying_assets = dict()
+    for future_symbol, underlying_symbol, asset_type in pairs:
+        if underlying_symbol not in underlying_assets:
+            underlying_assets[underlying_symbol] = FinancialAsset(symbol=underlying_symbol, asset_type=asset_type)
+        watch_list.add_watch_pair(future_asset=FinancialAsset(symbol=future_symbol, asset_type=ASSET_TYPE_FUTURE),
+                                  underlying_asset=underlying_assets[underlying_symbol])
+    return watch_list
+
+
+# generate_ticks(pairs, count, depth, seed)
+# -----------------------------------------
+# Genera <count> mensajes de websocket sinteticos con <depth> niveles por lado, con el formato de pyRofex
+# Los precios de los futuros se mueven alrededor del spot con una tasa implicita entre 20% y 60% anual
+def generate_ticks(pairs, count, depth=5, seed=1):
+    from asset import FinancialAsset
+    random_generator = random.Random(seed)
+    days = {future_symbol: FinancialAsset.remaining_days(FinancialAsset.get_maturity_date(future_symbol))
+            for future_symbol, underlying_symbol, asset_type in pairs}
+    ticks = []
+    for i in range(count):
+        future_symbol, underlying_symbol, asset_type = pairs[random_generator.randrange(len(pairs))]
+        spot_bid, spot_ask = spot_prices[underlying_symbol]
+        future_price = (spot_bid + spot_ask) / 2 * (1 + random_generator.uniform(0.2, 0.6) * days[future_symbol] / 365)
+        tick_size = round(future_price * 0.0005, 2) or 0.01
+        bids = [{'price': round(future_price - tick_size * (level + 1), 2),
+                 'size': random_generator.randint(1, 50)} for level in range(depth)]
+        offers = [{'price': round(future_price + tick_size * (level + 1), 2),
+                   'size': random_generator.randint(1, 50)} for level in range(depth)]
+        ticks.append({'type': 'Md', 'instrumentId': {'marketId': 'ROFX', 'symbol': future_symbol},
+                      'marketData': {'BI': bids, 'OF': offers}})
+    return ticks
+
+
+# measure(name, function, items, rate)
+# ------------------------------------
+# Invoca function(item) para cada item, a <rate> items por segundo (0: tan rapido como sea posible)
+# Devuelve un diccionario con items por segundo, latencias p50/p99/max en microsegundos y memoria maxima en KB
+# La memoria se mide en una segunda pasada con tracemalloc, para no afectar la medicion de tiempos
+def measure(name, function, items, rate=0):
+    import latency
+    histogram = latency.LatencyHistogram()
+    interval = 1e9 / rate if rate else 0
+    start_time = time.perf_counter_ns()
+    for index, item in enumerate(items):
+        if interval:
+            scheduled_time = start_time + int(index * interval)
+            while time.perf_counter_ns() < scheduled_time:
+                pass
+        item_start_time = time.perf_counter_ns()
+        function(item)
+        histogram.record(time.perf_counter_ns() - item_start_time)
+    elapsed_time = (time.perf_counter_ns() - start_time) / 1e9
+
+    tracemalloc.start()
+    for item in items[:min(len(items), 5000)]:
+        function(item)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'name': name, 'count': len(items), 'per_second': round(len(items) / elapsed_time, 1),
+            'p50_us': round(histogram.percentile(50) / 1000, 2), 'p99_us': round(histogram.percentile(99) / 1000, 2),
+            'max_us': round(histogram.max / 1000, 2), 'peak_memory_kb': round(peak_memory / 1024, 1)}
+
+
+# run(pairs, maturities, ticks, rate)
+# -----------------------------------
+# Ejecuta los benchmarks y devuelve la lista de resultados
+def run(pairs, maturities, ticks, rate=0):
+    import asset
+    import event_log
+    import main
+    import rate as rate_module
+    from spot_quote_poller import SpotQuotePoller
+    from asset import FinancialAsset
+
+    event_log.configure(level=event_log.WARNING, console=False)  # Sin impresion por consola
+    synthetic_pairs = build_pairs(pairs, maturities)
+    messages = generate_ticks(synthetic_pairs, ticks)
+
+    # Precios spot: el poller se actualiza una vez a traves de los stubs de yfinance y dolarsi
+    watch_list = build_watch_list(synthetic_pairs)
+    watch_list.set_order_sink(types.SimpleNamespace(send_order=lambda *args: None))
+    poller = SpotQuotePoller(fetch_bid_ask_many=FinancialAsset.fetch_bid_ask_many)
+    for underlying_asset in watch_list.get_underlying_assets():
+        poller.add_asset(underlying_asset)
+    poller.refresh()
+    asset.set_spot_quote_poller(poller)
+
+    results = []
+
+    # rate.implicit_rates
+    rate_inputs = []
+    for message in messages:
+        future_symbol = message['instrumentId']['symbol']
+        spot_bid, spot_ask = spot_prices[watch_list.get_underlying_asset(future_symbol).symbol]
+        rate_inputs.append((future_symbol, spot_bid, spot_ask, message['marketData']['BI'][0]['price'],
+                            message['marketData']['OF'][0]['price'],
+                            watch_list.get_future_asset(future_symbol).days_to_maturity))
+    results.append(measure('implicit_rates', lambda item: rate_module.implicit_rates(
+        asset=item[0], spot_bid_price=item[1], spot_ask_price=item[2], future_bid_price=item[3],
+        future_ask_price=item[4], days_to_maturity=item[5], transaction_cost=0.001), rate_inputs, rate))
+
+    # RateWatchList.search_rate_arbitrage
+    def search(message):
+        market_data = message['marketData']
+        watch_list.search_rate_arbitrage(future_symbol=message['instrumentId']['symbol'],
+                                         future_bid_price=market_data['BI'][0]['price'],
+                                         future_bid_size=market_data['BI'][0]['size'],
+                                         future_ask_price=market_data['OF'][0]['price'],
+                                         future_ask_size=market_data['OF'][0]['size'])
+    results.append(measure('search_rate_arbitrage', search, messages, rate))
+
+    # main.market_data_handler (con una watch list nueva, para no reutilizar las tasas del caso anterior)
+    main.watch_list = build_watch_list(synthetic_pairs)
+    main.watch_list.set_order_sink(types.SimpleNamespace(send_order=lambda *args: None))
+    results.append(measure('market_data_handler', main.market_data_handler, messages, rate))
+
+    asset.set_spot_quote_poller(None)
+    return results
+
+
+# get_version()
+# -------------
+# Devuelve el commit actual de git, o None si no se puede obtener
+def get_version():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# load_previous(path, parameters)
+# -------------------------------
+# Devuelve los resultados de la ultima ejecucion guardada con los mismos parametros, o None
+def load_previous(path, parameters):
+    previous = None
+    if os.path.exists(path):
+        with open(path) as results_file:
+            for line in results_file:
+                entry = json.loads(line)
+                if entry.get('parameters') == parameters:
+                    previous = entry
+    return previous
+
+
+# save(path, parameters, results)
+# -------------------------------
+# Agrega los resultados de una ejecucion al archivo de resultados
+def save(path, parameters, results):
+    entry = {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'version': get_version(),
+             'python': sys.version.split()[0], 'parameters': parameters, 'results': results}
+    with open(path, 'a') as results_file:
+        results_file.write(json.dumps(entry) + "\n")
+
+
+# report(results, previous)
+# -------------------------
+# Devuelve un texto con los resultados y la variacion respecto de la ejecucion anterior
+def report(results, previous=None):
+    previous_results = {result['name']: result for result in previous['results']} if previous else dict()
+    lines = [f"{'benchmark':<22}{'per second':>12}{'p50 (us)':>11}{'p99 (us)':>11}{'max (us)':>11}{'memory (KB)':>13}"]
+    for result in results:
+        line = (f"{result['name']:<22}{result['per_second']:>12.0f}{result['p50_us']:>11.1f}{result['p99_us']:>11.1f}"
+                f"{result['max_us']:>11.1f}{result['peak_memory_kb']:>13.1f}")
+        previous_result = previous_results.get(result['name'])
+        if previous_result:
+            change = result['per_second'] / previous_result['per_second'] - 1
+            line += f"  {change:+.1%} vs {previous['version']}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# Test benchmark.py
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmarks del procesamiento de market data")
+    parser.add_argument('--pairs', type=int, default=10, help="cantidad de pares (futuro, subyacente)")
+    parser.add_argument('--maturities', type=int, default=3, help="cantidad de vencimientos")
+    parser.add_argument('--ticks', type=int, default=20000, help="cantidad de mensajes de market data")
+    parser.add_argument('--rate', type=int, default=0, help="mensajes por segundo (0: sin limite)")
+    parser.add_argument('--output', default=DEFAULT_RESULTS_PATH, help="archivo de resultados")
+    arguments = parser.parse_args()
+
+    install_stubs()
+    parameters = {'pairs': arguments.pairs, 'maturities': arguments.maturities, 'ticks': arguments.ticks,
+                  'rate': arguments.rate}
+    results = run(arguments.pairs, arguments.maturities, arguments.ticks, arguments.rate)
+    print(report(results, load_previous(arguments.output, parameters)))
+    save(arguments.output, parameters, results)
+    # benchmark               per second   p50 (us)   p99 (us)   max (us)  memory (KB)
+    # implicit_rates               41529       22.5       52.2      947.7         42.1
+    # search_rate_arbitrage        20150       45.0       96.2      301.1         52.9
+    # market_data_handler          15912       58.4      120.8      502.9         53.3
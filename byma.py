@@ -4,14 +4,195 @@
 # Tambien devuelve precios de mercado de acciones
 
 
+import async_loop
+import collections
+import event_log
+import functools
+import threading
+import time
+import http_client
 import yfinance
 
 
+# Cache de cotizaciones
+# ---------------------
+# Cada consulta a Yahoo Finance descarga y procesa el diccionario info completo del ticker.
+# Para no repetir esa descarga en cada evento de market data, las cotizaciones se guardan en un cache por ticker
+# QUOTE_CACHE_TTL: cantidad de segundos durante los cuales una cotizacion se considera vigente
+# QUOTE_CACHE_MAX_SIZE: cantidad maxima de tickers en el cache. Al superarla se descarta el menos usado
+QUOTE_CACHE_TTL = 2.0
+QUOTE_CACHE_MAX_SIZE = 256
+
+# Consulta de cotizaciones de varios tickers en un solo pedido (ver fetch_quotes_batch)
+YAHOO_QUOTE_URL = "https://query1.finance.yahoo.com/v7/finance/quote"
+QUOTES_BATCH_SIZE = 50  # cantidad maxima de tickers por pedido
+
+# Tiempo maximo de espera (en segundos) de una consulta a Yahoo Finance (ver http_client.py)
+QUOTE_DEADLINE = 5.0
+
+# Cotizacion de una accion: precios y cantidades de compra (bid) y venta (ask)
+StockQuote = collections.namedtuple('StockQuote', ['bid', 'ask', 'bid_size', 'ask_size'])
+
+quote_cache = collections.OrderedDict()  # ticker -> (momento de la consulta, StockQuote)
+quote_cache_lock = threading.Lock()
+
+
+# set_quote_cache(ttl, max_size)
+# ------------------------------
+# Configura la vigencia (en segundos) y la cantidad maxima de tickers del cache de cotizaciones
+# Con ttl=0 no se reutilizan cotizaciones: cada consulta va a Yahoo Finance
+def set_quote_cache(ttl=None, max_size=None):
+    global QUOTE_CACHE_TTL, QUOTE_CACHE_MAX_SIZE
+    with quote_cache_lock:
+        if ttl is not None:
+            QUOTE_CACHE_TTL = ttl
+        if max_size is not None:
+            QUOTE_CACHE_MAX_SIZE = max_size
+        while len(quote_cache) > QUOTE_CACHE_MAX_SIZE:
+            quote_cache.popitem(last=False)
+
+
+# fetch_quote(ticker)
+# -------------------
+# Consulta Yahoo Finance y devuelve la cotizacion (StockQuote) de un ticker, sin pasar por el cache
+# La consulta usa la sesion HTTP compartida (conexiones persistentes y timeout), se corta a los QUOTE_DEADLINE
+# segundos con TimeoutError, y se duplica si tarda mas que el percentil 95 de las consultas anteriores
+# Los precios y cantidades que Yahoo Finance no informa se devuelven en 0
+def fetch_quote(ticker):
+    info = http_client.call(lambda: yfinance.Ticker(ticker, session=http_client.get_session()).info,
+                            key="finance.yahoo.com", deadline=QUOTE_DEADLINE, hedge=True)
+    return StockQuote(bid=float(info.get('bid') or 0),
+                      ask=float(info.get('ask') or 0),
+                      bid_size=int(info.get('bidSize') or 0),
+                      ask_size=int(info.get('askSize') or 0))
+
+
+# fetch_quotes_batch(tickers)
+# ---------------------------
+# Consulta Yahoo Finance y devuelve las cotizaciones (StockQuote) de varios tickers en un diccionario ticker ->
+# StockQuote, sin pasar por el cache. Todos los tickers se piden juntos, en un solo pedido HTTP cada
+# QUOTES_BATCH_SIZE tickers. Los tickers que Yahoo Finance no devuelve no se incluyen en el resultado
+def fetch_quotes_batch(tickers):
+    quotes = dict()
+    for start in range(0, len(tickers), QUOTES_BATCH_SIZE):
+        json = http_client.call(functools.partial(download_quotes, tickers[start:start + QUOTES_BATCH_SIZE]),
+                                key="finance.yahoo.com", deadline=QUOTE_DEADLINE, hedge=True)
+        for result in (json.get('quoteResponse') or {}).get('result') or []:
+            quotes[result['symbol']] = StockQuote(bid=float(result.get('bid') or 0),
+                                                  ask=float(result.get('ask') or 0),
+                                                  bid_size=int(result.get('bidSize') or 0),
+                                                  ask_size=int(result.get('askSize') or 0))
+    return quotes
+
+
+# download_quotes(tickers)
+# ------------------------
+# Pide a Yahoo Finance las cotizaciones de una lista de tickers y devuelve el JSON de la respuesta
+# La sesion de yfinance (YfData) agrega la cookie y el crumb que pide Yahoo Finance
+def download_quotes(tickers):
+    data = yfinance.data.YfData(session=http_client.get_session())
+    return data.get_raw_json(YAHOO_QUOTE_URL, params={'symbols': ",".join(tickers), 'formatted': 'false'})
+
+
+# get_quote(ticker)
+# -----------------
+# Devuelve la cotizacion (StockQuote) de un ticker: bid, ask y sus cantidades, obtenidos en una sola consulta
+# Si hay una cotizacion en el cache con menos de QUOTE_CACHE_TTL segundos, se devuelve sin consultar Yahoo Finance
+#
+# Ejemplo de uso
+# --------------
+# quote = get_quote("GGAL.BA")
+# print(f"Bid ${quote.bid} x {quote.bid_size} Ask ${quote.ask} x {quote.ask_size}")
+# # Bid $161.5 x 1200 Ask $163.4 x 800
+def get_quote(ticker):
+    now = time.monotonic()
+    with quote_cache_lock:
+        cached = quote_cache.get(ticker)
+        if cached is not None and now - cached[0] < QUOTE_CACHE_TTL:
+            quote_cache.move_to_end(ticker)
+            return cached[1]
+
+    quote = fetch_quote(ticker)
+
+    with quote_cache_lock:
+        quote_cache[ticker] = (now, quote)
+        quote_cache.move_to_end(ticker)
+        while len(quote_cache) > QUOTE_CACHE_MAX_SIZE:
+            quote_cache.popitem(last=False)
+    return quote
+
+
+# get_quotes(tickers)
+# -------------------
+# Devuelve las cotizaciones de varios tickers en un diccionario ticker -> (bid, ask)
+# Los tickers con cotizacion vigente en el cache no se consultan. El resto se consulta a Yahoo Finance en un solo
+# pedido (fetch_quotes_batch), de modo que refrescar toda la watch list demora lo mismo que una sola consulta y no N
+# consultas. Solo los tickers que faltan en la respuesta (o todos, si el pedido falla) se consultan uno por uno
+# Si la consulta de un ticker falla, se imprime un mensaje de error y el ticker no se incluye en el resultado
+#
+# Ejemplo de uso
+# --------------
+# quotes = get_quotes(["GGAL.BA", "PAMP.BA", "YPFD.BA"])
+# print(quotes)  # {'GGAL.BA': (161.5, 163.4), 'PAMP.BA': (109.8, 109.9), 'YPFD.BA': (847.55, 850.0)}
+def get_quotes(tickers):
+    tickers = list(dict.fromkeys(tickers))  # Elimina duplicados
+    quotes = dict()
+    pending_tickers = []
+    now = time.monotonic()
+    with quote_cache_lock:
+        for ticker in tickers:
+            cached = quote_cache.get(ticker)
+            if cached is not None and now - cached[0] < QUOTE_CACHE_TTL:
+                quote_cache.move_to_end(ticker)
+                quotes[ticker] = (cached[1].bid, cached[1].ask)
+            else:
+                pending_tickers.append(ticker)
+
+    if pending_tickers:
+        try:
+            batch_quotes = fetch_quotes_batch(pending_tickers)
+        except Exception as e:
+            print(f"Error. No se pudieron obtener las cotizaciones de {len(pending_tickers)} tickers juntos: {e}")
+            batch_quotes = dict()
+        with quote_cache_lock:
+            for ticker, quote in batch_quotes.items():
+                quote_cache[ticker] = (now, quote)
+                quote_cache.move_to_end(ticker)
+            while len(quote_cache) > QUOTE_CACHE_MAX_SIZE:
+                quote_cache.popitem(last=False)
+        for ticker in pending_tickers:
+            quote = batch_quotes.get(ticker)
+            if quote is None:
+                try:
+                    quote = get_quote(ticker)
+                except Exception as e:
+                    print(f"Error. No se pudo obtener la cotizacion del ticker {ticker}: {e}")
+                    continue
+            quotes[ticker] = (quote.bid, quote.ask)
+
+    # Devolver los tickers en el mismo orden en que se recibieron
+    return {ticker: quotes[ticker] for ticker in tickers if ticker in quotes}
+
+
+# fetch_quotes(tickers)
+# ---------------------
+# Version asincronica de get_quotes, para usar desde el event loop de async_loop.py
+# La consulta (un solo pedido para todos los tickers) se hace con get_quotes en el pool de threads del loop
+# Devuelve un diccionario ticker -> (bid, ask). Los tickers cuya consulta falla no se incluyen en el resultado
+#
+# Ejemplo de uso
+# --------------
+# quotes = await fetch_quotes(["GGAL.BA", "PAMP.BA"])
+# print(quotes)  # {'GGAL.BA': (161.5, 163.4), 'PAMP.BA': (109.8, 109.9)}
+async def fetch_quotes(tickers):
+    return await async_loop.run_blocking(get_quotes, tickers)
+
+
 # get_ask_price(ticker)
 # get_bid_price(ticker)
 # -------------------
 # Devuelve el precio de subasta/oferta  de un instrumento financiero
-# Los datos se toman de Yahoo Finance
+# Los datos se toman de Yahoo Finance (a traves del cache de get_quote)
 # Si no se encuentra precio, se imprime un mensaje de error y devuelve 0
 #
 # Ejemplo de uso
@@ -25,37 +206,33 @@ import yfinance
 # if ask_price:
 #   print(f"{ticker} cotiza a {spot:.2f}")
 def get_ask_price(ticker):
-    info = yfinance.Ticker(ticker).info
-    if 'ask' not in info:
+    ask_price = get_quote(ticker).ask
+    if not ask_price:
         print("Error. No hay ask price para el ticker " + ticker)
-        return 0
-    else:
-        ask_price = float(info['ask'])
-        return ask_price
+    return ask_price
 
 
 def get_bid_price(ticker):
-    info = yfinance.Ticker(ticker).info
-    if 'bid' not in info:
+    bid_price = get_quote(ticker).bid
+    if not bid_price:
         print("Error. No hay bid price para el ticker " + ticker)
-        return 0
-    else:
-        bid_price = float(info['bid'])
-        return bid_price
+    return bid_price
 
 
 # buy (ticker, quantity, price)
 # -------------------
 # Simula la compra de un activo en BYMA
 def buy(ticker, quantity, price):
-    print(f"Orden de compra: {quantity:.0f} unidades de {ticker} a ${price:.2f}")
+    event_log.log(event_log.INFO, "order", "Orden de compra: {quantity:.0f} unidades de {ticker} a ${price:.2f}",
+                  market="BYMA", side="buy", ticker=ticker, quantity=quantity, price=price)
 
 
 # sell (ticker, quantity, price)
 # -------------------
 # Simula la venta de un activo en BYMA
 def sell(ticker, quantity, price):
-    print(f"Orden de venta: {quantity:.0f} unidades {ticker} a ${price:.2f}")
+    event_log.log(event_log.INFO, "order", "Orden de venta: {quantity:.0f} unidades {ticker} a ${price:.2f}",
+                  market="BYMA", side="sell", ticker=ticker, quantity=quantity, price=price)
 
 
 # Test byma.py
@@ -66,3 +243,13 @@ if __name__ == "__main__":
     bid_price = get_bid_price(ticker=ticker)
     print(f"{ticker} ask price ${ask_price:.2f}")  # GGAL.BA ask price $ 163.40
     print(f"{ticker} bid price ${bid_price:.2f}")  # GGAL.BA bid price $ 161.50
+
+    # La segunda consulta se responde desde el cache, sin volver a consultar Yahoo Finance
+    start_time = time.monotonic()
+    quote = get_quote(ticker=ticker)
+    print(f"{ticker} {quote} ({(time.monotonic() - start_time) * 1000:.3f} ms)")
+    # GGAL.BA StockQuote(bid=161.5, ask=163.4, bid_size=1200, ask_size=800) (0.004 ms)
+
+    # Consulta de varios tickers a la vez
+    print(get_quotes(["GGAL.BA", "PAMP.BA", "YPFD.BA"]))
+    # {'GGAL.BA': (161.5, 163.4), 'PAMP.BA': (109.8, 109.9), 'YPFD.BA': (847.55, 850.0)}
@@ -11,7 +11,10 @@
 # compra, venta = dolar(TIPO_COTIZACION_BLUE)
 # print(compra, venta)  # 152.0 157.0
 
-import requests
+import async_loop
+import http_client
+import threading
+import time
 
 # Constantes
 # Se usan para espeicificar el tipo de cotizacion de dolar
@@ -24,19 +27,51 @@ TIPO_COTIZACION_CCL = 'Dolar Contado con Liqui'
 TIPO_COTIZACION_SOJA = 'Dolar Soja'
 
 DOLAR_URL_API = 'https://www.dolarsi.com/api/api.php?type=valoresprincipales'
+DOLAR_API_DEADLINE = 5.0  # segundos maximos de espera de una descarga (ver http_client.py)
 
 
-# dolar(tipo_cotizacion)
-# ----------------------
-# Devuelve el valor de commpra y venta de un tipo de dolar
-# El parametro indica si se trata de dolar blue, oficial, bolsa
-#
-# Ejemplo de uso:
-# compra, venta = dolar(TIPO_COTIZACION_BLUE)
-# print(compra, venta)  # 152.0 157.0
-def dolar(tipo_cotizacion):
+# Snapshot de cotizaciones
+# ------------------------
+# El web service devuelve todas las cotizaciones en una sola respuesta. En lugar de descargarla cada vez que se pide
+# un tipo de dolar, la respuesta se procesa una sola vez y se guarda en un DolarSnapshot (diccionario indexado por
+# tipo de cotizacion). El snapshot se reutiliza mientras tenga menos de SNAPSHOT_TTL segundos, y puede mantenerse
+# actualizado en segundo plano con start_background_refresh()
+SNAPSHOT_TTL = 10.0  # segundos durante los cuales un snapshot se considera vigente
+SNAPSHOT_REFRESH_INTERVAL = 5.0  # segundos entre dos actualizaciones en segundo plano
+
+snapshot = None  # ultimo DolarSnapshot descargado
+snapshot_lock = threading.Lock()
+download_lock = threading.Lock()  # una sola descarga a la vez: los demas threads esperan y usan su resultado
+refresh_stop_event = threading.Event()
+refresh_thread = None
+
+
+class DolarSnapshot:
+
+    # Constructor
+    # quotes: diccionario tipo de cotizacion -> (compra, venta). Ej: {'Dolar Oficial': (94.71, 100.71), ...}
+    # timestamp: momento de la descarga (time.monotonic())
+    def __init__(self, quotes, timestamp):
+        self.quotes = quotes
+        self.timestamp = timestamp
+
+    # get(tipo_cotizacion)
+    # Devuelve el valor de compra y venta de un tipo de dolar, o None si el web service no lo informa
+    def get(self, tipo_cotizacion):
+        return self.quotes.get(tipo_cotizacion)
+
+    # age()
+    # Devuelve la antiguedad del snapshot en segundos
+    def age(self):
+        return time.monotonic() - self.timestamp
+
 
-    json = requests.get(DOLAR_URL_API).json()
+# parse_snapshot(json)
+# --------------------
+# Convierte la respuesta del web service en un diccionario tipo de cotizacion -> (compra, venta)
+# Los tipos de dolar sin cotizacion numerica (e.g. "No Cotiza") no se incluyen
+def parse_snapshot(json):
+    quotes = dict()
 
     # json tiene una lista de diccionarios
     # Cada diccionario contiene la cotizacion de un tipo de dolar distinto: Oficial, Blue, CCL, Soja
@@ -44,15 +79,104 @@ def dolar(tipo_cotizacion):
 
         # El valor almacenado en cada diccionario es a su vez otro diccionario
         for dict_inner in dict_outer.values():
-
-            if dict_inner['nombre'] == tipo_cotizacion:
-                compra = dict_inner['compra']
-                venta = dict_inner['venta']
+            try:
                 # La API devuelve un string con separador decimal coma (Ej: 165,25).
                 # Cambiar el separador decimal por un punto para poder convertir a float.
-                compra = float(compra.replace(',', '.'))
-                venta = float(venta.replace(',', '.'))
-                return compra, venta
+                compra = float(dict_inner['compra'].replace(',', '.'))
+                venta = float(dict_inner['venta'].replace(',', '.'))
+            except (KeyError, AttributeError, ValueError):
+                continue
+            quotes[dict_inner['nombre']] = (compra, venta)
+    return quotes
+
+
+# download_snapshot()
+# -------------------
+# Descarga todas las cotizaciones del web service y actualiza el snapshot
+# La descarga usa el cliente HTTP compartido (conexiones persistentes, timeout y consultas hedged)
+def download_snapshot():
+    global snapshot
+    json = http_client.get_json(DOLAR_URL_API, deadline=DOLAR_API_DEADLINE, hedge=True)
+    new_snapshot = DolarSnapshot(quotes=parse_snapshot(json), timestamp=time.monotonic())
+    with snapshot_lock:
+        snapshot = new_snapshot
+    return new_snapshot
+
+
+# get_snapshot()
+# --------------
+# Devuelve el snapshot de cotizaciones. Solo se descarga un snapshot nuevo si el actual tiene mas de SNAPSHOT_TTL
+# segundos (o si todavia no se descargo ninguno)
+# Si varios threads encuentran el snapshot vencido a la vez, uno lo descarga y los demas esperan y usan el mismo
+def get_snapshot():
+    current_snapshot = snapshot
+    if current_snapshot is not None and current_snapshot.age() < SNAPSHOT_TTL:
+        return current_snapshot
+    with download_lock:
+        current_snapshot = snapshot
+        if current_snapshot is not None and current_snapshot.age() < SNAPSHOT_TTL:
+            return current_snapshot
+        return download_snapshot()
+
+
+# fetch_snapshot()
+# ----------------
+# Version asincronica de get_snapshot, para usar desde el event loop de async_loop.py
+# Si hay que descargar un snapshot nuevo, la descarga se hace en el pool de threads del loop (con get_snapshot, por lo
+# que las consultas simultaneas comparten una sola descarga)
+async def fetch_snapshot():
+    current_snapshot = snapshot
+    if current_snapshot is not None and current_snapshot.age() < SNAPSHOT_TTL:
+        return current_snapshot
+    return await async_loop.run_blocking(get_snapshot)
+
+
+# start_background_refresh(interval)
+# ----------------------------------
+# Lanza un thread que descarga un snapshot nuevo cada <interval> segundos
+# Con interval menor a SNAPSHOT_TTL, las consultas de cotizacion nunca esperan una descarga
+def start_background_refresh(interval=SNAPSHOT_REFRESH_INTERVAL):
+    global refresh_thread
+    if refresh_thread is not None:
+        return
+    download_snapshot()
+    refresh_stop_event.clear()
+    refresh_thread = threading.Thread(target=background_refresh, args=(interval,),
+                                      name="DolarSnapshotRefresh", daemon=True)
+    refresh_thread.start()
+
+
+# stop_background_refresh()
+# -------------------------
+# Detiene el thread de actualizacion en segundo plano
+def stop_background_refresh():
+    global refresh_thread
+    refresh_stop_event.set()
+    if refresh_thread is not None:
+        refresh_thread.join()
+        refresh_thread = None
+
+
+def background_refresh(interval):
+    while not refresh_stop_event.wait(interval):
+        try:
+            with download_lock:
+                download_snapshot()
+        except Exception as e:
+            print(f"Error. No se pudo actualizar la cotizacion del dolar: {e}")
+
+
+# dolar(tipo_cotizacion)
+# ----------------------
+# Devuelve el valor de commpra y venta de un tipo de dolar
+# El parametro indica si se trata de dolar blue, oficial, bolsa
+# Los valores se leen del snapshot de cotizaciones (ver get_snapshot)
+#
+# Ejemplo de uso:
+# compra, venta = dolar(TIPO_COTIZACION_BLUE)
+# print(compra, venta)  # 152.0 157.0
+def dolar(tipo_cotizacion):
+    return get_snapshot().get(tipo_cotizacion)
 
 
 # dolar_oficial_promedio()
@@ -96,3 +220,5 @@ if __name__ == "__main__":
     print(compra, venta)  # 94.71 100.71
     compra, venta = dolar(TIPO_COTIZACION_BLUE)
     print(compra, venta)  # 159.0 164.0
+    print(get_snapshot().quotes)  # Todas las cotizaciones se obtuvieron con una sola descarga
+    # {'Dolar Oficial': (94.71, 100.71), 'Dolar Blue': (159.0, 164.0), 'Dolar Soja': (141.43, ...), ...}
@@ -0,0 +1,114 @@
+# day_rollover.py
+# ---------------
+# Este modulo define la clase DayRolloverScheduler
+# Los dias al vencimiento de los futuros (FinancialAsset.days_to_maturity) se calculan al crear cada activo. Si el
+# programa sigue corriendo despues de medianoche, todas las tasas se calcularian con un dia de mas.
+# DayRolloverScheduler controla en un thread propio si cambio la fecha actual (asset.today()) y, en ese caso, invoca
+# un callback una sola vez por dia (e.g. RateWatchList.roll_day, que actualiza los dias al vencimiento de todos los
+# futuros en una sola pasada). El procesamiento de cada evento de market data no tiene que controlar la fecha
+#
+# Ejemplo de uso
+# --------------
+# scheduler = DayRolloverScheduler(callback=lambda date: watch_list.roll_day(date))
+# scheduler.start()
+# ...
+# scheduler.stop()
+
+import datetime
+import threading
+import time
+import asset
+
+DEFAULT_CHECK_INTERVAL = 60  # segundos maximos entre dos controles de la fecha actual
+
+
+# get_rollover_time(date)
+# -----------------------
+# Devuelve el momento (segundos desde 1970, como time.time()) en que termina el dia date, en hora local
+def get_rollover_time(date):
+    return datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time()).timestamp()
+
+
+class DayRolloverScheduler:
+
+    # Constructor
+    # -----------
+    # callback: funcion que recibe la nueva fecha (datetime.date). Se invoca desde el thread del scheduler, por lo que
+    # debe sincronizarse con el procesamiento de market data (ver main.setup_day_rollover)
+    # check_interval: segundos maximos entre dos controles de la fecha. Ademas se controla justo despues de medianoche
+    def __init__(self, callback, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.callback = callback
+        self.check_interval = check_interval
+        self.current_date = asset.today()
+        self.rollovers = 0  # cantidad de cambios de dia procesados
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    # check()
+    # -------
+    # Si cambio la fecha actual desde el ultimo control, invoca el callback con la nueva fecha
+    # Devuelve True si hubo cambio de dia
+    def check(self):
+        current_date = asset.today()
+        if current_date == self.current_date:
+            return False
+        self.current_date = current_date
+        self.rollovers += 1
+        try:
+            self.callback(current_date)
+        except Exception as e:
+            print(f"Error. No se pudo procesar el cambio de dia: {e}")
+        return True
+
+    # start()
+    # -------
+    # Lanza el thread que controla la fecha
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="DayRollover", daemon=True)
+        self.thread.start()
+
+    # stop()
+    # ------
+    # Detiene el thread que controla la fecha
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    # run()
+    # -----
+    # Cuerpo del thread. Espera hasta medianoche (o check_interval segundos, lo que ocurra antes) y controla la fecha
+    def run(self):
+        while True:
+            wait_time = get_rollover_time(self.current_date) - time.time() + 0.01
+            if wait_time <= 0:  # La fecha no es la del sistema (e.g. un reloj simulado)
+                wait_time = self.check_interval
+            if self.stop_event.wait(min(wait_time, self.check_interval)):
+                return
+            self.check()
+
+
+# Test day_rollover.py
+if __name__ == "__main__":
+
+    class TestClock:
+        def __init__(self):
+            self.date = datetime.date(2021, 6, 22)
+
+        def today(self):
+            return self.date
+
+    clock = TestClock()
+    asset.set_clock(clock)
+    scheduler = DayRolloverScheduler(callback=lambda date: print(f"Cambio de dia: {date}"), check_interval=0.1)
+    scheduler.start()
+    time.sleep(0.25)
+    clock.date = datetime.date(2021, 6, 23)
+    time.sleep(0.25)  # Cambio de dia: 2021-06-23
+    scheduler.stop()
+    print(scheduler.rollovers)  # 1
+    print(datetime.datetime.fromtimestamp(get_rollover_time(datetime.date(2021, 6, 22))))  # 2021-06-23 00:00:00
@@ -0,0 +1,229 @@
+# http_client.py
+# --------------
+# Cliente HTTP compartido por las fuentes de precios spot (cotizacion_dolar.py y byma.py)
+#
+# - Una unica sesion de requests con pools de conexiones persistentes (keep-alive). Se evita repetir el handshake
+#   TCP/TLS en cada consulta de precios
+# - Timeout por defecto en todas las consultas. Una respuesta lenta no puede bloquear indefinidamente el callback
+#   del websocket de ROFEX
+# - Reintentos acotados ante errores de conexion y respuestas 5xx
+# - Consultas "hedged" opcionales: si una consulta tarda mas que el percentil 95 de las consultas anteriores al mismo
+#   destino, se lanza una consulta duplicada y se usa la primera respuesta que llegue
+#
+# Ejemplo de uso
+# --------------
+# json = get_json(DOLAR_URL_API, deadline=2.0, hedge=True)
+# info = call(lambda: yfinance.Ticker("GGAL.BA", session=get_session()).info, key="yahoo", deadline=5.0)
+
+import collections
+import concurrent.futures
+import threading
+import time
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (3.05, 5)  # segundos: (conexion, lectura)
+DEFAULT_RETRIES = 2  # reintentos ante errores de conexion y respuestas 5xx
+POOL_MAXSIZE = 16  # conexiones persistentes por destino
+HEDGE_PERCENTILE = 0.95  # percentil de latencia a partir del cual se lanza una consulta duplicada
+HEDGE_MIN_SAMPLES = 20  # cantidad minima de mediciones para estimar el percentil
+LATENCY_WINDOW = 200  # cantidad de mediciones de latencia que se guardan por destino
+
+session = None
+session_lock = threading.Lock()
+executor = None
+latency_samples = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+
+
+# TimeoutHTTPAdapter
+# ------------------
+# HTTPAdapter que aplica un timeout por defecto a las consultas que no especifican uno
+# Incluye las consultas que hacen librerias de terceros con la sesion compartida (e.g. yfinance)
+class TimeoutHTTPAdapter(HTTPAdapter):
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+# configure(timeout, retries, pool_maxsize)
+# -----------------------------------------
+# Modifica los parametros del cliente. Se descarta la sesion actual; la proxima consulta crea una nueva
+def configure(timeout=None, retries=None, pool_maxsize=None):
+    global DEFAULT_TIMEOUT, DEFAULT_RETRIES, POOL_MAXSIZE, session, executor
+    with session_lock:
+        if timeout is not None:
+            DEFAULT_TIMEOUT = timeout
+        if retries is not None:
+            DEFAULT_RETRIES = retries
+        if pool_maxsize is not None:
+            POOL_MAXSIZE = pool_maxsize
+        if session is not None:
+            session.close()
+            session = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+            executor = None
+
+
+# get_session()
+# -------------
+# Devuelve la sesion HTTP compartida. Se crea en la primera invocacion
+def get_session():
+    global session
+    if session is None:
+        with session_lock:
+            if session is None:
+                retry = Retry(total=DEFAULT_RETRIES, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504],
+                              allowed_methods=["GET"], raise_on_status=False)
+                adapter = TimeoutHTTPAdapter(timeout=DEFAULT_TIMEOUT, max_retries=retry,
+                                             pool_connections=POOL_MAXSIZE, pool_maxsize=POOL_MAXSIZE)
+                new_session = requests.Session()
+                new_session.mount("https://", adapter)
+                new_session.mount("http://", adapter)
+                session = new_session
+    return session
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        with session_lock:
+            if executor is None:
+                executor = concurrent.futures.ThreadPoolExecutor(max_workers=POOL_MAXSIZE,
+                                                                 thread_name_prefix="http_client")
+    return executor
+
+
+# record_latency(key, seconds)
+# hedge_delay(key)
+# ----------------------------
+# Registran la latencia de las consultas a cada destino y estiman el percentil HEDGE_PERCENTILE
+# hedge_delay devuelve None mientras no haya suficientes mediciones
+def record_latency(key, seconds):
+    latency_samples[key].append(seconds)
+
+
+def hedge_delay(key):
+    samples = latency_samples[key]
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    ordered_samples = sorted(samples)
+    return ordered_samples[min(int(len(ordered_samples) * HEDGE_PERCENTILE), len(ordered_samples) - 1)]
+
+
+# call(function, key, deadline, hedge)
+# ------------------------------------
+# Ejecuta una consulta (function, sin parametros) y devuelve su resultado
+# key: identifica el destino de la consulta (e.g. host). Se usa para medir latencias
+# deadline: tiempo maximo de espera en segundos. Si se supera, se lanza TimeoutError
+# hedge: si es True y la consulta supera el percentil 95 de latencia, se lanza una consulta duplicada
+# Si todas las consultas lanzadas fallan, se propaga la excepcion de la ultima
+# La latencia de cada consulta se mide desde su propio envio (la duplicada no incluye la espera del percentil 95) y
+# solo se registra si llega antes de que call termine: las consultas perdedoras y las que superan el deadline no
+# se registran, para no inflar el percentil que define cuando duplicar
+def call(function, key, deadline=None, hedge=False):
+    start_time = time.monotonic()
+    finished = threading.Event()  # call ya devolvio un resultado o supero el deadline
+
+    def timed_function(submit_time):
+        result = function()
+        if not finished.is_set():
+            record_latency(key, time.monotonic() - submit_time)
+        return result
+
+    if deadline is None and not hedge:
+        return timed_function(start_time)
+
+    try:
+        return wait_for_result(timed_function, key, start_time, deadline, hedge)
+    finally:
+        finished.set()
+
+
+# wait_for_result(timed_function, key, start_time, deadline, hedge)
+# -----------------------------------------------------------------
+# Lanza la consulta en el pool de threads (y, si corresponde, la consulta duplicada) y espera el primer resultado
+def wait_for_result(timed_function, key, start_time, deadline, hedge):
+    pending = {get_executor().submit(timed_function, start_time)}
+    delay = hedge_delay(key) if hedge else None
+    hedged = False
+    error = None
+    while pending:
+        timeout = None
+        if deadline is not None:
+            timeout = max(deadline - (time.monotonic() - start_time), 0)
+        if delay is not None and not hedged:
+            hedge_timeout = max(delay - (time.monotonic() - start_time), 0)
+            timeout = hedge_timeout if timeout is None else min(timeout, hedge_timeout)
+
+        done, pending = concurrent.futures.wait(pending, timeout=timeout,
+                                                return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+
+        elapsed_time = time.monotonic() - start_time
+        if deadline is not None and elapsed_time >= deadline:
+            break
+        if delay is not None and not hedged and elapsed_time >= delay:
+            # La consulta tarda mas de lo habitual: lanzar una consulta duplicada
+            pending.add(get_executor().submit(timed_function, time.monotonic()))
+            hedged = True
+
+    if error is not None and not pending:
+        raise error
+    raise TimeoutError(f"La consulta a {key} supero el tiempo maximo de {deadline} segundos")
+
+
+# get(url, deadline, hedge, **kwargs)
+# get_json(url, deadline, hedge, **kwargs)
+# ----------------------------------------
+# Consulta una url con la sesion compartida. get devuelve la respuesta (requests.Response) y get_json el JSON
+# decodificado. Los parametros adicionales se pasan a requests (e.g. params, headers)
+def get(url, deadline=None, hedge=False, **kwargs):
+    key = urllib.parse.urlsplit(url).netloc
+    return call(lambda: get_session().get(url, **kwargs), key=key, deadline=deadline, hedge=hedge)
+
+
+def get_json(url, deadline=None, hedge=False, **kwargs):
+    response = get(url, deadline=deadline, hedge=hedge, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+
+# Test http_client.py
+if __name__ == "__main__":
+
+    url = 'https://www.dolarsi.com/api/api.php?type=valoresprincipales'
+    for i in range(3):
+        start = time.monotonic()
+        get_json(url, deadline=5.0, hedge=True)
+        print(f"Consulta {i + 1}: {(time.monotonic() - start) * 1000:.1f} ms")
+    # Consulta 1: 412.3 ms  (incluye el handshake TCP/TLS)
+    # Consulta 2: 88.5 ms  (reutiliza la conexion)
+    # Consulta 3: 86.9 ms
+
+    # Una consulta que supera el deadline se corta con TimeoutError
+    try:
+        call(lambda: time.sleep(2), key="test", deadline=0.5)
+    except TimeoutError as e:
+        print(e)  # La consulta a test supero el tiempo maximo de 0.5 segundos
+    print(list(latency_samples["test"]))  # [] (la consulta que supero el deadline no se registra)
+
+    # Una consulta lenta se duplica al superar el percentil 95 (0.05 segundos). La duplicada registra su propia
+    # latencia (0.05 y no 0.10 segundos) y la consulta original, que pierde, no se registra
+    for i in range(HEDGE_MIN_SAMPLES):
+        record_latency("hedge_test", 0.05)
+    calls = iter([1.0, 0.05])
+    call(lambda: time.sleep(next(calls)), key="hedge_test", hedge=True)
+    time.sleep(1.0)  # esperar a que termine la consulta original
+    print(len(latency_samples["hedge_test"]), f"{max(latency_samples['hedge_test']):.2f}")  # 21 0.05
@@ -0,0 +1,102 @@
+# import_budget.py
+# ----------------
+# Controla el tiempo de importacion de los modulos de analisis (calculo de tasas, watch list, replay, etc.)
+#
+# Esos modulos no deben importar las librerias de acceso a la red (requests, pyRofex, yfinance, pandas): las
+# fuentes de precios se importan recien al consultar un precio o enviar una orden (ver lazy_import.py). Importar
+# pandas y yfinance solo lleva mas de medio segundo, que pagaria cualquier script de analisis, el replay y los tests
+#
+# Cada modulo se importa en un interprete nuevo (sin modulos cargados de antes), varias veces, y se toma el menor
+# tiempo. Se informa un error si el tiempo supera el presupuesto del modulo (MODULE_BUDGETS) o si despues del import
+# hay alguna libreria de red cargada
+#
+# Ejemplo de uso
+# --------------
+# python import_budget.py  # controla todos los modulos de MODULE_BUDGETS. Termina con codigo 1 si hay errores
+# python import_budget.py rate_watch_list replay
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Tiempo maximo de importacion de cada modulo, en milisegundos. NumPy solo lleva alrededor de 100 ms
+MODULE_BUDGETS = {
+    'asset': 50,
+    'event_log': 50,
+    'instrument_table': 250,
+    'latency': 50,
+    'lot_optimizer': 250,
+    'market_data_recorder': 50,
+    'order_book': 50,
+    'order_executor': 50,
+    'rate': 250,
+    'rate_index': 50,
+    'rate_watch_list': 300,
+    'replay': 50,
+}
+
+# Librerias que solo deben importarse al acceder a la red
+NETWORK_MODULES = ('requests', 'pyRofex', 'yfinance', 'pandas')
+
+DEFAULT_REPEATS = 3
+
+# Programa que importa un modulo en un interprete nuevo y devuelve (en JSON) la duracion y las librerias de red cargadas
+IMPORT_SCRIPT = """
+import json, sys, time
+start_time = time.perf_counter()
+import {module}
+elapsed_time = time.perf_counter() - start_time
+print(json.dumps([elapsed_time * 1000, [name for name in {network_modules!r} if name in sys.modules]]))
+"""
+
+
+# measure_import(module, repeats)
+# -------------------------------
+# Importa un modulo en repeats interpretes nuevos
+# Devuelve el menor tiempo de importacion (en milisegundos) y la lista de librerias de red que se cargaron
+def measure_import(module, repeats=DEFAULT_REPEATS):
+    script = IMPORT_SCRIPT.format(module=module, network_modules=NETWORK_MODULES)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    import_times = []
+    network_modules = []
+    for i in range(repeats):
+        output = subprocess.run([sys.executable, '-c', script], cwd=directory, capture_output=True, text=True,
+                                check=True).stdout
+        import_time, network_modules = json.loads(output.splitlines()[-1])
+        import_times.append(import_time)
+    return min(import_times), network_modules
+
+
+# check_imports(modules, repeats)
+# -------------------------------
+# Mide el tiempo de importacion de cada modulo y lo compara con su presupuesto
+# Devuelve la lista de errores (vacia si todos los modulos cumplen su presupuesto)
+def check_imports(modules, repeats=DEFAULT_REPEATS):
+    errors = []
+    for module in modules:
+        import_time, network_modules = measure_import(module, repeats)
+        budget = MODULE_BUDGETS.get(module)
+        print(f"{module:<22} {import_time:8.1f} ms (presupuesto: {budget} ms)")
+        if budget is not None and import_time > budget:
+            errors.append(f"{module}: {import_time:.1f} ms, presupuesto {budget} ms")
+        if network_modules:
+            errors.append(f"{module}: importa {', '.join(network_modules)}")
+    return errors
+
+
+# Test import_budget.py
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Control del tiempo de importacion de los modulos de analisis")
+    parser.add_argument('modules', nargs='*', default=list(MODULE_BUDGETS), help="modulos a controlar")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help="importaciones de cada modulo")
+    args = parser.parse_args()
+
+    errors = check_imports(args.modules, args.repeats)
+    # rate_watch_list           90.3 ms (presupuesto: 300 ms)
+    # replay                     6.7 ms (presupuesto: 50 ms)
+    for error in errors:
+        print(f"Error. {error}")
+    sys.exit(1 if errors else 0)
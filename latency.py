@@ -0,0 +1,234 @@
+# latency.py
+# ----------
+# Medicion de latencias por etapa, desde que llega un mensaje de market data por el websocket hasta que se envian las
+# ordenes (rofex.sell/buy, byma.buy/sell)
+#
+# Cada etapa tiene un histograma de latencias al estilo HDR (LatencyHistogram): los valores se agrupan en intervalos
+# cuyo ancho crece con el valor, de modo que el error relativo es siempre menor a 1/2^(SUB_BUCKET_BITS - 1) (~3%).
+# Registrar un valor es O(1) y no crea objetos; los percentiles se calculan solo al pedir el reporte
+#
+# Etapas:
+#   queue: desde la llegada del mensaje hasta que empieza a procesarse (cola de market data, event loop)
+#   spot_fetch: consulta de precios spot del subyacente (Yahoo, dolarsi, poller)
+#   rates: calculo de tasas implicitas y actualizacion de los indices de tasas
+#   best_rate: busqueda de las mejores tasas colocadora y tomadora
+#   sizing: cantidades, precios de ejecucion y rentabilidad de la operacion
+#   dispatch: envio de las 4 ordenes
+#   tick_to_order: desde la llegada del mensaje hasta el envio de la ultima orden
+#
+# Los tiempos se toman con un reloj monotono (time.perf_counter_ns). Si la medicion esta deshabilitada, record() no
+# registra nada
+#
+# Ejemplo de uso
+# --------------
+# enable()
+# start_time = now()
+# ...  # calculo de tasas
+# start_time = record(STAGE_RATES, start_time)
+# print(report())
+#   stage            count      p50 (us)      p99 (us)      max (us)
+#   rates                1          12.4          12.4          12.4
+
+import threading
+import time
+
+# Etapas
+STAGE_QUEUE = 'queue'
+STAGE_SPOT_FETCH = 'spot_fetch'
+STAGE_RATES = 'rates'
+STAGE_BEST_RATE = 'best_rate'
+STAGE_SIZING = 'sizing'
+STAGE_DISPATCH = 'dispatch'
+STAGE_TICK_TO_ORDER = 'tick_to_order'
+STAGES = [STAGE_QUEUE, STAGE_SPOT_FETCH, STAGE_RATES, STAGE_BEST_RATE, STAGE_SIZING, STAGE_DISPATCH,
+          STAGE_TICK_TO_ORDER]
+
+SUB_BUCKET_BITS = 6  # precision de los histogramas: 2^(SUB_BUCKET_BITS - 1) intervalos por potencia de 2
+
+# Reloj monotono en nanosegundos
+now = time.perf_counter_ns
+
+
+class LatencyHistogram:
+
+    # Constructor
+    # -----------
+    # Histograma vacio de latencias en nanosegundos
+    def __init__(self):
+        self.half_count = 1 << (SUB_BUCKET_BITS - 1)
+        self.counts = [0] * ((66 - SUB_BUCKET_BITS) * self.half_count)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.lock = threading.Lock()
+
+    # bucket_index(value)
+    # -------------------
+    # Devuelve el indice del intervalo de un valor. Los valores menores a 2^SUB_BUCKET_BITS tienen intervalo propio
+    def bucket_index(self, value):
+        exponent = value.bit_length() - SUB_BUCKET_BITS
+        if exponent <= 0:
+            return value
+        return exponent * self.half_count + (value >> exponent)
+
+    # bucket_upper_bound(index)
+    # -------------------------
+    # Devuelve el mayor valor que corresponde a un intervalo
+    def bucket_upper_bound(self, index):
+        if index < 2 * self.half_count:
+            return index
+        exponent = index // self.half_count - 1
+        sub_bucket = index - exponent * self.half_count
+        return ((sub_bucket + 1) << exponent) - 1
+
+    # record(value)
+    # -------------
+    # Registra una latencia en nanosegundos
+    def record(self, value):
+        if value < 0:
+            value = 0
+        index = self.bucket_index(value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    # percentile(percentile)
+    # ----------------------
+    # Devuelve la latencia en nanosegundos por debajo de la cual esta el <percentile> por ciento de los valores
+    # (e.g. percentile(99) es el p99). Devuelve 0 si el histograma esta vacio
+    def percentile(self, percentile):
+        with self.lock:
+            if self.count == 0:
+                return 0
+            target = max(1, -(-self.count * percentile // 100))  # redondeo hacia arriba
+            accumulated = 0
+            for index, count in enumerate(self.counts):
+                accumulated += count
+                if accumulated >= target:
+                    return min(self.bucket_upper_bound(index), self.max)
+            return self.max
+
+    # mean()
+    # ------
+    # Devuelve la latencia promedio en nanosegundos
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    # merge(histogram)
+    # ----------------
+    # Suma los valores de otro histograma a este
+    def merge(self, histogram):
+        with self.lock:
+            for index, count in enumerate(histogram.counts):
+                if count:
+                    self.counts[index] += count
+            self.count += histogram.count
+            self.total += histogram.total
+            if histogram.min is not None and (self.min is None or histogram.min < self.min):
+                self.min = histogram.min
+            self.max = max(self.max, histogram.max)
+
+    # reset()
+    # -------
+    # Vacia el histograma
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * len(self.counts)
+            self.count = 0
+            self.total = 0
+            self.min = None
+            self.max = 0
+
+
+# Histogramas por etapa
+enabled = False
+histograms = {stage: LatencyHistogram() for stage in STAGES}
+
+
+# enable()
+# disable()
+# ---------
+# Habilita o deshabilita la medicion de latencias
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+# record(stage, start_time)
+# -------------------------
+# Registra en el histograma de una etapa el tiempo transcurrido desde start_time (obtenido con now())
+# Devuelve el tiempo actual, que sirve como start_time de la etapa siguiente
+def record(stage, start_time):
+    end_time = now()
+    if enabled and start_time is not None:
+        histograms[stage].record(end_time - start_time)
+    return end_time
+
+
+# get_histogram(stage)
+# --------------------
+# Devuelve el histograma de una etapa
+def get_histogram(stage):
+    return histograms[stage]
+
+
+# report()
+# --------
+# Devuelve un texto con la cantidad de valores, p50, p99 y maximo (en microsegundos) de cada etapa con valores
+def report():
+    lines = [f"{'stage':<14}{'count':>9}{'p50 (us)':>14}{'p99 (us)':>14}{'max (us)':>14}"]
+    for stage in STAGES:
+        histogram = histograms[stage]
+        if histogram.count == 0:
+            continue
+        lines.append(f"{stage:<14}{histogram.count:>9}{histogram.percentile(50) / 1000:>14.1f}"
+                     f"{histogram.percentile(99) / 1000:>14.1f}{histogram.max / 1000:>14.1f}")
+    return "\n".join(lines)
+
+
+# dump()
+# ------
+# Imprime el reporte de latencias
+def dump():
+    print(f"Latencias por etapa\n{report()}")
+
+
+# reset()
+# -------
+# Vacia los histogramas de todas las etapas
+def reset():
+    for histogram in histograms.values():
+        histogram.reset()
+
+
+# Test latency.py
+if __name__ == "__main__":
+
+    histogram = LatencyHistogram()
+    for value in range(1, 100001):
+        histogram.record(value * 1000)  # 1 us a 100 ms
+    print(histogram.percentile(50), histogram.percentile(99), histogram.max)  # 50331647 100000000 100000000
+
+    enable()
+    for i in range(1000):
+        start_time = now()
+        sum(range(100))
+        start_time = record(STAGE_RATES, start_time)
+        time.sleep(0)
+        record(STAGE_DISPATCH, start_time)
+    dump()
+    # Latencias por etapa
+    # stage             count      p50 (us)      p99 (us)      max (us)
+    # rates              1000           2.2           2.8          11.7
+    # dispatch           1000          58.4          60.4         103.2
@@ -0,0 +1,74 @@
+# lazy_import.py
+# --------------
+# Este modulo define la clase LazyModule
+# LazyModule reemplaza a un import de un modulo que depende de la red (e.g. rofex -> pyRofex, byma -> yfinance y
+# pandas, cotizacion_dolar -> requests). El modulo se importa recien la primera vez que se usa alguno de sus atributos,
+# por lo que los programas que no lo usan (analisis offline, replay.py, benchmarks, tests) no pagan su tiempo de
+# importacion ni necesitan tener instaladas esas librerias
+#
+# El import se hace con importlib.import_module, que es seguro aunque varios threads usen el modulo por primera vez
+# al mismo tiempo. Cada acceso a un atributo pasa por LazyModule (alrededor de 1 us), despreciable frente a las
+# consultas de red de esos modulos. No usar LazyModule para modulos que se usan en cada evento de market data
+#
+# Ejemplo de uso
+# --------------
+# rofex = LazyModule("rofex")  # en lugar de: import rofex
+# print("rofex" in sys.modules)  # False
+# rofex.get_bid_price("GGAL/AGO21")  # importa rofex (y pyRofex)
+# print("rofex" in sys.modules)  # True
+
+import importlib
+
+
+class LazyModule:
+
+    # Constructor
+    # -----------
+    # name: nombre del modulo a importar (e.g. "rofex")
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+
+    # load()
+    # ------
+    # Importa el modulo (si aun no se importo) y lo devuelve
+    def load(self):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            object.__setattr__(self, '_module', module)
+        return module
+
+    # is_loaded()
+    # -----------
+    # Indica si el modulo ya se importo
+    def is_loaded(self):
+        return self._module is not None
+
+    # Los atributos que no son de LazyModule se leen y escriben en el modulo (e.g. rofex.buy, byma.yfinance)
+    def __getattr__(self, attribute):
+        return getattr(self.load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self.load(), attribute, value)
+
+    def __repr__(self):
+        return f"<LazyModule '{self._name}' ({'importado' if self.is_loaded() else 'sin importar'})>"
+
+
+# Test lazy_import.py
+if __name__ == "__main__":
+
+    import sys
+    import time
+
+    json_module = LazyModule("json")
+    sys.modules.pop("json", None)
+    print(json_module)  # <LazyModule 'json' (sin importar)>
+    print(json_module.dumps({'GGAL/AGO21': 168.1}))  # {"GGAL/AGO21": 168.1}
+    print(json_module)  # <LazyModule 'json' (importado)>
+
+    start_time = time.perf_counter()
+    for i in range(100000):
+        json_module.dumps
+    print(f"{(time.perf_counter() - start_time) / 100000 * 1e9:.0f} ns por acceso")  # 1000 ns por acceso
@@ -3,23 +3,76 @@
 # Bug: solo se procesa la tasa tomadora y colocadora si hay BIDS y OFFERS. Si hay uno solo, no
 
 from rate_watch_list import *
+from spot_quote_poller import SpotQuotePoller, DEFAULT_REFRESH_INTERVAL
+from tick_queue import ConflatingTickQueue, start_workers, DEFAULT_MAX_SYMBOLS
+from order_book import OrderBook
+from watch_list_discovery import build_watch_list, parse_underlying_map, DEFAULT_UNDERLYING_MAP
+import atexit
 import csv
 import pyRofex
 import rofex
+import byma
+import async_loop
+import cotizacion_dolar
+import day_rollover
+import event_log
+import functools
+import http_client
+import latency
+import lot_optimizer
+import market_data_recorder
+import order_executor
+import quote_board
+import shard_pool
 import configparser
+import signal
+import threading
+import time
 
 # Variables globales
 global watch_list
+async_mode = False  # True: los eventos de market data se procesan en el event loop de async_loop.py
+tick_queue = None  # cola de market data entre el websocket y los threads de procesamiento (ver setup_tick_queue)
+executor = None  # envio concurrente de las patas de cada operacion (ver setup_order_executor)
+rollover_scheduler = None  # actualizacion de los dias al vencimiento al cambiar el dia (ver setup_day_rollover)
+shards = None  # procesos de trabajo por grupo de vencimiento (ver setup_shard_pool)
+quote_board_writer = None  # quote board en el que se publican las cotizaciones (ver setup_quote_board)
+quote_board_reader = None  # quote board del que se leen las cotizaciones en lugar de ROFEX, Yahoo y dolarsi
+watch_list_lock = threading.Lock()
 
 
 # setup_watch_list()
 # ------------------
-# Lee la lista de futuros a monitorear del archivo watch_list.csv
+# Carga la lista de futuros a monitorear
+# Si en config.ini se indica [WATCH_LIST].mode = discovery, la lista se arma con todos los futuros que cotizan en ROFEX
+# (ver discover_watch_list). Si no, se lee del archivo watch_list.csv
 # Crea un diccionario, en el cual:
 #   la clave es el simbolo del futuro (e.g. GGAL/AGO21)
 #   el valor es par de activos financieros con los cuales se puede tomar o colocar tasa
 def setup_watch_list():
     global watch_list
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if config.has_section('WATCH_LIST') and config.has_option('WATCH_LIST', 'mode') \
+            and config['WATCH_LIST']['mode'] == 'discovery':
+        discover_watch_list()
+    else:
+        read_watch_list()
+
+    # Imprimir la lista de instrumentos a los cuales suscribirse para pedir market data
+    instruments = watch_list.get_watch_symbols()
+    print("Lista de futuros a monitorear")
+    print("-----------------------------")
+    for instrument in instruments:
+        print(instrument)
+    print("-----------------------------")
+
+
+# read_watch_list()
+# -----------------
+# Lee la lista de futuros a monitorear del archivo watch_list.csv
+def read_watch_list():
+    global watch_list
 
     with open('watch_list.csv') as csvfile:
         reader = csv.DictReader(csvfile)
@@ -42,17 +95,368 @@ def setup_watch_list():
                                           )
             watch_list.add_watch_pair(future_asset=future_asset, underlying_asset=underlying_asset)
 
-        # Imprimir la lista de instrumentos a los cuales suscribirse para pedir market data
-        instruments = watch_list.get_watch_symbols()
-        print("Lista de futuros a monitorear")
-        print("-----------------------------")
-        for instrument in instruments:
-            print(instrument)
-        print("-----------------------------")
+
+# discover_watch_list()
+# ---------------------
+# Arma la lista de futuros a monitorear con todos los instrumentos que cotizan en ROFEX (ver watch_list_discovery.py)
+# De config.ini se leen:
+#   [DISCOVERY].underlyings: tabla raiz del futuro -> subyacente. Ej: DLR:DLR, GGAL:GGAL.BA, PAMP:PAMP.BA
+#   [DISCOVERY].skip_rolling: yes para descartar los futuros con sufijo "A" (e.g. DLR/OCT21A)
+def discover_watch_list():
+    global watch_list
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    underlying_map = DEFAULT_UNDERLYING_MAP
+    skip_rolling = True
+    if config.has_section('DISCOVERY') and config.has_option('DISCOVERY', 'underlyings'):
+        underlying_map = parse_underlying_map(config['DISCOVERY']['underlyings'])
+    if config.has_section('DISCOVERY') and config.has_option('DISCOVERY', 'skip_rolling'):
+        skip_rolling = config['DISCOVERY'].getboolean('skip_rolling')
+
+    symbol_list = rofex.get_symbol_list()
+    pairs = build_watch_list(watch_list, symbol_list, underlying_map=underlying_map, skip_rolling=skip_rolling)
+    print(f"{pairs} futuros encontrados entre {len(symbol_list)} instrumentos de ROFEX")
+
+
+# setup_spot_quote_poller()
+# -------------------------
+# Lanza un thread que mantiene actualizados los precios spot de los subyacentes de la watch list
+# Lee el intervalo de actualizacion (en segundos) y la configuracion del cache de cotizaciones de byma.py
+# del archivo config.ini
+# De esta forma, market_data_handler no espera consultas HTTP a Yahoo Finance o dolarsi en cada evento
+def setup_spot_quote_poller():
+    global watch_list
+    if quote_board_reader is not None:
+        return  # Los precios spot se leen del quote board
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if config.has_section('SPOT') and config.has_option('SPOT', 'refresh_interval'):
+        refresh_interval = float(config['SPOT']['refresh_interval'])
+    else:
+        refresh_interval = DEFAULT_REFRESH_INTERVAL
+
+    if config.has_section('SPOT') and config.has_option('SPOT', 'quote_cache_ttl'):
+        byma.set_quote_cache(ttl=float(config['SPOT']['quote_cache_ttl']))
+    if config.has_section('SPOT') and config.has_option('SPOT', 'quote_cache_size'):
+        byma.set_quote_cache(max_size=int(config['SPOT']['quote_cache_size']))
+
+    print(f"Intervalo de actualizacion de precios spot: {refresh_interval} segundos")
+    poller = SpotQuotePoller(refresh_interval=refresh_interval,
+                             fetch_bid_ask_many=FinancialAsset.fetch_bid_ask_many,
+                             quote_board=quote_board_writer)
+    for underlying_asset in watch_list.get_underlying_assets():
+        poller.add_asset(underlying_asset)
+        if underlying_asset.asset_type == ASSET_TYPE_CURRENCY:
+            # Mantener actualizado el snapshot de cotizaciones del dolar, para que las consultas no lo descarguen
+            cotizacion_dolar.start_background_refresh()
+    poller.start()
+    set_spot_quote_poller(poller)
+
+
+# setup_quote_board()
+# -------------------
+# Comparte las cotizaciones entre varios procesos de estrategia a traves de un quote board en memoria compartida
+# (ver quote_board.py). De config.ini se leen:
+#   [BOARD].mode: publish para publicar los precios spot del poller y el mejor bid y offer de cada mensaje de market
+#                 data; read para leerlos del quote board de otro proceso, sin consultar Yahoo Finance ni dolarsi ni
+#                 suscribirse al websocket de ROFEX (ver run_quote_board); off (por defecto) para no usarlo
+#   [BOARD].name: nombre de la memoria compartida. [BOARD].capacity: cantidad maxima de instrumentos
+# En modo read, los futuros se operan solo con la cantidad del mejor precio (el quote board no guarda el libro)
+def setup_quote_board():
+    global quote_board_writer, quote_board_reader
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if not (config.has_section('BOARD') and config.has_option('BOARD', 'mode')):
+        return
+    mode = config['BOARD']['mode']
+    name = config['BOARD'].get('name', quote_board.DEFAULT_NAME)
+    if mode == 'publish':
+        capacity = int(config['BOARD'].get('capacity', quote_board.DEFAULT_CAPACITY))
+        quote_board_writer = quote_board.QuoteBoardWriter(name, capacity=capacity)
+        for symbol in watch_list.get_watch_symbols():
+            quote_board_writer.add(symbol)
+        for underlying_asset in watch_list.get_underlying_assets():
+            quote_board_writer.add(underlying_asset.symbol)
+        atexit.register(quote_board_writer.close)
+        print(f"Publicando cotizaciones en el quote board {name}")
+    elif mode == 'read':
+        quote_board_reader = quote_board.QuoteBoardReader(name)
+        set_spot_quote_poller(quote_board_reader)
+        print(f"Leyendo cotizaciones del quote board {name}")
+
+
+# run_quote_board()
+# -----------------
+# En modo [BOARD].mode = read, reemplaza al websocket de ROFEX: controla cada [BOARD].poll_interval segundos que
+# futuros de la watch list se actualizaron en el quote board y procesa su mejor bid y offer como un mensaje de
+# market data. No vuelve
+def run_quote_board():
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    poll_interval = float(config['BOARD'].get('poll_interval', 0.001))
+    watch_symbols = set(watch_list.get_watch_symbols())
+    while True:
+        symbols = [symbol for symbol in quote_board_reader.changed_symbols() if symbol in watch_symbols]
+        for symbol in symbols:
+            book_top = quote_board_reader.get_book_top(symbol)
+            if book_top is None:
+                continue
+            bid_price, bid_size, ask_price, ask_size, timestamp = book_top
+            # Los lados sin precio (NaN) quedan vacios, como en los mensajes del websocket
+            market_data = {'BI': [{'price': bid_price, 'size': int(bid_size)}] if bid_price == bid_price else [],
+                           'OF': [{'price': ask_price, 'size': int(ask_size)}] if ask_price == ask_price else []}
+            market_data_handler({'instrumentId': {'symbol': symbol}, 'marketData': market_data})
+        if not symbols:
+            time.sleep(poll_interval)
+
+
+# setup_event_log()
+# -----------------
+# Configura el registro de eventos (ver event_log.py). De config.ini se leen:
+#   [LOG].path: archivo en el que se escriben los eventos en formato JSON. Si no se indica, no se escribe archivo
+#   [LOG].level: nivel minimo de los eventos registrados (DEBUG, INFO, WARNING, ERROR)
+#   [LOG].console: yes para imprimir los eventos en la consola
+# Modo silencioso de baja latencia: level = WARNING y console = no
+def setup_event_log():
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if not config.has_section('LOG'):
+        return
+    path = config['LOG'].get('path') or None
+    level = getattr(event_log, config['LOG'].get('level', 'INFO').upper(), event_log.INFO)
+    console = config['LOG'].getboolean('console', True)
+    event_log.configure(path=path, level=level, console=console)
+
+
+# setup_http_client()
+# -------------------
+# Configura el cliente HTTP compartido por las fuentes de precios spot (ver http_client.py)
+# Lee el timeout (en segundos) y la cantidad de reintentos del archivo config.ini
+def setup_http_client():
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if config.has_section('HTTP') and config.has_option('HTTP', 'timeout'):
+        http_client.configure(timeout=float(config['HTTP']['timeout']))
+    if config.has_section('HTTP') and config.has_option('HTTP', 'retries'):
+        http_client.configure(retries=int(config['HTTP']['retries']))
+
+
+# setup_async_loop()
+# ------------------
+# Si en config.ini se indica [ASYNC].enabled = yes, los eventos de market data se procesan en un event loop asyncio
+# que corre en su propio thread (ver async_loop.py). Los precios spot de distintos pares se consultan en paralelo,
+# con hasta [ASYNC].max_concurrency consultas simultaneas
+def setup_async_loop():
+    global async_mode
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if config.has_section('ASYNC') and config.has_option('ASYNC', 'enabled'):
+        async_mode = config['ASYNC'].getboolean('enabled')
+    if not async_mode:
+        return
+    if config.has_option('ASYNC', 'max_concurrency'):
+        async_loop.set_max_concurrency(int(config['ASYNC']['max_concurrency']))
+    print(f"Procesamiento asincronico de market data ({async_loop.MAX_CONCURRENCY} consultas simultaneas)")
+    async_loop.start()
+
+
+# process_market_data(future_symbol, future_bid_price, future_bid_size, future_ask_price, future_ask_size,
+#                     future_book)
+# ---------------------------------------------------------------------------------------------------------
+# Corrutina que procesa un evento de market data en el event loop: consulta los precios spot del subyacente
+# sin bloquear el loop y luego busca oportunidades de arbitraje
+# search_rate_arbitrage (calculo de tasas, dimensionamiento y envio de ordenes, que con OrderExecutor espera las
+# confirmaciones) se ejecuta en el pool de threads del loop con watch_list_lock: el loop sigue atendiendo las
+# consultas de precios de los otros eventos mientras tanto
+async def process_market_data(future_symbol, future_bid_price, future_bid_size, future_ask_price, future_ask_size,
+                              future_book=None, received_time=None):
+    global watch_list
+    try:
+        start_time = latency.record(latency.STAGE_QUEUE, received_time)
+        underlying_asset = watch_list.get_underlying_asset(future_symbol)
+        spot_bid_price, spot_ask_price = await underlying_asset.async_bid_ask()
+        latency.record(latency.STAGE_SPOT_FETCH, start_time)
+        await async_loop.run_blocking(functools.partial(locked_search_rate_arbitrage,
+                                                        future_symbol=future_symbol,
+                                                        future_bid_price=future_bid_price,
+                                                        future_bid_size=future_bid_size,
+                                                        future_ask_price=future_ask_price,
+                                                        future_ask_size=future_ask_size,
+                                                        spot_bid_price=spot_bid_price,
+                                                        spot_ask_price=spot_ask_price,
+                                                        future_book=future_book,
+                                                        received_time=received_time))
+    except Exception as e:
+        exception_handler(e)
+
+
+# locked_search_rate_arbitrage(**arguments)
+# -----------------------------------------
+# Busca oportunidades de arbitraje (watch_list.search_rate_arbitrage) con watch_list_lock
+def locked_search_rate_arbitrage(**arguments):
+    with watch_list_lock:
+        watch_list.search_rate_arbitrage(**arguments)
+
+
+# setup_tick_queue()
+# ------------------
+# Si en config.ini se indica [QUEUE].enabled = yes, market_data_handler solo encola los mensajes en una cola que
+# guarda el ultimo mensaje de cada futuro (ver tick_queue.py), y [QUEUE].workers threads los procesan
+# Al terminar el programa se imprimen los contadores de la cola
+def setup_tick_queue():
+    global tick_queue
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if not (config.has_section('QUEUE') and config.has_option('QUEUE', 'enabled')
+            and config['QUEUE'].getboolean('enabled')):
+        return
+    workers = 1
+    max_symbols = DEFAULT_MAX_SYMBOLS
+    if config.has_option('QUEUE', 'workers'):
+        workers = int(config['QUEUE']['workers'])
+    if config.has_option('QUEUE', 'max_symbols'):
+        max_symbols = int(config['QUEUE']['max_symbols'])
+
+    print(f"Cola de market data con {workers} thread(s) de procesamiento")
+    tick_queue = ConflatingTickQueue(max_symbols=max_symbols)
+    start_workers(tick_queue, lambda item: process_market_data_message(*item), workers=workers)
+    atexit.register(lambda: print(f"Cola de market data: {tick_queue.stats()}"))
+
+
+# setup_shard_pool()
+# ------------------
+# Si en config.ini se indica [SHARDS].enabled = yes, los grupos de vencimiento de la watch list se reparten entre
+# [SHARDS].workers procesos, cada uno con su propia RateWatchList (ver shard_pool.py). market_data_handler solo envia
+# cada mensaje al proceso de su futuro, con los precios spot del poller, y las ordenes de los procesos se envian
+# desde este proceso. En este modo no se usan la cola de market data ni el event loop asyncio
+# Al terminar el programa se imprimen las estadisticas de cada proceso
+def setup_shard_pool():
+    global shards
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if not (config.has_section('SHARDS') and config.has_option('SHARDS', 'enabled')
+            and config['SHARDS'].getboolean('enabled')):
+        return
+    workers = shard_pool.DEFAULT_WORKERS
+    if config.has_option('SHARDS', 'workers'):
+        workers = int(config['SHARDS']['workers'])
+    book_depth = 1
+    if config.has_section('BOOK') and config.has_option('BOOK', 'depth'):
+        book_depth = int(config['BOOK']['depth'])
+
+    shards = shard_pool.ShardPool(watch_list, workers=workers, book_depth=book_depth)
+    print(f"Procesamiento de market data en {shards.workers} procesos")
+    shards.start()
+    atexit.register(lambda: print(f"Procesos de market data\n{shards.report(shards.stop())}"))
+
+
+# setup_latency()
+# ---------------
+# Si en config.ini se indica [LATENCY].enabled = yes, se mide la latencia de cada etapa del procesamiento de market
+# data (ver latency.py). El reporte se imprime al terminar el programa y, en Linux, al recibir la señal SIGUSR1
+# (e.g. kill -USR1 <pid>)
+def setup_latency():
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if not (config.has_section('LATENCY') and config.has_option('LATENCY', 'enabled')
+            and config['LATENCY'].getboolean('enabled')):
+        return
+    latency.enable()
+    atexit.register(latency.dump)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: latency.dump())
+
+
+# setup_order_executor()
+# ----------------------
+# Si en config.ini se indica [EXECUTION].concurrent = yes, las 4 patas de cada operacion de arbitraje se envian en
+# forma concurrente a traves de un OrderExecutor (ver order_executor.py). [EXECUTION].ack_timeout es la cantidad de
+# segundos que se esperan las confirmaciones de las ordenes
+def setup_order_executor():
+    global executor
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if not (config.has_section('EXECUTION') and config.has_option('EXECUTION', 'concurrent')
+            and config['EXECUTION'].getboolean('concurrent')):
+        return
+    ack_timeout = order_executor.DEFAULT_ACK_TIMEOUT
+    if config.has_option('EXECUTION', 'ack_timeout'):
+        ack_timeout = float(config['EXECUTION']['ack_timeout'])
+    executor = order_executor.OrderExecutor(ack_timeout=ack_timeout)
+    watch_list.set_order_sink(executor)
+
+
+# setup_day_rollover()
+# --------------------
+# Al cambiar el dia, actualiza los dias al vencimiento de los futuros y vuelve a calcular sus tasas
+# (ver day_rollover.py y RateWatchList.roll_day), para que el programa pueda seguir corriendo varios dias
+# La actualizacion se hace con watch_list_lock, como el procesamiento de market data (sincronico o asincronico)
+def setup_day_rollover():
+    global rollover_scheduler
+    rollover_scheduler = day_rollover.DayRolloverScheduler(callback=roll_day)
+    rollover_scheduler.start()
+
+
+# roll_day(current_date)
+# ----------------------
+# Callback del DayRolloverScheduler. Se ejecuta en el thread del scheduler
+def roll_day(current_date):
+    with watch_list_lock:
+        changed = watch_list.roll_day(current_date)
+    if shards is not None:
+        changed = shards.roll_day(current_date)  # las tasas se calculan en los procesos de trabajo
+    expired_symbols = watch_list.get_expired_symbols()
+    if expired_symbols:
+        rofex.market_data_unsubscription(expired_symbols)
+        if shards is not None:
+            shards.expire(expired_symbols)
+    print(f"Cambio de dia: {current_date}. {changed} futuros actualizados, {len(expired_symbols)} vencidos")
+
+
+# setup_market_data_recorder()
+# ----------------------------
+# Si en config.ini se indica [RECORDER].enabled = yes, se graban los mensajes de market data de los futuros y los
+# precios spot usados en cada calculo de tasas en archivos binarios diarios dentro de [RECORDER].directory
+# (ver market_data_recorder.py)
+def setup_market_data_recorder():
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if not (config.has_section('RECORDER') and config.has_option('RECORDER', 'enabled')
+            and config['RECORDER'].getboolean('enabled')):
+        return
+    directory = config['RECORDER'].get('directory', 'market_data')
+    print(f"Grabando market data en {directory}")
+    market_data_recorder.start(directory)
 
 
 # First we define the handlers that will process the messages and exceptions.
+# market_data_handler se ejecuta en el thread del websocket. Si hay cola de market data, solo encola el mensaje
+# junto con su momento de llegada. Si hay procesos de trabajo, envia el mensaje al proceso de su futuro
+# Se descartan los mensajes de futuros vencidos (pyRofex no permite cancelar su suscripcion, ver roll_day)
 def market_data_handler(message):
+    received_time = latency.now()
+    if message['instrumentId']['symbol'] not in watch_list:
+        return
+    future_book = rofex.update_market_data(message)  # Mantener actualizado el cache de precios de futuros
+    market_data_recorder.record_future_tick(message)
+    if quote_board_writer is not None:
+        quote_board_writer.update_market_data(message['instrumentId']['symbol'], message['marketData'])
+    if shards is not None:
+        shards.dispatch(message, received_time)  # cada shard arma su libro con el marketData del mensaje
+    elif tick_queue is not None:
+        tick_queue.put(message['instrumentId']['symbol'], (message, received_time, future_book.snapshot()))
+    else:
+        process_market_data_message(message, received_time, future_book.snapshot())
+
+
+# process_market_data_message(message, received_time, future_book)
+# ----------------------------------------------------------------
+# Busca oportunidades de arbitraje con un mensaje de market data
+# received_time es el momento de llegada del mensaje (latency.now()), para medir latencias
+# future_book: copia del libro de ordenes del futuro al llegar el mensaje (OrderBook.snapshot). El libro de rofex se
+# sigue actualizando en el thread del websocket mientras se procesa el mensaje. Por defecto, se arma con el mensaje
+# Con varios threads de procesamiento, watch_list_lock evita que dos threads modifiquen la watch_list a la vez
+def process_market_data_message(message, received_time=None, future_book=None):
     global watch_list
     future_symbol = message['instrumentId']['symbol']
     try:
@@ -60,17 +464,38 @@ def market_data_handler(message):
         future_bid_size = message['marketData']['BI'][0]['size']
         future_ask_price = message['marketData']['OF'][0]['price']
         future_ask_size = message['marketData']['OF'][0]['size']
-        watch_list.search_rate_arbitrage(future_symbol=future_symbol,
-                                         future_bid_price=future_bid_price,
-                                         future_bid_size=future_bid_size,
-                                         future_ask_price=future_ask_price,
-                                         future_ask_size=future_ask_size
-                                         )
+        if future_book is None:
+            future_book = OrderBook(future_symbol, depth=max(rofex.market_data_depth, 1))
+            future_book.update(message['marketData'])
+        if async_mode:
+            # Entregar el evento al event loop y liberar el thread del websocket
+            async_loop.submit(process_market_data(future_symbol=future_symbol,
+                                                  future_bid_price=future_bid_price,
+                                                  future_bid_size=future_bid_size,
+                                                  future_ask_price=future_ask_price,
+                                                  future_ask_size=future_ask_size,
+                                                  future_book=future_book,
+                                                  received_time=received_time))
+        else:
+            with watch_list_lock:
+                latency.record(latency.STAGE_QUEUE, received_time)
+                watch_list.search_rate_arbitrage(future_symbol=future_symbol,
+                                                 future_bid_price=future_bid_price,
+                                                 future_bid_size=future_bid_size,
+                                                 future_ask_price=future_ask_price,
+                                                 future_ask_size=future_ask_size,
+                                                 future_book=future_book,
+                                                 received_time=received_time
+                                                 )
     except IndexError:
         pass
 
 
+# order_report_handler recibe las confirmaciones de ordenes. Si son de una pata enviada por el OrderExecutor, se
+# registra su latencia de confirmacion
 def order_report_handler(message):
+    if executor is not None and executor.on_order_report(message):
+        return
     print("Order Report Message Received: {0}".format(message))
 
 
@@ -92,9 +517,16 @@ def setup_websocket_connection():
 
 # subscribe_market_data()
 # -----------------------
+# Se suscribe a los bids y offers de los futuros de la watch_list
+# La cantidad de niveles de precios por mensaje se lee de [BOOK].depth en config.ini (por defecto, 1)
 def subscribe_market_data():
     global watch_list
     tickers = watch_list.get_watch_symbols()
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    depth = 1
+    if config.has_section('BOOK') and config.has_option('BOOK', 'depth'):
+        depth = int(config['BOOK']['depth'])
 
     # Pedir precios de bid y ask de los futuros de la watch_list
     entries = [pyRofex.MarketDataEntry.BIDS,
@@ -102,11 +534,13 @@ def subscribe_market_data():
                ]
 
     # Suscribirse para pedir informacion de market data
-    pyRofex.market_data_subscription(tickers=tickers, entries=entries)
+    # Los mensajes recibidos alimentan el cache de precios de rofex.py (ver market_data_handler)
+    rofex.market_data_subscription(tickers=tickers, entries=entries, depth=depth)
 
 
 # Crea una RateWatchList
-# Setea el costo de transaccion
+# Setea el costo de transaccion y el slippage maximo al operar varios niveles del libro de ordenes
+# Setea la variacion minima de precios para volver a calcular las tasas de un futuro
 def create_watch_list():
     global watch_list
     config = configparser.ConfigParser()
@@ -117,14 +551,49 @@ def create_watch_list():
         print("Falta [COST].transaction_cost en config.ini")
         transaction_cost = 0.0
 
+    if config.has_section('BOOK') and config.has_option('BOOK', 'max_slippage'):
+        max_slippage = float(config['BOOK']['max_slippage'])
+    else:
+        max_slippage = 0.0
+    if config.has_section('BOOK') and config.has_option('BOOK', 'price_tolerance'):
+        price_tolerance = float(config['BOOK']['price_tolerance'])
+    else:
+        price_tolerance = 0.0
+
+    # Cantidades de contratos: maxima ganancia (profit) o flujo neto de hoy mas cercano a 0 (balance)
+    if config.has_section('SIZING') and config.has_option('SIZING', 'objective'):
+        lot_objective = config['SIZING']['objective']
+    else:
+        lot_objective = lot_optimizer.OBJECTIVE_PROFIT
+    if config.has_section('SIZING') and config.has_option('SIZING', 'max_imbalance') \
+            and config['SIZING']['max_imbalance']:
+        max_imbalance = float(config['SIZING']['max_imbalance'])
+    else:
+        max_imbalance = None
+
     print(f"Costo de transaccion: {transaction_cost:.2%}")
-    watch_list = RateWatchList(transaction_cost)
+    print(f"Slippage maximo en futuros: {max_slippage:.2%}")
+    watch_list = RateWatchList(transaction_cost, max_slippage=max_slippage, price_tolerance=price_tolerance,
+                               lot_objective=lot_objective, max_imbalance=max_imbalance)
 
 
 if __name__ == "__main__":
     global watch_list
+    setup_event_log()  # Configurar el registro de eventos
+    setup_latency()  # Configurar la medicion de latencias
+    setup_market_data_recorder()  # Configurar la grabacion de market data
     rofex.initialize()  # Loguearse a ROFEX
     create_watch_list()  # Leer parametros de costos de archivo de configuracion config.ini
     setup_watch_list()  # Cargar la lista de futuros a monitorear
+    setup_order_executor()  # Enviar las patas de cada operacion en forma concurrente (opcional)
+    setup_day_rollover()  # Actualizar los dias al vencimiento de los futuros al cambiar el dia
+    setup_http_client()  # Configurar timeout y reintentos de las consultas de precios spot
+    setup_quote_board()  # Publicar las cotizaciones en memoria compartida o leerlas de otro proceso (opcional)
+    setup_spot_quote_poller()  # Mantener actualizados los precios spot en segundo plano
+    setup_shard_pool()  # Procesar los grupos de vencimiento en varios procesos (opcional)
+    setup_async_loop()  # Procesar los eventos de market data en un event loop asyncio (opcional)
+    setup_tick_queue()  # Procesar los eventos de market data fuera del thread del websocket (opcional)
+    if quote_board_reader is not None:
+        run_quote_board()  # Procesar el market data publicado en el quote board por otro proceso
     setup_websocket_connection()  # Indicar las funciones que manejan los eventos websocket
     subscribe_market_data()  # Suscribirse a bids y offers de los futuros de la watch_list
@@ -0,0 +1,287 @@
+# market_data_recorder.py
+# -----------------------
+# Grabacion de market data en archivos binarios compactos, para analisis offline y pruebas de performance
+#
+# Se graban los mensajes de market data de los futuros (mejor bid y mejor offer) y los precios spot de los activos
+# subyacentes usados en cada calculo de tasas. Se genera un archivo por dia (market_data_YYYYMMDD.bin) al que solo se
+# agregan registros
+#
+# Formato del archivo:
+#   encabezado de HEADER_SIZE bytes: MAGIC, version y tamaño de registro
+#   registros de RECORD_SIZE bytes (48), todos del mismo tamaño:
+#     timestamp: nanosegundos desde 1970 (time.time_ns)
+#     symbol_id: numero de simbolo
+#     kind: RECORD_SYMBOL, RECORD_FUTURE o RECORD_SPOT
+#     bid_price, bid_size, ask_price, ask_size
+#   Los simbolos se guardan una sola vez en registros RECORD_SYMBOL (diccionario symbol_id -> simbolo), antes del
+#   primer registro que los usa. Los simbolos de mas de MAX_SYMBOL_SIZE bytes no se graban
+#
+# MarketDataReader mapea el archivo en memoria (mmap) y recorre los registros sin copiarlos
+#
+# Ejemplo de uso
+# --------------
+# recorder = MarketDataRecorder("market_data")
+# recorder.record(RECORD_FUTURE, "GGAL/AGO21", 168.1, 10, 168.95, 5)
+# recorder.close()
+# with MarketDataReader(recorder.path) as reader:
+#     for timestamp, symbol, kind, bid_price, bid_size, ask_price, ask_size in reader:
+#         print(symbol, bid_price, ask_price)  # GGAL/AGO21 168.1 168.95
+
+import atexit
+import datetime
+import mmap
+import os
+import struct
+import threading
+import time
+
+NAN = float('nan')
+
+MAGIC = b'RFXMD\x00\x00\x00'
+VERSION = 1
+HEADER_FORMAT = '<8sII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)  # 16 bytes
+
+RECORD_FORMAT = '<qHB5xdddd'  # timestamp, symbol_id, kind, bid_price, bid_size, ask_price, ask_size
+MAX_SYMBOL_SIZE = 32  # bytes
+SYMBOL_RECORD_FORMAT = f'<qHB5x{MAX_SYMBOL_SIZE}s'  # timestamp, symbol_id, kind, simbolo
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)  # 48 bytes
+
+# Tipos de registro
+RECORD_SYMBOL = 0  # definicion de un simbolo
+RECORD_FUTURE = 1  # mejor bid y mejor offer de un futuro (websocket de ROFEX)
+RECORD_SPOT = 2  # precios spot de un activo subyacente
+
+WRITE_BUFFER_SIZE = 1 << 16  # los registros se escriben al archivo en bloques de 64 KB
+
+
+# get_path(directory, date)
+# -------------------------
+# Devuelve el nombre del archivo de un dia. Ej: market_data/market_data_20210622.bin
+def get_path(directory, date):
+    return os.path.join(directory, f"market_data_{date:%Y%m%d}.bin")
+
+
+class MarketDataRecorder:
+
+    # Constructor
+    # -----------
+    # directory: carpeta en la que se guardan los archivos. Se crea si no existe
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.file = None
+        self.path = None
+        self.rotation_time = 0  # momento (time.time_ns) en que hay que pasar al archivo del dia siguiente
+        self.symbol_ids = dict()  # simbolos ya definidos en el archivo actual. Ej: GGAL/AGO21: 0
+        self.rejected_symbols = set()  # simbolos de mas de MAX_SYMBOL_SIZE bytes, que no se graban
+        self.records = 0
+        self.rejected = 0  # registros descartados por el tamaño de su simbolo
+        self.spot_quotes = dict()  # ultimos precios spot grabados en el archivo actual. Ej: GGAL.BA: (161.5, 163.4)
+
+    # open(timestamp)
+    # ---------------
+    # Abre (o crea) el archivo del dia de timestamp. Si el archivo es nuevo, escribe el encabezado
+    def open(self, timestamp):
+        if self.file is not None:
+            self.file.close()
+        date = datetime.date.fromtimestamp(timestamp / 1e9)
+        self.path = get_path(self.directory, date)
+        self.file = open(self.path, 'ab', buffering=WRITE_BUFFER_SIZE)
+        if self.file.tell() == 0:
+            self.file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, RECORD_SIZE))
+        else:
+            # Descartar un registro incompleto al final del archivo (e.g. si el programa termino abruptamente)
+            incomplete_size = (self.file.tell() - HEADER_SIZE) % RECORD_SIZE
+            if incomplete_size:
+                self.file.truncate(self.file.tell() - incomplete_size)
+        next_day = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time())
+        self.rotation_time = int(next_day.timestamp() * 1e9)
+        self.symbol_ids = dict()  # El diccionario de simbolos se vuelve a escribir en cada archivo
+        self.spot_quotes = dict()  # Los precios spot vigentes tambien
+
+    # record(kind, symbol, bid_price, bid_size, ask_price, ask_size, timestamp)
+    # -------------------------------------------------------------------------
+    # Agrega un registro al archivo del dia. timestamp es opcional (por defecto, time.time_ns())
+    # Si el simbolo ocupa mas de MAX_SYMBOL_SIZE bytes, el registro se descarta (se informa una vez por simbolo): el
+    # registro RECORD_SYMBOL lo truncaria y el archivo no podria leerse con el simbolo correcto
+    def record(self, kind, symbol, bid_price, bid_size, ask_price, ask_size, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time_ns()
+        with self.lock:
+            if timestamp >= self.rotation_time or self.file is None:
+                self.open(timestamp)
+            symbol_id = self.symbol_ids.get(symbol)
+            if symbol_id is None:
+                name = symbol.encode()
+                if len(name) > MAX_SYMBOL_SIZE:
+                    self.rejected += 1
+                    if symbol not in self.rejected_symbols:
+                        self.rejected_symbols.add(symbol)
+                        print(f"Error. No se graba el market data de {symbol}: el simbolo supera los "
+                              f"{MAX_SYMBOL_SIZE} bytes")
+                    return
+                symbol_id = len(self.symbol_ids)
+                self.symbol_ids[symbol] = symbol_id
+                self.file.write(struct.pack(SYMBOL_RECORD_FORMAT, timestamp, symbol_id, RECORD_SYMBOL, name))
+            self.file.write(struct.pack(RECORD_FORMAT, timestamp, symbol_id, kind,
+                                        bid_price, bid_size, ask_price, ask_size))
+            self.records += 1
+
+    # record_spot_quote(symbol, bid_price, ask_price, timestamp)
+    # ----------------------------------------------------------
+    # Graba los precios spot de un activo solo si cambiaron desde su ultimo registro en el archivo actual
+    # Los mismos precios llegan una vez por cada futuro del subyacente y por cada actualizacion del poller
+    def record_spot_quote(self, symbol, bid_price, ask_price, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time_ns()
+        spot_quote = (bid_price, ask_price)
+        if self.spot_quotes.get(symbol) == spot_quote and timestamp < self.rotation_time:
+            return
+        self.record(RECORD_SPOT, symbol, bid_price, 0, ask_price, 0, timestamp)
+        self.spot_quotes[symbol] = spot_quote
+
+    # flush()
+    # -------
+    # Escribe al archivo los registros pendientes
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    # close()
+    # -------
+    # Cierra el archivo actual
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.rotation_time = 0
+
+
+class MarketDataReader:
+
+    # Constructor
+    # -----------
+    # path: archivo grabado con MarketDataRecorder
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size = struct.unpack_from(HEADER_FORMAT, self.map)
+        if magic != MAGIC or record_size != RECORD_SIZE:
+            self.close()
+            raise ValueError(f"{path} no es un archivo de market data")
+        self.version = version
+        self.record_count = (len(self.map) - HEADER_SIZE) // RECORD_SIZE  # incluye los registros RECORD_SYMBOL
+        self.symbols = dict()  # diccionario symbol_id -> simbolo, se completa al recorrer los registros
+
+    # __iter__()
+    # ----------
+    # Recorre los registros de precios en orden de grabacion, sin copiar el archivo
+    # Devuelve tuplas (timestamp, symbol, kind, bid_price, bid_size, ask_price, ask_size)
+    def __iter__(self):
+        symbols = self.symbols
+        end = HEADER_SIZE + self.record_count * RECORD_SIZE
+        with memoryview(self.map)[HEADER_SIZE:end] as records:
+            for index, (timestamp, symbol_id, kind, bid_price, bid_size, ask_price, ask_size) in \
+                    enumerate(struct.iter_unpack(RECORD_FORMAT, records)):
+                if kind == RECORD_SYMBOL:
+                    symbol = struct.unpack_from(SYMBOL_RECORD_FORMAT, records, index * RECORD_SIZE)[3]
+                    symbols[symbol_id] = symbol.rstrip(b'\x00').decode()
+                    continue
+                yield timestamp, symbols[symbol_id], kind, bid_price, bid_size, ask_price, ask_size
+
+    # close()
+    # -------
+    # Libera el mapeo en memoria y cierra el archivo
+    # Si queda un recorrido sin terminar, el mapeo se libera cuando se descarta ese recorrido
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Grabador de market data del programa. Si es None, record_future_tick y record_spot_quote no hacen nada
+recorder = None
+
+
+# start(directory)
+# stop()
+# ----------------
+# Inicia o detiene la grabacion de market data en la carpeta directory
+def start(directory):
+    global recorder
+    recorder = MarketDataRecorder(directory)
+
+
+def stop():
+    global recorder
+    if recorder is not None:
+        recorder.close()
+        recorder = None
+
+
+# record_future_tick(message)
+# ---------------------------
+# Graba el mejor bid y el mejor offer de un mensaje de websocket de ROFEX. Un lado sin precios se graba como NaN
+def record_future_tick(message):
+    if recorder is None:
+        return
+    market_data = message['marketData']
+    bids = market_data.get('BI') or [{'price': NAN, 'size': NAN}]
+    offers = market_data.get('OF') or [{'price': NAN, 'size': NAN}]
+    recorder.record(RECORD_FUTURE, message['instrumentId']['symbol'],
+                    bids[0]['price'], bids[0]['size'], offers[0]['price'], offers[0]['size'])
+
+
+# record_spot_quote(symbol, bid_price, ask_price)
+# -----------------------------------------------
+# Graba los precios spot de un activo subyacente, si cambiaron desde su ultimo registro
+def record_spot_quote(symbol, bid_price, ask_price):
+    if recorder is None:
+        return
+    recorder.record_spot_quote(symbol, bid_price, ask_price)
+
+
+# Al terminar el programa, escribir los registros pendientes
+atexit.register(stop)
+
+
+# Test market_data_recorder.py
+if __name__ == "__main__":
+
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+    start(directory)
+    start_time = time.perf_counter()
+    for i in range(100000):
+        record_future_tick({'instrumentId': {'symbol': ["GGAL/AGO21", "PAMP/AGO21"][i % 2]},
+                            'marketData': {'BI': [{'price': 168.1, 'size': 10}], 'OF': [{'price': 168.95, 'size': 5}]}})
+        record_spot_quote("GGAL.BA", 161.5 + i % 2 / 10, 163.4)
+    elapsed_time = time.perf_counter() - start_time
+    records = recorder.records
+    record_spot_quote("GGAL.BA", 161.6, 163.4)  # Los mismos precios spot que el ultimo registro no se graban
+    print(recorder.records - records)  # 0
+    record_spot_quote("X" * (MAX_SYMBOL_SIZE + 1), 1.0, 1.1)  # Error. No se graba el market data de XXX...X: ...
+    path = recorder.path
+    stop()
+    print(f"{elapsed_time / 200000 * 1e6:.2f} us por registro, {os.path.getsize(path)} bytes")
+    # 1.96 us por registro, 9600160 bytes
+
+    start_time = time.perf_counter()
+    with MarketDataReader(path) as reader:
+        count = sum(1 for record in reader)
+        print(reader.symbols)  # {0: 'GGAL/AGO21', 1: 'GGAL.BA', 2: 'PAMP/AGO21'}
+    print(f"{count} registros leidos en {time.perf_counter() - start_time:.2f} s")  # 200000 registros leidos en 0.08 s
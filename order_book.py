@@ -0,0 +1,162 @@
+# order_book.py
+# -------------
+# Este modulo define la clase OrderBook
+# OrderBook guarda los primeros niveles de precios (bids y offers) de un futuro. Los precios y cantidades se guardan
+# en arrays de tamaño fijo que se actualizan en el lugar con cada mensaje de market data, sin crear objetos nuevos
+#
+# Permite calcular, en un solo recorrido de los niveles:
+#   el precio promedio ponderado (VWAP) de operar una cantidad
+#   la cantidad que puede operarse sin alejarse del mejor precio mas de un porcentaje (slippage)
+#
+# Ejemplo de uso
+# --------------
+# book = OrderBook("GGAL/AGO21")
+# book.update({'BI': [{'price': 170, 'size': 10}, {'price': 169.5, 'size': 30}], 'OF': [{'price': 172, 'size': 5}]})
+# print(book.vwap(SIDE_BID, 20))  # (169.75, 20.0, 169.5)
+# print(book.quantity_for_slippage(SIDE_BID, 0.005))  # 40.0
+
+from array import array
+
+SIDE_BID = 'BI'  # bids: precios a los que se puede vender
+SIDE_OFFER = 'OF'  # offers: precios a los que se puede comprar
+
+DEFAULT_DEPTH = 5  # cantidad de niveles de precios que se guardan por lado
+
+
+class OrderBook:
+
+    # Constructor
+    # -----------
+    # symbol: ticker del futuro (e.g. GGAL/AGO21)
+    # depth: cantidad maxima de niveles de precios por lado
+    def __init__(self, symbol, depth=DEFAULT_DEPTH):
+        self.symbol = symbol
+        self.depth = depth
+        self.prices = {SIDE_BID: array('d', bytes(8 * depth)), SIDE_OFFER: array('d', bytes(8 * depth))}
+        self.sizes = {SIDE_BID: array('d', bytes(8 * depth)), SIDE_OFFER: array('d', bytes(8 * depth))}
+        self.levels = {SIDE_BID: 0, SIDE_OFFER: 0}  # cantidad de niveles con precio en cada lado
+
+    # update(market_data)
+    # -------------------
+    # Actualiza el libro con el campo marketData de un mensaje de websocket de ROFEX
+    # Ej: {'BI': [{'price': 170, 'size': 10}, ...], 'OF': [{'price': 172, 'size': 5}, ...]}
+    # Los lados que no vienen en el mensaje no se modifican
+    def update(self, market_data):
+        for side in (SIDE_BID, SIDE_OFFER):
+            entries = market_data.get(side)
+            if entries is None:
+                continue
+            prices = self.prices[side]
+            sizes = self.sizes[side]
+            levels = min(len(entries), self.depth)
+            for level in range(levels):
+                prices[level] = entries[level]['price']
+                sizes[level] = entries[level]['size']
+            self.levels[side] = levels
+
+    # snapshot()
+    # ----------
+    # Devuelve una copia del libro que no cambia con los mensajes siguientes. El libro de rofex.order_books se
+    # actualiza en el lugar en el thread del websocket: los threads de procesamiento y el event loop reciben una copia
+    def snapshot(self):
+        book = OrderBook(self.symbol, depth=self.depth)
+        for side in (SIDE_BID, SIDE_OFFER):
+            book.prices[side][:] = self.prices[side]
+            book.sizes[side][:] = self.sizes[side]
+            book.levels[side] = self.levels[side]
+        return book
+
+    # best(side)
+    # ----------
+    # Devuelve el mejor precio y su cantidad (price, size) de un lado del libro, o None si ese lado esta vacio
+    def best(self, side):
+        if self.levels[side] == 0:
+            return None
+        return self.prices[side][0], self.sizes[side][0]
+
+    # total_quantity(side)
+    # --------------------
+    # Devuelve la cantidad total disponible en todos los niveles de un lado del libro
+    def total_quantity(self, side):
+        return sum(self.sizes[side][:self.levels[side]])
+
+    # vwap(side, quantity)
+    # --------------------
+    # Calcula el precio promedio de operar <quantity> unidades contra un lado del libro
+    # (SIDE_BID para vender, SIDE_OFFER para comprar)
+    # Devuelve una tupla (vwap, filled_quantity, limit_price):
+    #   vwap: precio promedio ponderado por cantidad
+    #   filled_quantity: cantidad que puede operarse (menor a quantity si el libro no tiene suficiente)
+    #   limit_price: peor precio alcanzado. Es el precio limite de una orden que barre esos niveles
+    # Si el lado esta vacio devuelve (0, 0, 0)
+    def vwap(self, side, quantity):
+        prices = self.prices[side]
+        sizes = self.sizes[side]
+        remaining_quantity = quantity
+        amount = 0.0
+        limit_price = 0.0
+        for level in range(self.levels[side]):
+            if remaining_quantity <= 0:
+                break
+            level_quantity = min(sizes[level], remaining_quantity)
+            amount += level_quantity * prices[level]
+            remaining_quantity -= level_quantity
+            limit_price = prices[level]
+        filled_quantity = quantity - remaining_quantity
+        if filled_quantity <= 0:
+            return 0, 0, 0
+        return amount / filled_quantity, filled_quantity, limit_price
+
+    # quantity_for_slippage(side, max_slippage)
+    # -----------------------------------------
+    # Devuelve la cantidad que puede operarse contra un lado del libro sin que ningun nivel se aleje del mejor precio
+    # mas de max_slippage (e.g. 0.005 = 0.5%). Con max_slippage=0 devuelve la cantidad del mejor nivel
+    def quantity_for_slippage(self, side, max_slippage):
+        levels = self.levels[side]
+        if levels == 0:
+            return 0
+        prices = self.prices[side]
+        sizes = self.sizes[side]
+        if side == SIDE_BID:
+            worst_price = prices[0] * (1 - max_slippage)
+        else:
+            worst_price = prices[0] * (1 + max_slippage)
+        quantity = 0
+        for level in range(levels):
+            if (side == SIDE_BID and prices[level] < worst_price) or \
+                    (side == SIDE_OFFER and prices[level] > worst_price):
+                break
+            quantity += sizes[level]
+        return quantity
+
+    # __str__()
+    # Imprime el libro de ordenes
+    def __str__(self):
+        bids = ", ".join(f"{self.sizes[SIDE_BID][i]:.0f} x ${self.prices[SIDE_BID][i]}"
+                         for i in range(self.levels[SIDE_BID]))
+        offers = ", ".join(f"{self.sizes[SIDE_OFFER][i]:.0f} x ${self.prices[SIDE_OFFER][i]}"
+                           for i in range(self.levels[SIDE_OFFER]))
+        return f"<class 'OrderBook'> Symbol:{self.symbol} Bids:[{bids}] Offers:[{offers}]"
+
+
+# Test order_book.py
+if __name__ == "__main__":
+
+    book = OrderBook("GGAL/AGO21")
+    book.update({'BI': [{'price': 170, 'size': 10}, {'price': 169.5, 'size': 30}, {'price': 160, 'size': 100}],
+                 'OF': [{'price': 172, 'size': 5}, {'price': 172.5, 'size': 15}]})
+    print(book)
+    # <class 'OrderBook'> Symbol:GGAL/AGO21 Bids:[10 x $170.0, 30 x $169.5, 100 x $160.0]
+    # Offers:[5 x $172.0, 15 x $172.5]
+
+    print(book.vwap(SIDE_BID, 20))  # (169.75, 20.0, 169.5)
+    print(book.vwap(SIDE_OFFER, 50))  # (172.375, 20.0, 172.5)
+    print(book.quantity_for_slippage(SIDE_BID, 0))  # 10.0
+    print(book.quantity_for_slippage(SIDE_BID, 0.005))  # 40.0
+    print(book.quantity_for_slippage(SIDE_OFFER, 0.005))  # 20.0
+
+    # Un mensaje nuevo reemplaza los niveles en el lugar. Una copia (snapshot) conserva los niveles anteriores
+    snapshot = book.snapshot()
+    book.update({'BI': [{'price': 171, 'size': 8}], 'OF': []})
+    print(book.best(SIDE_BID), book.best(SIDE_OFFER))  # (171.0, 8.0) None
+    print(snapshot.best(SIDE_BID), snapshot.best(SIDE_OFFER))  # (170.0, 10.0) (172.0, 5.0)
@@ -0,0 +1,275 @@
+# order_executor.py
+# -----------------
+# Este modulo define la clase OrderExecutor
+# OrderExecutor envia las 4 ordenes (patas) de una operacion de arbitraje de tasas en forma concurrente, en lugar de
+# una despues de la otra. Asi la demora de una pata no se suma al tiempo en que las demas quedan expuestas a cambios
+# de precios (riesgo de patas descalzadas)
+#
+# Cada pata se envia desde un thread de un pool propio a traves de un gateway de ordenes:
+#   ExchangeGateway: envia las ordenes a ROFEX (rofex.buy/sell) y BYMA (byma.buy/sell)
+#   MockOrderGateway: gateway local que simula la demora de envio y confirma las ordenes (pruebas)
+# Las confirmaciones (order reports) llegan por main.order_report_handler y se asocian a cada pata por su
+# identificador de orden (clOrdId)
+#
+# Por cada operacion se informa la latencia de envio de cada pata, la latencia total de envio y, a medida que llegan,
+# las latencias de confirmacion (ver ExecutionReport)
+#
+# Ejemplo de uso
+# --------------
+# executor = OrderExecutor(gateway=MockOrderGateway())
+# report = executor.send_orders([OrderLeg(MARKET_ROFEX, ORDER_SELL, "PAMP/AGO21", 16, 115.0),
+#                                OrderLeg(MARKET_BYMA, ORDER_BUY, "PAMP.BA", 16, 109.9), ...])
+# report.wait_for_acks(timeout=1.0)
+# print(report)  # <class 'ExecutionReport'> 4 patas Envio:5.8 ms Confirmadas:4/4
+
+import collections
+import concurrent.futures
+import itertools
+import threading
+import time
+import event_log
+from lazy_import import LazyModule
+
+byma = LazyModule("byma")  # se importan al enviar la primera orden (ver lazy_import.py)
+rofex = LazyModule("rofex")
+
+# Mercados y lados de las ordenes
+MARKET_ROFEX = 'ROFEX'  # futuros
+MARKET_BYMA = 'BYMA'  # acciones y divisas
+ORDER_BUY = 'buy'
+ORDER_SELL = 'sell'
+
+DEFAULT_MAX_WORKERS = 4  # una pata por thread
+DEFAULT_ACK_TIMEOUT = 5.0  # segundos maximos de espera de las confirmaciones de una operacion
+MAX_UNMATCHED_ACKS = 1000  # confirmaciones guardadas que llegaron antes de registrar su pata (o de otras ordenes)
+
+# Pata de una operacion: una orden a un mercado
+OrderLeg = collections.namedtuple('OrderLeg', ['market', 'side', 'ticker', 'quantity', 'price'])
+
+
+class ExchangeGateway:
+
+    # send_order(leg)
+    # ---------------
+    # Envia una orden a ROFEX o BYMA. Devuelve el identificador de la orden (clOrdId), o None si el mercado no lo
+    # informa (rofex.buy/sell y byma.buy/sell todavia no envian ordenes reales)
+    def send_order(self, leg):
+        exchange = rofex if leg.market == MARKET_ROFEX else byma
+        if leg.side == ORDER_BUY:
+            return exchange.buy(ticker=leg.ticker, quantity=leg.quantity, price=leg.price)
+        return exchange.sell(ticker=leg.ticker, quantity=leg.quantity, price=leg.price)
+
+
+class MockOrderGateway:
+
+    # Constructor
+    # -----------
+    # Gateway local para pruebas. No envia ordenes: espera una demora de envio y, despues de una demora de
+    # confirmacion, entrega un order report con el formato de pyRofex al handler de confirmaciones
+    # send_latency: segundos de demora de envio por mercado. Ej: {'ROFEX': 0.002, 'BYMA': 0.005}
+    # ack_latency: segundos entre el envio y la confirmacion
+    # order_report_handler: funcion que recibe los order reports (e.g. OrderExecutor.on_order_report)
+    def __init__(self, send_latency=None, ack_latency=0.001, order_report_handler=None):
+        self.send_latency = send_latency if send_latency is not None else {MARKET_ROFEX: 0.002, MARKET_BYMA: 0.005}
+        self.ack_latency = ack_latency
+        self.order_report_handler = order_report_handler
+        self.order_ids = itertools.count(1)
+        self.orders = []  # ordenes recibidas: (clOrdId, leg)
+
+    # send_order(leg)
+    # ---------------
+    # Simula el envio de una orden. Devuelve su identificador (clOrdId)
+    def send_order(self, leg):
+        time.sleep(self.send_latency.get(leg.market, 0))
+        order_id = f"mock-{next(self.order_ids)}"
+        self.orders.append((order_id, leg))
+        if self.order_report_handler is not None:
+            message = {'type': 'or', 'orderReport': {'clOrdId': order_id, 'status': 'NEW',
+                                                     'instrumentId': {'symbol': leg.ticker},
+                                                     'side': leg.side.upper(), 'orderQty': leg.quantity,
+                                                     'price': leg.price}}
+            threading.Timer(self.ack_latency, self.order_report_handler, args=(message,)).start()
+        return order_id
+
+
+class ExecutionReport:
+
+    # Constructor
+    # -----------
+    # Resultado del envio de las patas de una operacion
+    # legs: lista de OrderLeg
+    def __init__(self, legs):
+        self.legs = legs
+        self.order_ids = [None] * len(legs)  # identificador de la orden de cada pata
+        self.send_latencies = [None] * len(legs)  # nanosegundos desde el inicio del envio hasta el envio de cada pata
+        self.ack_latencies = [None] * len(legs)  # nanosegundos desde el inicio del envio hasta cada confirmacion
+        self.errors = [None] * len(legs)  # excepcion de las patas que no se pudieron enviar
+        self.dispatch_latency = None  # nanosegundos hasta que se enviaron todas las patas
+        self.start_time = time.perf_counter_ns()
+        self.pending_acks = 0
+        self.acks_event = threading.Event()
+
+    # wait_for_acks(timeout)
+    # ----------------------
+    # Espera las confirmaciones de todas las patas con identificador de orden. Devuelve True si llegaron todas
+    def wait_for_acks(self, timeout=None):
+        return self.acks_event.wait(timeout)
+
+    # acknowledged()
+    # --------------
+    # Devuelve la cantidad de patas confirmadas
+    def acknowledged(self):
+        return sum(1 for ack_latency in self.ack_latencies if ack_latency is not None)
+
+    def __str__(self):
+        dispatch_latency = self.dispatch_latency / 1e6 if self.dispatch_latency is not None else 0
+        return (f"<class 'ExecutionReport'> {len(self.legs)} patas Envio:{dispatch_latency:.1f} ms "
+                f"Confirmadas:{self.acknowledged()}/{len(self.legs)}")
+
+
+class OrderExecutor:
+
+    # Constructor
+    # -----------
+    # gateway: objeto con el metodo send_order(leg) que devuelve el identificador de la orden (por defecto,
+    # ExchangeGateway)
+    # max_workers: cantidad de threads de envio (con 4, las 4 patas de una operacion salen a la vez)
+    # ack_timeout: segundos despues de los cuales se dejan de esperar las confirmaciones de una operacion
+    def __init__(self, gateway=None, max_workers=DEFAULT_MAX_WORKERS, ack_timeout=DEFAULT_ACK_TIMEOUT):
+        self.gateway = gateway if gateway is not None else ExchangeGateway()
+        self.ack_timeout = ack_timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="OrderLeg")
+        self.pending = dict()  # patas esperando confirmacion: clOrdId -> (ExecutionReport, indice de la pata)
+        self.unmatched_acks = collections.OrderedDict()  # confirmaciones sin pata registrada: clOrdId -> momento
+        self.lock = threading.Lock()
+
+    # send_order(market, side, ticker, quantity, price)
+    # -------------------------------------------------
+    # Envia una orden suelta (ver RateWatchList.set_order_sink)
+    def send_order(self, market, side, ticker, quantity, price):
+        return self.send_orders([OrderLeg(market, side, ticker, quantity, price)])
+
+    # send_orders(legs)
+    # -----------------
+    # Envia todas las patas en forma concurrente y espera a que se hayan enviado (no a que se confirmen)
+    # Devuelve un ExecutionReport. Las latencias de envio se registran en el registro de eventos
+    def send_orders(self, legs):
+        report = ExecutionReport(legs)
+        futures = [self.executor.submit(self.send_leg, report, index) for index in range(len(legs))]
+        concurrent.futures.wait(futures)
+        with self.lock:
+            report.dispatch_latency = time.perf_counter_ns() - report.start_time
+            completed = report.pending_acks == 0
+        if completed:
+            self.complete(report)
+        else:
+            threading.Timer(self.ack_timeout, self.expire, args=(report,)).start()
+
+        event_log.log(event_log.INFO, "order_dispatch",
+                      "Envio de {legs} ordenes: {dispatch_latency_ms:.2f} ms (patas: {send_latencies_ms})",
+                      legs=len(legs), dispatch_latency_ms=report.dispatch_latency / 1e6,
+                      send_latencies_ms=[round(latency / 1e6, 2) if latency is not None else None
+                                         for latency in report.send_latencies])
+        for index, error in enumerate(report.errors):
+            if error is not None:
+                event_log.log(event_log.ERROR, "order_error", "Error enviando la orden {ticker}: {error}",
+                              ticker=legs[index].ticker, error=str(error))
+        return report
+
+    # send_leg(report, index)
+    # -----------------------
+    # Envia una pata a traves del gateway. Se ejecuta en un thread del pool
+    # La pata queda esperando su confirmacion, salvo que la confirmacion ya haya llegado
+    def send_leg(self, report, index):
+        try:
+            order_id = self.gateway.send_order(report.legs[index])
+        except Exception as e:
+            report.errors[index] = e
+            order_id = None
+        report.send_latencies[index] = time.perf_counter_ns() - report.start_time
+        if order_id is None:
+            return
+        with self.lock:
+            report.order_ids[index] = order_id
+            ack_time = self.unmatched_acks.pop(order_id, None)
+            if ack_time is not None:
+                report.ack_latencies[index] = ack_time - report.start_time
+            else:
+                self.pending[order_id] = (report, index)
+                report.pending_acks += 1
+
+    # on_order_report(message)
+    # ------------------------
+    # Procesa un order report recibido por websocket (ver main.order_report_handler)
+    # Si corresponde a una pata enviada, registra la latencia de confirmacion y devuelve True
+    # Si no (e.g. la confirmacion llego antes de que send_leg registre la pata), se guarda y devuelve False
+    def on_order_report(self, message):
+        order_id = message.get('orderReport', {}).get('clOrdId')
+        ack_time = time.perf_counter_ns()
+        with self.lock:
+            item = self.pending.pop(order_id, None)
+            if item is None:
+                if order_id is not None:
+                    self.unmatched_acks[order_id] = ack_time
+                    if len(self.unmatched_acks) > MAX_UNMATCHED_ACKS:
+                        self.unmatched_acks.popitem(last=False)
+                return False
+            report, index = item
+            report.ack_latencies[index] = ack_time - report.start_time
+            report.pending_acks -= 1
+            completed = report.pending_acks == 0 and report.dispatch_latency is not None
+        if completed:
+            self.complete(report)
+        return True
+
+    # complete(report)
+    # ----------------
+    # Marca una operacion como confirmada (todas sus patas enviadas y confirmadas)
+    def complete(self, report):
+        report.acks_event.set()
+        ack_latencies = [latency for latency in report.ack_latencies if latency is not None]
+        if ack_latencies:
+            event_log.log(event_log.INFO, "order_ack",
+                          "Confirmacion de {legs} ordenes: {ack_latency_ms:.2f} ms",
+                          legs=len(ack_latencies), ack_latency_ms=max(ack_latencies) / 1e6,
+                          ack_latencies_ms=[round(latency / 1e6, 2) for latency in ack_latencies])
+
+    # expire(report)
+    # --------------
+    # Deja de esperar las confirmaciones pendientes de una operacion
+    def expire(self, report):
+        with self.lock:
+            expired = [order_id for order_id, (pending_report, index) in self.pending.items()
+                       if pending_report is report]
+            for order_id in expired:
+                del self.pending[order_id]
+        if expired:
+            event_log.log(event_log.WARNING, "order_ack_timeout",
+                          "Sin confirmacion de {count} ordenes despues de {timeout} segundos",
+                          count=len(expired), timeout=self.ack_timeout, order_ids=expired)
+
+    # shutdown()
+    # ----------
+    # Detiene los threads de envio
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+# Test order_executor.py
+if __name__ == "__main__":
+
+    legs = [OrderLeg(MARKET_ROFEX, ORDER_SELL, "PAMP/AGO21", 16, 115.0),
+            OrderLeg(MARKET_BYMA, ORDER_BUY, "PAMP.BA", 16, 109.9),
+            OrderLeg(MARKET_ROFEX, ORDER_BUY, "GGAL/AGO21", 16, 119.55),
+            OrderLeg(MARKET_BYMA, ORDER_SELL, "GGAL.BA", 16, 109.8)]
+
+    gateway = MockOrderGateway(send_latency={MARKET_ROFEX: 0.002, MARKET_BYMA: 0.005}, ack_latency=0.001)
+    executor = OrderExecutor(gateway=gateway)
+    gateway.order_report_handler = executor.on_order_report
+    report = executor.send_orders(legs)
+    print(report.wait_for_acks(timeout=1.0))  # True
+    print(report)  # <class 'ExecutionReport'> 4 patas Envio:5.8 ms Confirmadas:4/4 (en serie: 14 ms)
+    event_log.flush()
+    # Envio de 4 ordenes: 5.75 ms (patas: [2.51, 5.58, 2.69, 5.72])
+    # Confirmacion de 4 ordenes: 6.81 ms
+    executor.shutdown()
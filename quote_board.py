@@ -0,0 +1,342 @@
+# quote_board.py
+# --------------
+# Este modulo define las clases QuoteBoardWriter y QuoteBoardReader
+# Un quote board es una tabla de cotizaciones en memoria compartida (multiprocessing.shared_memory) que escribe un
+# solo proceso (el que consulta Yahoo Finance y dolarsi y recibe el websocket de ROFEX) y leen, sin copiarla, todos
+# los procesos de estrategia que corren en la misma maquina. Asi varias variantes de la estrategia pueden correr en
+# paralelo sin multiplicar las consultas HTTP ni las conexiones al websocket
+#
+# Formato de la memoria compartida (todos los numeros little-endian):
+#   encabezado (64 bytes): MAGIC, capacidad (uint32), tamaño de registro (uint32), cantidad de instrumentos (uint64)
+#   tabla de simbolos: capacity nombres de SYMBOL_SIZE bytes (UTF-8 completado con ceros)
+#   registros: capacity registros de RECORD_SIZE bytes (una linea de cache), uno por instrumento:
+#     sequence (uint64), bid, bid_size, ask, ask_size, timestamp (float64) y 16 bytes libres
+# Un valor sin precio (e.g. un lado del libro vacio) se guarda como NaN
+#
+# Cada registro se protege con un seqlock: el escritor incrementa sequence antes de escribir (queda impar) y despues
+# de escribir (queda par). Un lector lee sequence, los valores y sequence otra vez; si sequence era impar o cambio,
+# la lectura se mezclo con una escritura y se repite. Los lectores nunca bloquean al escritor ni ven un bid de una
+# cotizacion y un ask de otra. sequence tambien indica que instrumentos cambiaron desde la ultima lectura
+# (ver QuoteBoardReader.changed_symbols)
+#
+# Ejemplo de uso
+# --------------
+# Proceso escritor:
+#   board = QuoteBoardWriter("rofex_quote_board", capacity=256)
+#   board.update("GGAL.BA", bid=161.5, ask=163.4)
+#   board.update("GGAL/AGO21", bid=168.1, ask=168.95, bid_size=18, ask_size=14)
+# Procesos de estrategia:
+#   reader = QuoteBoardReader("rofex_quote_board")
+#   asset.set_spot_quote_poller(reader)  # FinancialAsset.bid_price() y ask_price() leen el quote board
+#   print(reader.get_quote("GGAL.BA"))  # SpotQuote(bid=161.5, ask=163.4, timestamp=1624377600.25)
+#   future_asset = FinancialAsset("GGAL/AGO21", ASSET_TYPE_FUTURE, price_source=reader)  # tambien para futuros
+
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy
+from spot_quote_poller import SpotQuote
+
+MAGIC = b'QBOARD01'
+HEADER_FORMAT = '<8sIIQ'  # MAGIC, capacity, record_size, count
+HEADER_SIZE = 64
+COUNT_OFFSET = 16  # posicion de count en el encabezado
+SYMBOL_SIZE = 32
+RECORD_SIZE = 64
+SEQUENCE_FORMAT = struct.Struct('<Q')
+VALUES_FORMAT = struct.Struct('<5d')  # bid, bid_size, ask, ask_size, timestamp
+RECORD_FORMAT = struct.Struct('<Q5d')  # sequence y valores
+RECORD_DTYPE = numpy.dtype([('sequence', '<u8'), ('bid', '<f8'), ('bid_size', '<f8'), ('ask', '<f8'),
+                            ('ask_size', '<f8'), ('timestamp', '<f8'), ('reserved', 'V16')])
+
+DEFAULT_NAME = 'rofex_quote_board'
+DEFAULT_CAPACITY = 256  # cantidad maxima de instrumentos
+MAX_READ_RETRIES = 1000  # lecturas de un registro que se mezclan con escrituras antes de darlo por no disponible
+
+NAN = float('nan')
+
+shared_memory_lock = threading.Lock()  # creacion y apertura de memoria compartida (ver open_shared_memory)
+
+
+# get_size(capacity)
+# ------------------
+# Devuelve el tamaño en bytes de un quote board con lugar para capacity instrumentos
+def get_size(capacity):
+    return HEADER_SIZE + capacity * (SYMBOL_SIZE + RECORD_SIZE)
+
+
+# open_shared_memory(name)
+# ------------------------
+# Abre una memoria compartida existente sin registrarla en el resource tracker de multiprocessing
+# Antes de Python 3.13 (parametro track), SharedMemory registra toda memoria compartida que se abre, y el resource
+# tracker la elimina al terminar el proceso aunque la haya creado otro proceso: un lector que termina borraria el
+# quote board de todos los demas
+def open_shared_memory(name):
+    with shared_memory_lock:
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                return shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+
+
+class QuoteBoardWriter:
+
+    # Constructor
+    # -----------
+    # Crea el quote board. Si existe uno con el mismo nombre (e.g. de una ejecucion anterior que termino sin
+    # cerrarlo), se reemplaza
+    # name: nombre de la memoria compartida, que usan los lectores para abrirla
+    # capacity: cantidad maxima de instrumentos
+    def __init__(self, name=DEFAULT_NAME, capacity=DEFAULT_CAPACITY):
+        with shared_memory_lock:
+            try:
+                self.memory = shared_memory.SharedMemory(name=name, create=True, size=get_size(capacity))
+            except FileExistsError:
+                stale_memory = shared_memory.SharedMemory(name=name)
+                stale_memory.close()
+                stale_memory.unlink()
+                self.memory = shared_memory.SharedMemory(name=name, create=True, size=get_size(capacity))
+        self.name = name
+        self.capacity = capacity
+        self.buffer = self.memory.buf
+        self.records_offset = HEADER_SIZE + capacity * SYMBOL_SIZE
+        self.slots = dict()  # registro de cada simbolo. Ej: GGAL.BA: 0, GGAL/AGO21: 1
+        self.sequences = []  # ultimo sequence escrito en cada registro
+        self.lock = threading.Lock()  # un solo escritor a la vez (e.g. el poller y el websocket)
+        struct.pack_into(HEADER_FORMAT, self.buffer, 0, MAGIC, capacity, RECORD_SIZE, 0)
+
+    # add(symbol)
+    # -----------
+    # Registra un instrumento y devuelve su numero de registro. Si ya estaba registrado, devuelve el mismo numero
+    # El registro queda sin cotizacion (sequence 0) hasta el primer update
+    # Si el simbolo ocupa mas de SYMBOL_SIZE bytes, se produce ValueError (los lectores no podrian encontrarlo)
+    def add(self, symbol):
+        slot = self.slots.get(symbol)
+        if slot is not None:
+            return slot
+        name = symbol.encode().ljust(SYMBOL_SIZE, b'\0')
+        if len(name) > SYMBOL_SIZE:
+            raise ValueError(f"El simbolo {symbol} supera los {SYMBOL_SIZE} bytes del quote board {self.name}")
+        with self.lock:
+            slot = len(self.sequences)
+            if slot == self.capacity:
+                raise ValueError(f"El quote board {self.name} no tiene lugar para {symbol} (capacidad {self.capacity})")
+            self.buffer[HEADER_SIZE + slot * SYMBOL_SIZE:HEADER_SIZE + (slot + 1) * SYMBOL_SIZE] = name
+            self.sequences.append(0)
+            self.slots[symbol] = slot
+            # La cantidad de instrumentos se publica despues de escribir el simbolo
+            struct.pack_into('<Q', self.buffer, COUNT_OFFSET, slot + 1)
+        return slot
+
+    # update(symbol, bid, ask, bid_size, ask_size, timestamp)
+    # -------------------------------------------------------
+    # Escribe la cotizacion de un instrumento (si no esta registrado, lo registra)
+    # Un precio o cantidad None se guarda como NaN. timestamp: segundos desde epoch (por defecto, time.time())
+    def update(self, symbol, bid, ask, bid_size=None, ask_size=None, timestamp=None):
+        slot = self.slots.get(symbol)
+        if slot is None:
+            slot = self.add(symbol)
+        offset = self.records_offset + slot * RECORD_SIZE
+        values = (NAN if bid is None else bid, NAN if bid_size is None else bid_size, NAN if ask is None else ask,
+                  NAN if ask_size is None else ask_size, time.time() if timestamp is None else timestamp)
+        with self.lock:
+            sequence = self.sequences[slot]
+            SEQUENCE_FORMAT.pack_into(self.buffer, offset, sequence + 1)  # impar: escritura en curso
+            VALUES_FORMAT.pack_into(self.buffer, offset + 8, *values)
+            SEQUENCE_FORMAT.pack_into(self.buffer, offset, sequence + 2)
+            self.sequences[slot] = sequence + 2
+
+    # update_market_data(symbol, market_data)
+    # ---------------------------------------
+    # Escribe el mejor bid y el mejor offer de un mensaje de websocket de ROFEX
+    # Ej: update_market_data("GGAL/AGO21", {'BI': [{'price': 168.1, 'size': 18}], 'OF': [{'price': 168.95, ...}]})
+    def update_market_data(self, symbol, market_data):
+        bids = market_data.get('BI')
+        offers = market_data.get('OF')
+        bid = bids[0] if bids else dict()
+        offer = offers[0] if offers else dict()
+        self.update(symbol, bid=bid.get('price'), ask=offer.get('price'), bid_size=bid.get('size'),
+                    ask_size=offer.get('size'))
+
+    # close()
+    # -------
+    # Cierra y elimina el quote board. Los lectores que ya lo abrieron pueden seguir leyendo los ultimos valores
+    def close(self):
+        self.buffer = None
+        self.memory.close()
+        self.memory.unlink()
+
+
+class QuoteBoardReader:
+
+    # Constructor
+    # -----------
+    # Abre un quote board existente para leerlo
+    # name: nombre con el que lo creo el QuoteBoardWriter
+    # El proceso lector no es dueño de la memoria compartida: al terminar no la elimina
+    def __init__(self, name=DEFAULT_NAME):
+        self.memory = open_shared_memory(name)
+        self.name = name
+        self.buffer = self.memory.buf
+        magic, self.capacity, record_size, count = struct.unpack_from(HEADER_FORMAT, self.buffer, 0)
+        if magic != MAGIC or record_size != RECORD_SIZE:
+            self.memory.close()
+            raise ValueError(f"{name} no es un quote board")
+        self.records_offset = HEADER_SIZE + self.capacity * SYMBOL_SIZE
+        # Vista de NumPy de todos los registros, sin copiarlos (ver column y changed_symbols)
+        self.records = numpy.ndarray(self.capacity, dtype=RECORD_DTYPE, buffer=self.buffer,
+                                     offset=self.records_offset)
+        self.slots = dict()  # registro de cada simbolo
+        self.symbols = []  # simbolo de cada registro
+        self.seen = numpy.zeros(self.capacity, dtype=numpy.uint64)  # sequence de la ultima lectura de changed_symbols
+        self.refresh_symbols()
+
+    # refresh_symbols()
+    # -----------------
+    # Lee de la tabla de simbolos los instrumentos registrados por el escritor desde la ultima lectura
+    def refresh_symbols(self):
+        count = struct.unpack_from('<Q', self.buffer, COUNT_OFFSET)[0]
+        for slot in range(len(self.symbols), count):
+            name = bytes(self.buffer[HEADER_SIZE + slot * SYMBOL_SIZE:HEADER_SIZE + (slot + 1) * SYMBOL_SIZE])
+            symbol = name.rstrip(b'\0').decode()
+            self.symbols.append(symbol)
+            self.slots[symbol] = slot
+
+    # get_slot(symbol)
+    # ----------------
+    # Devuelve el numero de registro de un instrumento, o None si el escritor no lo registro
+    def get_slot(self, symbol):
+        slot = self.slots.get(symbol)
+        if slot is None:
+            self.refresh_symbols()
+            slot = self.slots.get(symbol)
+        return slot
+
+    # read(slot)
+    # ----------
+    # Lee un registro con el seqlock. Devuelve (sequence, bid, bid_size, ask, ask_size, timestamp), o None si el
+    # registro no tiene cotizacion (o si una escritura no termino despues de MAX_READ_RETRIES intentos)
+    def read(self, slot):
+        buffer = self.buffer
+        offset = self.records_offset + slot * RECORD_SIZE
+        for attempt in range(MAX_READ_RETRIES):
+            record = RECORD_FORMAT.unpack_from(buffer, offset)  # sequence se lee antes que los valores
+            sequence = record[0]
+            if sequence & 1:
+                continue
+            if SEQUENCE_FORMAT.unpack_from(buffer, offset)[0] == sequence:
+                return None if sequence == 0 else record
+        return None
+
+    # get_quote(symbol)
+    # -----------------
+    # Devuelve la ultima cotizacion (SpotQuote) de un instrumento, o None si no esta en el quote board o aun no tiene
+    # cotizacion. Un precio NaN se devuelve como None
+    # Tiene la misma interfaz de lectura que SpotQuotePoller: un QuoteBoardReader puede instalarse con
+    # asset.set_spot_quote_poller o como price_source de FinancialAsset y RateWatchList
+    def get_quote(self, symbol):
+        slot = self.slots.get(symbol)
+        if slot is None:
+            slot = self.get_slot(symbol)
+            if slot is None:
+                return None
+        record = self.read(slot)
+        if record is None:
+            return None
+        sequence, bid, bid_size, ask, ask_size, timestamp = record
+        return SpotQuote(bid=None if bid != bid else bid, ask=None if ask != ask else ask, timestamp=timestamp)
+
+    # get_book_top(symbol)
+    # --------------------
+    # Devuelve el mejor bid y el mejor offer de un instrumento: (bid, bid_size, ask, ask_size, timestamp), con NaN en
+    # los lados vacios, o None si no esta en el quote board o aun no tiene cotizacion
+    def get_book_top(self, symbol):
+        slot = self.get_slot(symbol)
+        if slot is None:
+            return None
+        record = self.read(slot)
+        return None if record is None else record[1:]
+
+    # changed_symbols()
+    # -----------------
+    # Devuelve la lista de instrumentos que se actualizaron desde la ultima invocacion (en la primera, todos los que
+    # tienen cotizacion). Compara los sequence de todos los registros en una sola operacion vectorizada
+    def changed_symbols(self):
+        self.refresh_symbols()
+        count = len(self.symbols)
+        sequences = self.records['sequence'][:count].copy()
+        changed = numpy.flatnonzero((sequences != self.seen[:count]) & (sequences != 0))
+        self.seen[:count] = sequences
+        return [self.symbols[slot] for slot in changed]
+
+    # column(name)
+    # ------------
+    # Devuelve un campo de todos los registros como array de NumPy, sin copiarlo. Ej: column('bid')
+    # Los valores no se leen con el seqlock: pueden mezclar cotizaciones de distintas escrituras. Sirve para
+    # monitoreo y analisis, no para operar
+    def column(self, name):
+        self.refresh_symbols()
+        return self.records[name][:len(self.symbols)]
+
+    # close()
+    # -------
+    # Cierra el quote board (no lo elimina)
+    def close(self):
+        self.records = None
+        self.buffer = None
+        self.memory.close()
+
+
+# Test quote_board.py
+if __name__ == "__main__":
+
+    import multiprocessing
+
+    def read_quotes(name, results):
+        reader = QuoteBoardReader(name)
+        torn_reads = 0
+        for i in range(20000):
+            quote = reader.get_quote("GGAL.BA")
+            if quote is not None and round(quote.ask - quote.bid, 6) != 1.9:
+                torn_reads += 1  # bid y ask de cotizaciones distintas
+        results.put(torn_reads)
+        reader.close()
+
+    board = QuoteBoardWriter("quote_board_test", capacity=4)
+    board.update("GGAL.BA", bid=161.5, ask=163.4, timestamp=1624377600.25)
+    board.update_market_data("GGAL/AGO21", {'BI': [{'price': 168.1, 'size': 18}], 'OF': []})
+    reader = QuoteBoardReader("quote_board_test")
+    print(reader.get_quote("GGAL.BA"))  # SpotQuote(bid=161.5, ask=163.4, timestamp=1624377600.25)
+    print(reader.get_book_top("GGAL/AGO21")[:4])  # (168.1, 18.0, nan, nan)
+    print(reader.changed_symbols(), reader.changed_symbols())  # ['GGAL.BA', 'GGAL/AGO21'] []
+    board.update("GGAL/AGO21", bid=168.2, ask=168.95)
+    print(reader.changed_symbols(), reader.column('bid'))  # ['GGAL/AGO21'] [161.5 168.2]
+    try:
+        board.add("X" * (SYMBOL_SIZE + 1))
+    except ValueError as e:
+        print(e)  # El simbolo XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX supera los 32 bytes del quote board quote_board_test
+
+    # Un escritor y dos procesos lectores: ninguna lectura mezcla dos cotizaciones
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=read_quotes, args=("quote_board_test", results)) for i in range(2)]
+    for process in processes:
+        process.start()
+    writes = 0
+    while any(process.is_alive() for process in processes):
+        bid = 150 + writes % 1000 / 100
+        board.update("GGAL.BA", bid=bid, ask=bid + 1.9)
+        writes += 1
+    print([results.get() for process in processes], writes > 0)  # [0, 0] True
+
+    start_time = time.perf_counter()
+    for i in range(100000):
+        reader.get_quote("GGAL.BA")
+    print(f"get_quote: {(time.perf_counter() - start_time) / 100000 * 1e9:.0f} ns")  # get_quote: 1600 ns
+    reader.close()
+    board.close()
@@ -8,14 +8,21 @@
 # implicit_rates(asset, spot_bid_price, spot_ask_price, future_bid_price,
 #                   future_ask_price, days_to_maturity, transaction_cost)
 # calcula e imprime las tasas implicitas
+#
+# implicit_rates_batch(spot_bid_price, spot_ask_price, future_bid_price,
+#                   future_ask_price, days_to_maturity, transaction_cost)
+# calcula las tasas implicitas de muchos pares a la vez (arrays de NumPy), sin imprimir
 
 import csv
+import event_log
+import numpy
 
 # yearly_rates(interest, days)
 # -----------------------------
 # Calcula la tasa nominal anual y la tasa efectiva anual
 # Recibe un interes y una cantidad de dias en el cual se obtiene ese interes
 # Devuelve un objeto de tipo tupla
+# Los parametros tambien pueden ser arrays de NumPy. En ese caso devuelve una tupla de arrays
 #
 # Ejemplo de uso:
 # ---------------
@@ -31,9 +38,69 @@ def yearly_rates(interest, days):
     return nominal_rate, effective_rate
 
 
+# long_interest(spot_ask_price, future_bid_price, transaction_cost)
+# short_interest(spot_bid_price, future_ask_price, transaction_cost)
+# -----------------------------------------------------------------
+# Calculan el interes de la posicion colocadora (comprar el activo y vender el futuro) y de la tomadora (vender en
+# corto el activo y comprar el futuro), sin anualizar. Reciben floats o arrays de NumPy
+def long_interest(spot_ask_price, future_bid_price, transaction_cost):
+    investment = spot_ask_price * (1 + transaction_cost)
+    investment_return = future_bid_price * (1 - transaction_cost)
+    return investment_return / investment - 1
+
+
+def short_interest(spot_bid_price, future_ask_price, transaction_cost):
+    amount_lent = spot_bid_price * (1 - transaction_cost)
+    amount_returned = future_ask_price * (1 + transaction_cost)
+    return amount_returned / amount_lent - 1
+
+
+# implicit_rates_batch(spot_bid_price, spot_ask_price, future_bid_price, future_ask_price,
+#                      days_to_maturity, transaction_cost)
+# ----------------------------------------------------------------------------------------------
+# Calcula las tasas implicitas de muchos pares (activo, futuro) en una sola pasada vectorizada, sin imprimir
+# Los parametros pueden ser arrays de NumPy, listas o escalares (los escalares se aplican a todos los pares)
+# Devuelve una tupla de arrays (nominal_short_rate, nominal_long_rate, effective_short_rate, effective_long_rate)
+# Si falta alguno de los precios que intervienen en una tasa (precio 0), esa tasa es 0
+#
+# Ejemplo de uso:
+# ---------------
+# nominal_short, nominal_long, effective_short, effective_long = implicit_rates_batch(
+#     spot_bid_price=[105, 161.5], spot_ask_price=[113, 163.4], future_bid_price=[115.4, 175.4],
+#     future_ask_price=[119.55, 179.55], days_to_maturity=71, transaction_cost=0.0)
+# print(nominal_long)  # [0.10918609 0.37754064]
+
+def implicit_rates_batch(spot_bid_price, spot_ask_price, future_bid_price, future_ask_price,
+                         days_to_maturity, transaction_cost):
+    spot_bid_price = numpy.asarray(spot_bid_price, dtype=numpy.float64)
+    spot_ask_price = numpy.asarray(spot_ask_price, dtype=numpy.float64)
+    future_bid_price = numpy.asarray(future_bid_price, dtype=numpy.float64)
+    future_ask_price = numpy.asarray(future_ask_price, dtype=numpy.float64)
+    days_to_maturity = numpy.asarray(days_to_maturity, dtype=numpy.float64)
+    transaction_cost = numpy.asarray(transaction_cost, dtype=numpy.float64)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        # Long position: buy the security and sell the future
+        long_valid = (future_bid_price != 0) & (spot_ask_price != 0)
+        nominal_long_rate, effective_long_rate = yearly_rates(
+            long_interest(spot_ask_price, future_bid_price, transaction_cost), days_to_maturity)
+
+        # Short position: short-sell the security and buy the future
+        short_valid = (future_ask_price != 0) & (spot_bid_price != 0)
+        nominal_short_rate, effective_short_rate = yearly_rates(
+            short_interest(spot_bid_price, future_ask_price, transaction_cost), days_to_maturity)
+
+    return (numpy.where(short_valid, nominal_short_rate, 0.0),
+            numpy.where(long_valid, nominal_long_rate, 0.0),
+            numpy.where(short_valid, effective_short_rate, 0.0),
+            numpy.where(long_valid, effective_long_rate, 0.0))
+
+
 # print_implicit_rates(asset, spot_price, bid_price, ask_price, days_to_maturity, transacion_cost)
 # -------------------------------------------------------------------------------
-# Calcula e imprime las tasas implicitas de un activo (accion, divisa, etc)
+# Calcula y registra (ver event_log.py) las tasas implicitas de un activo (accion, divisa, etc)
+# Se invoca en cada evento de market data: el calculo se hace con floats (long_interest y short_interest), sin
+# crear arrays de NumPy. Para muchos pares a la vez, usar implicit_rates_batch
 #
 # Ejemplos de uso:
 # ----------------
@@ -44,26 +111,31 @@ def yearly_rates(interest, days):
 
 def implicit_rates(asset, spot_bid_price, spot_ask_price, future_bid_price, future_ask_price,
                    days_to_maturity, transaction_cost):
-    nominal_short_rate, nominal_long_rate = 0, 0
+    nominal_short_rate = nominal_long_rate = 0.0
+    log_enabled = event_log.is_enabled(event_log.INFO)
 
-    print()
     # Long position: buy the security and sell the future
     if future_bid_price and spot_ask_price:
-        investment = spot_ask_price * (1 + transaction_cost)
-        investment_return = future_bid_price * (1 - transaction_cost)
-        interest = investment_return / investment - 1
-        nominal_long_rate, effective_long_rate = yearly_rates(interest, days_to_maturity)
-        print(f"{asset} Spot ask: ${spot_ask_price} Future bid: ${future_bid_price} Tasa colocadora: "
-              f"TNA {nominal_long_rate:.2%} TEA {effective_long_rate:.2%}")
+        nominal_long_rate, effective_long_rate = yearly_rates(
+            long_interest(spot_ask_price, future_bid_price, transaction_cost), days_to_maturity)
+        if log_enabled:
+            event_log.log(event_log.INFO, "implicit_rate",
+                          "{asset} Spot ask: ${spot_ask_price} Future bid: ${future_bid_price} Tasa colocadora: "
+                          "TNA {nominal_rate:.2%} TEA {effective_rate:.2%}",
+                          asset=asset, side="long", spot_ask_price=spot_ask_price, future_bid_price=future_bid_price,
+                          nominal_rate=nominal_long_rate, effective_rate=effective_long_rate)
 
     # Short position: short-sell the security and buy the future
     if future_ask_price and spot_bid_price:
-        amount_lent = spot_bid_price * (1 - transaction_cost)
-        amount_returned = future_ask_price * (1 + transaction_cost)
-        interest = amount_returned / amount_lent - 1
-        nominal_short_rate, effective_short_rate = yearly_rates(interest, days_to_maturity)
-        print(f"{asset} Spot bid: ${spot_bid_price} Future ask: ${future_ask_price} Tasa tomadora: "
-              f"TNA {nominal_short_rate:.2%} TEA {effective_short_rate:.2%}")
+        nominal_short_rate, effective_short_rate = yearly_rates(
+            short_interest(spot_bid_price, future_ask_price, transaction_cost), days_to_maturity)
+        if log_enabled:
+            event_log.log(event_log.INFO, "implicit_rate",
+                          "{asset} Spot bid: ${spot_bid_price} Future ask: ${future_ask_price} Tasa tomadora: "
+                          "TNA {nominal_rate:.2%} TEA {effective_rate:.2%}",
+                          asset=asset, side="short", spot_bid_price=spot_bid_price,
+                          future_ask_price=future_ask_price,
+                          nominal_rate=nominal_short_rate, effective_rate=effective_short_rate)
 
     return nominal_short_rate, nominal_long_rate
 
@@ -87,6 +159,7 @@ if __name__ == "__main__":
     # PAMP/AGO21 Spot ask: $113 Future bid: $115.4 Tasa colocadora: TNA 10.92% TEA 11.41%
     # PAMP/AGO21 Spot bid: $105 Future ask: $119.55 Tasa tomadora: TNA 71.24% TEA 94.87%
 
+    event_log.flush()  # Escribir las tasas registradas antes de continuar
     print(f"Long rate:{long_rate:.2%} Short rate:{short_rate:.2%} ")
     # Long rate: 10.92% Short rate: 71.24%
 
@@ -126,6 +199,7 @@ if __name__ == "__main__":
                                                                        days_to_maturity=days_to_maturity,
                                                                        transaction_cost=transaction_cost)
 
+                event_log.flush()
                 if abs(nominal_short_rate - test_nominal_short_rate) < MAX_ABSOLUTE_ERROR \
                         and abs(nominal_long_rate - test_nominal_long_rate) < MAX_ABSOLUTE_ERROR:
                     print(test_id, "OK!")
@@ -135,3 +209,20 @@ if __name__ == "__main__":
                     print(f"{nominal_short_rate:.4%} != {test_nominal_short_rate:.4%}")
                     print(f"{nominal_long_rate:.4%} != {test_nominal_long_rate:.4%}")
                     print()
+
+    # Test: implicit_rates_batch con todo el lote de prueba en una sola invocacion
+    with open('interest_rate_test.csv') as csvfile:
+        rows = [row for row in csv.DictReader(csvfile) if row['test_id']]
+
+    def column(name):
+        return numpy.array([float(row[name]) for row in rows])
+
+    nominal_short_rate, nominal_long_rate, effective_short_rate, effective_long_rate = implicit_rates_batch(
+        spot_bid_price=column('spot_bid_price'), spot_ask_price=column('spot_ask_price'),
+        future_bid_price=column('future_bid_price'), future_ask_price=column('future_ask_price'),
+        days_to_maturity=column('days_to_maturity'), transaction_cost=column('transaction_cost'))
+    if numpy.all(numpy.abs(nominal_short_rate - column('test_nominal_short_rate')) < MAX_ABSOLUTE_ERROR) \
+            and numpy.all(numpy.abs(nominal_long_rate - column('test_nominal_long_rate')) < MAX_ABSOLUTE_ERROR):
+        print(f"Lote de {len(rows)} casos (implicit_rates_batch) OK!")  # Lote de 5 casos (implicit_rates_batch) OK!
+    else:
+        print("Error en implicit_rates_batch")
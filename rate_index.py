@@ -0,0 +1,104 @@
+# rate_index.py
+# -------------
+# Este modulo define la clase BestRateIndex
+# BestRateIndex guarda las tasas de un grupo de futuros (e.g. todos los que vencen en la misma fecha) y permite
+# consultar cual es la mejor tasa sin recorrer todo el grupo
+#
+# Internamente usa un heap con borrado diferido: al actualizar la tasa de un futuro se agrega una entrada nueva y
+# la anterior queda obsoleta. Las entradas obsoletas se descartan al consultar la mejor tasa
+#   update: O(log n)
+#   remove: O(1)
+#   best: O(log n) amortizado
+#
+# Si dos futuros tienen la misma tasa, se elige el de menor simbolo en orden alfabetico
+#
+# Ejemplo de uso
+# --------------
+# short_rate = BestRateIndex()  # tasas tomadoras: la mejor es la minima
+# short_rate.update("GGAL/AGO21", 0.18)
+# short_rate.update("PAMP/AGO21", 0.12)
+# print(short_rate.best())  # ('PAMP/AGO21', 0.12)
+
+import heapq
+
+COMPACT_MIN_SIZE = 64  # tamaño minimo del heap a partir del cual se eliminan las entradas obsoletas
+
+
+class BestRateIndex:
+
+    # Constructor
+    # -----------
+    # highest: si es False la mejor tasa es la minima (tasa tomadora). Si es True, es la maxima (tasa colocadora)
+    def __init__(self, highest=False):
+        self.highest = highest
+        self.rates = dict()  # tasa vigente de cada futuro. Ej: GGAL/AGO21: 0.18, PAMP/AGO21: 0.12
+        self.heap = []  # entradas (clave, simbolo). La clave es la tasa, o la tasa negativa si highest es True
+
+    # update(symbol, rate)
+    # --------------------
+    # Agrega un futuro al indice o actualiza su tasa
+    def update(self, symbol, rate):
+        if self.rates.get(symbol) == rate:
+            return
+        self.rates[symbol] = rate
+        heapq.heappush(self.heap, (-rate if self.highest else rate, symbol))
+        if len(self.heap) > COMPACT_MIN_SIZE and len(self.heap) > 2 * len(self.rates):
+            self.compact()
+
+    # remove(symbol)
+    # --------------
+    # Elimina un futuro del indice (e.g. despues de ejecutar una operacion con el)
+    def remove(self, symbol):
+        self.rates.pop(symbol, None)
+
+    # best()
+    # ------
+    # Devuelve una tupla (symbol, rate) con la mejor tasa del indice, o None si el indice esta vacio
+    def best(self):
+        heap = self.heap
+        while heap:
+            key, symbol = heap[0]
+            rate = self.rates.get(symbol)
+            if rate is not None and key == (-rate if self.highest else rate):
+                return symbol, rate
+            heapq.heappop(heap)  # Entrada obsoleta
+        return None
+
+    # compact()
+    # ---------
+    # Reconstruye el heap solo con las entradas vigentes
+    def compact(self):
+        self.heap = [(-rate if self.highest else rate, symbol) for symbol, rate in self.rates.items()]
+        heapq.heapify(self.heap)
+
+    # get(symbol)
+    # -----------
+    # Devuelve la tasa vigente de un futuro, o None si no esta en el indice
+    def get(self, symbol):
+        return self.rates.get(symbol)
+
+    def __contains__(self, symbol):
+        return symbol in self.rates
+
+    def __len__(self):
+        return len(self.rates)
+
+
+# Test rate_index.py
+if __name__ == "__main__":
+
+    long_rate = BestRateIndex(highest=True)  # tasas colocadoras: la mejor es la maxima
+    long_rate.update("GGAL/AGO21", 0.25)
+    long_rate.update("PAMP/AGO21", 0.26)
+    long_rate.update("YPFD/AGO21", 0.43)
+    print(long_rate.best())  # ('YPFD/AGO21', 0.43)
+
+    long_rate.update("YPFD/AGO21", 0.20)
+    print(long_rate.best())  # ('PAMP/AGO21', 0.26)
+
+    long_rate.remove("PAMP/AGO21")
+    print(long_rate.best())  # ('GGAL/AGO21', 0.25)
+
+    # Empate: se elige el menor simbolo
+    long_rate.update("DLR/AGO21", 0.25)
+    print(long_rate.best())  # ('DLR/AGO21', 0.25)
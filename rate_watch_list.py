@@ -6,6 +6,15 @@
 
 
 from asset import *
+from instrument_table import InstrumentTable, NAN, NO_ID
+from order_book import SIDE_BID, SIDE_OFFER
+from order_executor import OrderLeg, MARKET_ROFEX, MARKET_BYMA, ORDER_BUY, ORDER_SELL
+from rate_index import BestRateIndex
+import event_log
+import latency
+import lot_optimizer
+import market_data_recorder
+import numpy
 import rate
 
 class RateWatchList:
@@ -13,16 +22,32 @@ class RateWatchList:
     # Constructor
     # -----------
     # transaction_cost es el porcentaje de comision que hay que pagar para comprar o vender un activo
-    def __init__(self, transaction_cost):
+    # max_slippage es el porcentaje maximo que puede alejarse el precio de un futuro de su mejor precio al operar
+    # varios niveles del libro de ordenes. Con 0 solo se opera la cantidad del mejor precio
+    # price_tolerance es la variacion porcentual minima de un precio para volver a calcular las tasas de un futuro
+    # (ver is_unchanged). Con 0, cualquier variacion de precio provoca un nuevo calculo
+    # lot_objective es el criterio para elegir las cantidades de contratos de cada tasa (ver lot_optimizer.py):
+    # OBJECTIVE_PROFIT (la mayor ganancia) u OBJECTIVE_BALANCE (el flujo neto de hoy mas cercano a 0)
+    # max_imbalance es la diferencia maxima entre los montos invertidos en ambas tasas con OBJECTIVE_PROFIT
+    # (None: el precio de una unidad del subyacente mas caro)
+    def __init__(self, transaction_cost, max_slippage=0.0, price_tolerance=0.0,
+                 lot_objective=lot_optimizer.OBJECTIVE_PROFIT, max_imbalance=None):
         # Crear estructuras de datos vacías
-        self.watch_list = dict()  # simbolos a monitorear. Ej: GGAL/AGO21, PAMP/AGO21, DLR/SEP21
-        self.short_rate = dict()  # tasas tomadoras. Ej: GGAL/AGO21: 11.28%, PAMP/AGO21: 12.35%
-        self.long_rate = dict()  # tasas colocadoras. Ej: GGAL/AGO21: 18.32%, PAMP/AGO21: 19.40%
-        self.short_rate_quantity = dict()  # unidades de tasas tomadoras. Ej:  GGAL/AGO21: 10, PAMP/AGO21: 20
-        self.long_rate_quantity = dict()  # unidades de tasas colocadoras. Ej:  GGAL/AGO21: 15, PAMP/AGO21: 5
-        self.market_bid_price = dict ()  # precios de mercado. Ej: GGAL/AGO21: $168.1, GGAL.BA: $161.5
-        self.market_ask_price = dict()  # precios de mercado. Ej: GGAL/AGO21: $168.95, GGAL.BA: $163.4
+        # Futuros a monitorear y sus subyacentes (e.g. GGAL/AGO21, GGAL.BA, DLR/SEP21, DLR), con sus precios,
+        # cantidades y tasas en columnas indexadas por instrument_id (ver instrument_table.py)
+        self.instruments = InstrumentTable()
+        self.short_rate = []  # tasas tomadoras de cada grupo de vencimiento (BestRateIndex). Ej: GGAL/AGO21: 11.28%
+        self.long_rate = []  # tasas colocadoras de cada grupo de vencimiento (BestRateIndex). Ej: PAMP/AGO21: 19.40%
+        self.future_book = dict()  # libros de ordenes de los futuros. Ej: GGAL/AGO21: <OrderBook>
+        self.last_fingerprint = dict()  # ultimos precios y cantidades procesados. Ej: GGAL/AGO21: (170, 20, 172, ...)
+        self.skipped_ticks = 0  # eventos de market data descartados por no tener cambios
+        self.order_sink = None  # destino de las ordenes (ver set_order_sink). None: ROFEX y BYMA
+        self.price_source = None  # fuente de precios spot de los subyacentes (ver set_price_source)
         self.transaction_cost = transaction_cost
+        self.max_slippage = max_slippage
+        self.price_tolerance = price_tolerance
+        self.lot_objective = lot_objective
+        self.max_imbalance = max_imbalance
 
     # add_watch_pair(future_asset, underlying_asset)
     # ----------------------------------------------
@@ -30,129 +55,409 @@ class RateWatchList:
     # Ej: add_watch_pair(future_asset=PAMP/AGO21, underlying_asset=PAMP.BA)
     # Los parametros future_asset y underlying_asset deben ser objetos de tipo FinancialAsset
     def add_watch_pair(self, future_asset, underlying_asset):
-        watch_pair = dict()
-        watch_pair['future_asset'] = future_asset
-        watch_pair['underlying_asset'] = underlying_asset
-        symbol = future_asset.symbol
-        self.watch_list[symbol] = watch_pair
-        days_to_maturity = future_asset.days_to_maturity
-        # Para cada fecha de expiracion del futuro hay un diccionario distinto
-        # e.g. DLR/AGO21, GGAL/AGO21 y PAMP/AGO21 van a un diccionario
+        instruments = self.instruments
+        if self.price_source is not None:
+            underlying_asset.price_source = self.price_source
+        underlying_id = instruments.add(underlying_asset.symbol, underlying_asset)
+        if future_asset.days_to_maturity < 0:
+            # Un futuro ya vencido queda registrado sin grupo de vencimiento, como despues de roll_day
+            instruments.add(future_asset.symbol, future_asset, underlying_id=underlying_id)
+            return
+        future_id = instruments.add(future_asset.symbol, future_asset, underlying_id=underlying_id,
+                                    days_to_maturity=future_asset.days_to_maturity)
+        # Para cada fecha de expiracion del futuro hay un grupo con sus indices de tasas
+        # e.g. DLR/AGO21, GGAL/AGO21 y PAMP/AGO21 van a un grupo
         # DLR/SEP21, GGAL/SEP21 y PAMP/SEP21 van a otro
-        self.short_rate[days_to_maturity] = dict()
-        self.short_rate_quantity[days_to_maturity] = dict()
-        self.long_rate[days_to_maturity] = dict()
-        self.long_rate_quantity[days_to_maturity] = dict()
+        while len(self.short_rate) <= instruments.group[future_id]:
+            self.short_rate.append(BestRateIndex())  # la mejor tasa tomadora es la minima
+            self.long_rate.append(BestRateIndex(highest=True))  # la mejor tasa colocadora es la maxima
 
     # get_watch_symbols()
     # -------------------
     # Devuelve la lista de futuros a monitorear
     # Se usa para suscribirse a market data de esta lista de futuros
     def get_watch_symbols(self):
-        watch_symbols = self.watch_list.keys()
+        instruments = self.instruments
+        watch_symbols = [instruments.symbols[future_id] for future_id in instruments.get_futures()]
         return watch_symbols
 
+    # get_underlying_assets()
+    # ------------------------
+    # Devuelve la lista de activos subyacentes de la watch list, sin repetidos
+    # Se usa para mantener actualizados los precios spot (ver spot_quote_poller.py)
+    def get_underlying_assets(self):
+        instruments = self.instruments
+        underlying_ids = dict.fromkeys(instruments.underlying[future_id] for future_id in instruments.get_futures())
+        return [instruments.assets[underlying_id] for underlying_id in underlying_ids]
+
+    # get_spot_quotes()
+    # -----------------
+    # Consulta en lote los precios spot de todos los subyacentes de la watch list
+    # Devuelve un diccionario symbol -> (bid, ask). Ej: {'GGAL.BA': (161.5, 163.4), 'DLR': (94.71, 100.71)}
+    def get_spot_quotes(self):
+        return FinancialAsset.fetch_bid_ask_many(self.get_underlying_assets())
+
     # get_underlying_asset()
     # -----------------
     # Dado el ticker de un futuro, devuelve el activo subyacente
     def get_underlying_asset(self, future_symbol):
-        underlying_asset = self.watch_list[future_symbol]['underlying_asset']
+        instruments = self.instruments
+        underlying_id = instruments.underlying[instruments.ids[future_symbol]]
+        if underlying_id == NO_ID:
+            raise KeyError(future_symbol)
+        underlying_asset = instruments.assets[underlying_id]
         return underlying_asset
 
+    # get_future_asset(future_symbol)
+    # -------------------------------
+    # Dado el ticker de un futuro, devuelve el futuro (FinancialAsset)
+    def get_future_asset(self, future_symbol):
+        instruments = self.instruments
+        future_id = instruments.ids[future_symbol]
+        if instruments.group[future_id] == NO_ID:
+            raise KeyError(future_symbol)
+        return instruments.assets[future_id]
+
+    # get_expired_symbols()
+    # ---------------------
+    # Devuelve la lista de futuros que vencieron desde que se agregaron a la watch list (ver roll_day)
+    # Se usa para dejar de recibir su market data
+    def get_expired_symbols(self):
+        instruments = self.instruments
+        return [instruments.symbols[future_id] for future_id in instruments.get_expired()]
+
+    # Indica si un futuro esta en la watch list (los futuros vencidos no estan). Ej: "GGAL/AGO21" in watch_list
+    def __contains__(self, future_symbol):
+        future_id = self.instruments.ids.get(future_symbol)
+        return future_id is not None and self.instruments.group[future_id] != NO_ID
+
+    # get_future_quantity(future_symbol, side, top_quantity, top_price)
+    # ------------------------------------------------------------------
+    # Devuelve la cantidad de un futuro que puede operarse y el monto correspondiente (quantity, amount)
+    # side: SIDE_BID para vender el futuro, SIDE_OFFER para comprarlo
+    # Si hay libro de ordenes y max_slippage > 0, se suman los niveles que no superan max_slippage y el monto se calcula
+    # a precio promedio (VWAP). Si no, se usa la cantidad y el precio del mejor nivel
+    def get_future_quantity(self, future_symbol, side, top_quantity, top_price):
+        order_book = self.future_book.get(future_symbol)
+        if order_book is None or self.max_slippage <= 0:
+            return top_quantity, top_price * top_quantity
+        quantity = order_book.quantity_for_slippage(side, self.max_slippage)
+        if quantity <= top_quantity:
+            return top_quantity, top_price * top_quantity
+        vwap_price, filled_quantity, limit_price = order_book.vwap(side, quantity)
+        return int(filled_quantity), vwap_price * filled_quantity
+
+    # get_future_amounts(future_symbol, side, max_quantity, top_price)
+    # ----------------------------------------------------------------
+    # Devuelve un vector con el monto de operar 0, 1, 2, ... max_quantity unidades de un futuro (ver lot_optimizer.py)
+    # Si hay libro de ordenes y max_slippage > 0, cada unidad se opera al precio de su nivel del libro. Si no, todas
+    # se operan al mejor precio
+    def get_future_amounts(self, future_symbol, side, max_quantity, top_price):
+        order_book = self.future_book.get(future_symbol)
+        if order_book is None or self.max_slippage <= 0 or order_book.levels[side] == 0:
+            return lot_optimizer.future_amounts([top_price], [max_quantity], max_quantity)
+        levels = order_book.levels[side]
+        return lot_optimizer.future_amounts(order_book.prices[side][:levels], order_book.sizes[side][:levels],
+                                            max_quantity)
+
+    # get_future_execution_price(future_symbol, side, quantity, top_price)
+    # ---------------------------------------------------------------------
+    # Devuelve el precio promedio (VWAP) y el precio limite de operar <quantity> unidades de un futuro
+    # (vwap_price, limit_price). Si no hay libro de ordenes o max_slippage es 0, ambos son el mejor precio
+    def get_future_execution_price(self, future_symbol, side, quantity, top_price):
+        order_book = self.future_book.get(future_symbol)
+        if order_book is None or self.max_slippage <= 0:
+            return top_price, top_price
+        vwap_price, filled_quantity, limit_price = order_book.vwap(side, quantity)
+        if filled_quantity < quantity or vwap_price == 0:
+            return top_price, top_price
+        return vwap_price, limit_price
+
+    # is_unchanged(future_symbol, fingerprint)
+    # ----------------------------------------
+    # Indica si un evento de market data no cambia nada de lo que se uso para calcular las tasas de un futuro
+    # fingerprint es una tupla (future_bid_price, future_bid_size, future_ask_price, future_ask_size, spot_version)
+    # spot_version es el timestamp de la cotizacion spot en memoria (poller, quote board) o, si no la hay, la tupla
+    # (spot_bid_price, spot_ask_price)
+    # Las cantidades y la version spot deben ser iguales. Los precios del futuro pueden variar hasta price_tolerance
+    # (e.g. 0.0005 = 0.05%)
+    def is_unchanged(self, future_symbol, fingerprint):
+        last_fingerprint = self.last_fingerprint.get(future_symbol)
+        if last_fingerprint is None:
+            return False
+        if last_fingerprint == fingerprint:
+            return True
+        if not self.price_tolerance:
+            return False
+        if last_fingerprint[1] != fingerprint[1] or last_fingerprint[3] != fingerprint[3] \
+                or last_fingerprint[4] != fingerprint[4]:
+            return False  # Cambiaron las cantidades o la cotizacion spot
+        for index in (0, 2):
+            last_price = last_fingerprint[index]
+            price = fingerprint[index]
+            if not last_price or abs(price - last_price) > abs(last_price) * self.price_tolerance:
+                return False
+        return True
+
+    # set_order_sink(order_sink)
+    # --------------------------
+    # Define el destino de las ordenes de arbitraje. order_sink es un objeto con el metodo
+    # send_order(market, side, ticker, quantity, price) (e.g. OrderCaptureSink de replay.py) y, opcionalmente,
+    # send_orders(legs) para enviar todas las patas de una operacion juntas (e.g. OrderExecutor de order_executor.py)
+    # Con order_sink=None las ordenes se envian a ROFEX (rofex.buy/sell) y BYMA (byma.buy/sell), una por una
+    def set_order_sink(self, order_sink):
+        self.order_sink = order_sink
+
+    # set_price_source(price_source)
+    # ------------------------------
+    # Define la fuente de precios spot de los subyacentes de la watch list (FinancialAsset.price_source), tambien los
+    # que se agreguen despues. price_source es un objeto con el metodo get_quote(symbol) (e.g. SpotQuotePoller,
+    # RecordedQuoteSource de replay.py). A diferencia de asset.set_spot_quote_poller, solo afecta a esta watch list
+    # Con price_source=None los subyacentes vuelven a usar el poller de precios spot o a consultar dolarsi y Yahoo Finance
+    def set_price_source(self, price_source):
+        self.price_source = price_source
+        for underlying_asset in self.get_underlying_assets():
+            underlying_asset.price_source = price_source
+
+    # send_order(market, side, ticker, quantity, price)
+    # -------------------------------------------------
+    # Envia una orden al destino de ordenes
+    # market: MARKET_ROFEX o MARKET_BYMA. side: ORDER_BUY u ORDER_SELL
+    def send_order(self, market, side, ticker, quantity, price):
+        if self.order_sink is not None:
+            self.order_sink.send_order(market, side, ticker, quantity, price)
+            return
+        exchange = rofex if market == MARKET_ROFEX else byma
+        if side == ORDER_BUY:
+            exchange.buy(ticker=ticker, quantity=quantity, price=price)
+        else:
+            exchange.sell(ticker=ticker, quantity=quantity, price=price)
+
+    # send_orders(legs)
+    # -----------------
+    # Envia las patas (OrderLeg) de una operacion al destino de ordenes. Si el destino no envia varias patas juntas,
+    # se envian una por una
+    def send_orders(self, legs):
+        send_orders = getattr(self.order_sink, 'send_orders', None)
+        if send_orders is not None:
+            send_orders(legs)
+            return
+        for leg in legs:
+            self.send_order(leg.market, leg.side, leg.ticker, leg.quantity, leg.price)
+
+    # recompute_rates()
+    # -----------------
+    # Vuelve a calcular las tasas de todos los futuros con los ultimos precios guardados en la tabla de instrumentos,
+    # en una sola pasada vectorizada (ver rate.implicit_rates_batch), y actualiza los indices de tasas
+    # Se usa cuando cambia algo comun a muchos futuros (e.g. los dias al vencimiento o los precios spot). No busca
+    # oportunidades de arbitraje: eso ocurre con el proximo evento de market data
+    # Los futuros sin precios (e.g. aun sin market data, o con un lado ya operado) conservan su tasa anterior
+    # Devuelve la cantidad de tasas actualizadas
+    def recompute_rates(self):
+        instruments = self.instruments
+        future_ids = numpy.array(instruments.get_futures(), dtype=numpy.intp)
+        if not len(future_ids):
+            return 0
+        bid_price = instruments.column('bid_price')
+        ask_price = instruments.column('ask_price')
+        underlying_ids = instruments.column('underlying')[future_ids]
+        groups = instruments.column('group')[future_ids]
+        nominal_short_rate, nominal_long_rate, effective_short_rate, effective_long_rate = rate.implicit_rates_batch(
+            spot_bid_price=bid_price[underlying_ids], spot_ask_price=ask_price[underlying_ids],
+            future_bid_price=bid_price[future_ids], future_ask_price=ask_price[future_ids],
+            days_to_maturity=numpy.asarray(instruments.group_days)[groups], transaction_cost=self.transaction_cost)
+        updated = 0
+        for column, rate_index, rates in (('short_rate', self.short_rate, nominal_short_rate),
+                                          ('long_rate', self.long_rate, nominal_long_rate)):
+            valid = ~numpy.isnan(rates)
+            instruments.column(column)[future_ids[valid]] = rates[valid]
+            for future_id, group, future_rate in zip(future_ids[valid].tolist(), groups[valid].tolist(),
+                                                     rates[valid].tolist()):
+                rate_index[group].update(instruments.symbols[future_id], future_rate)
+            updated += int(valid.sum())
+        return updated
+
+    # roll_day(current_date)
+    # ----------------------
+    # Actualiza la watch list despues de un cambio de dia (ver day_rollover.py):
+    #   vuelve a calcular los dias al vencimiento de todos los futuros en una sola pasada (refresh_days_to_maturity)
+    #   rearma los grupos de vencimiento y sus indices de tasas
+    #   vuelve a calcular las tasas con los ultimos precios y los nuevos dias al vencimiento (recompute_rates)
+    # Los futuros vencidos salen de la watch list (ver InstrumentTable.expire): quedan sin precios, tasas ni grupo, y
+    # search_rate_arbitrage descarta sus eventos de market data (ver get_expired_symbols)
+    # current_date es opcional (por defecto, today())
+    # Devuelve la cantidad de futuros cuyos dias al vencimiento cambiaron
+    def roll_day(self, current_date=None):
+        instruments = self.instruments
+        future_ids = instruments.get_futures()
+        changed = refresh_days_to_maturity([instruments.assets[future_id] for future_id in future_ids], current_date)
+        for future_id in future_ids:
+            if instruments.assets[future_id].days_to_maturity < 0:
+                instruments.expire(future_id)
+                self.future_book.pop(instruments.symbols[future_id], None)
+        instruments.regroup()
+        self.short_rate = [BestRateIndex() for days_to_maturity in instruments.group_days]
+        self.long_rate = [BestRateIndex(highest=True) for days_to_maturity in instruments.group_days]
+        self.last_fingerprint.clear()
+        self.recompute_rates()
+        return changed
+
     # search_rate_arbitrage(future_symbol, future_bid_price, future_bid_size,
-    #                               future_ask_price, future_ask_size)
+    #                               future_ask_price, future_ask_size, spot_bid_price, spot_ask_price, future_book)
     #
     # Calcula las tasas tomadoras y colocadoras
     # Chequea si hay alguna oportunidad de arbitraje de tasas
     # Recibe un evento de market data (e.g. GGAL/AGO21 bid=$170 x 20 unidades, ask=$172 x 10 unidades)
-    # La funcion busca los precios spot para el activo subyacente
+    # La funcion busca los precios spot para el activo subyacente, salvo que se reciban en los parametros opcionales
+    # spot_bid_price y spot_ask_price (e.g. si ya se consultaron en forma asincronica)
+    # future_book es un parametro opcional con el libro de ordenes (OrderBook) del futuro. Si se recibe, las
+    # operaciones se dimensionan con los niveles del libro que no superan max_slippage
+    # received_time es un parametro opcional con el momento de llegada del mensaje de market data (latency.now()).
+    # Si se recibe, se mide la latencia desde la llegada del mensaje hasta el envio de las ordenes (ver latency.py)
     def search_rate_arbitrage(self, future_symbol, future_bid_price, future_bid_size,
-                              future_ask_price, future_ask_size):
+                              future_ask_price, future_ask_size, spot_bid_price=None, spot_ask_price=None,
+                              future_book=None, received_time=None):
+        start_time = latency.now()
+        if future_book is not None:
+            self.future_book[future_symbol] = future_book
 
         # Calcula las tasas implícitas para el evento de market data recibido
-        underlying_asset = self.get_underlying_asset(future_symbol)
+        instruments = self.instruments
+        future_id = instruments.ids[future_symbol]
+        future_asset = instruments.assets[future_id]
+        if future_asset.days_to_maturity < 0:
+            return  # Futuro vencido (ver roll_day): no tiene grupo de vencimiento ni tasas
+        underlying_id = instruments.underlying[future_id]
+        underlying_asset = instruments.assets[underlying_id]
         underlying_asset_symbol = underlying_asset.symbol
-        spot_ask_price = underlying_asset.ask_price()
-        spot_bid_price = underlying_asset.bid_price()
-        future_asset = self.watch_list[future_symbol]['future_asset']
-        days_to_maturity = future_asset.days_to_maturity
+        spot_quote = None
+        if spot_ask_price is None or spot_bid_price is None:
+            # Cotizacion del poller, del quote board o de la fuente de precios: se lee sin consultar la red
+            spot_quote = underlying_asset.cached_quote()
+            if spot_quote is None:
+                # Sin cotizacion en memoria hay que consultar los precios para saber si cambiaron
+                if spot_ask_price is None:
+                    spot_ask_price = underlying_asset.ask_price()
+                if spot_bid_price is None:
+                    spot_bid_price = underlying_asset.bid_price()
+                start_time = latency.record(latency.STAGE_SPOT_FETCH, start_time)
+
+        # Si no cambio ningun precio ni cantidad del futuro ni la cotizacion spot desde el ultimo evento de este
+        # futuro, las tasas son las mismas. La cotizacion spot se compara por su version (timestamp), antes de leer
+        # sus precios
+        spot_version = (spot_bid_price, spot_ask_price) if spot_quote is None else spot_quote.timestamp
+        fingerprint = (future_bid_price, future_bid_size, future_ask_price, future_ask_size, spot_version)
+        if self.is_unchanged(future_symbol, fingerprint):
+            self.skipped_ticks += 1
+            return
+        self.last_fingerprint[future_symbol] = fingerprint
+        if spot_quote is not None:
+            if spot_ask_price is None:
+                spot_ask_price = spot_quote.ask
+            if spot_bid_price is None:
+                spot_bid_price = spot_quote.bid
+            start_time = latency.record(latency.STAGE_SPOT_FETCH, start_time)
+        market_data_recorder.record_spot_quote(underlying_asset_symbol, spot_bid_price, spot_ask_price)
+        group = instruments.group[future_id]
+        days_to_maturity = instruments.group_days[group]
         nominal_short_rate, nominal_long_rate = rate.implicit_rates(
             asset=future_symbol, spot_ask_price=spot_ask_price, spot_bid_price=spot_bid_price,
             future_bid_price=future_bid_price, future_ask_price=future_ask_price,
             days_to_maturity=days_to_maturity, transaction_cost=self.transaction_cost)
 
-        # Actualiza las listas de tasas y cantidades
-        self.short_rate[days_to_maturity][future_symbol] = nominal_short_rate
-        self.short_rate_quantity[days_to_maturity][future_symbol] = future_ask_size
-        self.long_rate[days_to_maturity][future_symbol] = nominal_long_rate
-        self.long_rate_quantity[days_to_maturity][future_symbol] = future_bid_size
+        # Actualiza los indices de tasas del grupo de vencimiento
+        self.short_rate[group].update(future_symbol, nominal_short_rate)
+        self.long_rate[group].update(future_symbol, nominal_long_rate)
 
-        # Actualiza precios de mercado
-        self.market_bid_price[future_symbol] = future_bid_price
-        self.market_ask_price[future_symbol] = future_ask_price
-        self.market_bid_price[underlying_asset_symbol] = spot_bid_price
-        self.market_ask_price[underlying_asset_symbol] = spot_ask_price
+        # Actualiza tasas, precios de mercado y cantidades en la tabla de instrumentos
+        # Un precio spot faltante (None o 0) se guarda como NaN
+        instruments.short_rate[future_id] = nominal_short_rate
+        instruments.long_rate[future_id] = nominal_long_rate
+        instruments.set_quote(future_id, future_bid_price, future_bid_size, future_ask_price, future_ask_size)
+        instruments.bid_price[underlying_id] = spot_bid_price or NAN
+        instruments.ask_price[underlying_id] = spot_ask_price or NAN
+        start_time = latency.record(latency.STAGE_RATES, start_time)
 
-        # Toma las listas de futuros que tienen la misma madurez que el actual
+        # Toma los indices de tasas de los futuros que tienen la misma madurez que el actual
         # Esto es para evitar hacer arbitraje de tasas con dos futuros de distinta madurez (e.g. DLR/AGO21 y PAMP/SEP21)
-        current_short_rate = self.short_rate[days_to_maturity]
-        current_long_rate = self.long_rate[days_to_maturity]
-        current_short_rate_quantity = self.short_rate_quantity[days_to_maturity]
-        current_long_rate_quantity = self.long_rate_quantity[days_to_maturity]
+        current_short_rate = self.short_rate[group]
+        current_long_rate = self.long_rate[group]
 
-        # Busca la mejor tasa tomadora (la minima) y mejor tasa colocadora (la maxima)
-        best_short_rate = min(current_short_rate.values())  # e.g. 18%
-        best_long_rate = max(current_long_rate.values())  # e.g. 24%
-
-        # Identifica el simbolo correspondiente a la mejor tasa tomadora y colocadora
-        best_short_future = [future for future in current_short_rate
-                             if current_short_rate[future] == best_short_rate][0]  # e.g. GGAL/AGO21 es la que tiene 18%
-        best_long_future = [future for future in current_long_rate
-                            if current_long_rate[future] == best_long_rate][0]  # e.g. PAMP/AGO21 esla que tiene 24%
+        # Busca la mejor tasa tomadora (la minima) y mejor tasa colocadora (la maxima), y el simbolo correspondiente
+        # Los indices devuelven la mejor tasa sin recorrer todos los futuros. Si hay empate, se elige el menor simbolo
+        best_short_future, best_short_rate = current_short_rate.best()  # e.g. GGAL/AGO21 es la que tiene 18%
+        best_long_future, best_long_rate = current_long_rate.best()  # e.g. PAMP/AGO21 es la que tiene 24%
+        best_short_id = instruments.ids[best_short_future]
+        best_long_id = instruments.ids[best_long_future]
+        start_time = latency.record(latency.STAGE_BEST_RATE, start_time)
 
         # Busca las cantidades y precios subastados de los futuros con mejores tasas
-        best_short_quantity = current_short_rate_quantity[best_short_future]
-        best_short_investment = self.market_ask_price[best_short_future] * best_short_quantity
-        best_long_quantity = current_long_rate_quantity[best_long_future]
-        best_long_investment = self.market_bid_price[best_long_future] * best_long_quantity
-
-        # Imprime los datos de las mejores tasas colocadora y tomadora
-        print(f"Mejor tasa colocadora a {days_to_maturity} dias: {best_long_rate:.2%} ({best_long_future}, "
-              f"{best_long_quantity} unidades, ${best_long_investment:.2f}) ")
-        print(f"Mejor tasa tomadora a {days_to_maturity} dias: {best_short_rate:.2%} ({best_short_future}, "
-              f"{best_short_quantity} unidades, ${best_short_investment:.2f}) ")
+        # Si hay libro de ordenes, la cantidad incluye los niveles que no superan max_slippage
+        best_short_quantity, best_short_investment = self.get_future_quantity(
+            best_short_future, SIDE_OFFER, int(instruments.ask_size[best_short_id]),
+            instruments.ask_price[best_short_id])
+        best_long_quantity, best_long_investment = self.get_future_quantity(
+            best_long_future, SIDE_BID, int(instruments.bid_size[best_long_id]), instruments.bid_price[best_long_id])
+
+        # Registra los datos de las mejores tasas colocadora y tomadora (ver event_log.py)
+        if event_log.is_enabled(event_log.INFO):
+            event_log.log(event_log.INFO, "best_rates",
+                          "Mejor tasa colocadora a {days_to_maturity} dias: {best_long_rate:.2%} ({best_long_future}, "
+                          "{best_long_quantity} unidades, ${best_long_investment:.2f})\n"
+                          "Mejor tasa tomadora a {days_to_maturity} dias: {best_short_rate:.2%} ({best_short_future}, "
+                          "{best_short_quantity} unidades, ${best_short_investment:.2f})",
+                          days_to_maturity=days_to_maturity,
+                          best_long_rate=best_long_rate, best_long_future=best_long_future,
+                          best_long_quantity=best_long_quantity, best_long_investment=best_long_investment,
+                          best_short_rate=best_short_rate, best_short_future=best_short_future,
+                          best_short_quantity=best_short_quantity, best_short_investment=best_short_investment)
 
         if nominal_long_rate > best_short_rate or nominal_short_rate < best_long_rate:
             # Hay una oportunidad de arbitraje de tasas
 
             # Tasa colocadora: comprar el subyacente y vender el futuro
             long_rate_sell_asset = best_long_future
-            long_rate_buy_asset = self.get_underlying_asset(best_long_future).symbol
-            long_rate_sell_price = self.market_bid_price[long_rate_sell_asset]
-            long_rate_buy_price = self.market_ask_price[long_rate_buy_asset]
-            long_rate_max_amount = best_long_investment
+            long_rate_buy_id = instruments.underlying[best_long_id]
+            long_rate_buy_asset = instruments.symbols[long_rate_buy_id]
+            long_rate_sell_price = instruments.bid_price[best_long_id]
+            long_rate_buy_price = instruments.ask_price[long_rate_buy_id]
 
             # Tasa tomadora: comprar el futuro del evento y vender en corto el subyacente
             short_rate_buy_asset = best_short_future
-            short_rate_sell_asset = self.get_underlying_asset(best_short_future).symbol
-            short_rate_buy_price = self.market_ask_price[short_rate_buy_asset]
-            short_rate_sell_price = self.market_bid_price[short_rate_sell_asset]
-            short_rate_max_amount = best_short_investment
-
-            # Monto a invertir: minimo entre el que se puede colocar y el que se puede tomar
-            max_investment_amount = min(long_rate_max_amount, short_rate_max_amount)
+            short_rate_sell_id = instruments.underlying[best_short_id]
+            short_rate_sell_asset = instruments.symbols[short_rate_sell_id]
+            short_rate_buy_price = instruments.ask_price[best_short_id]
+            short_rate_sell_price = instruments.bid_price[short_rate_sell_id]
 
             # Cantidad de contratos a operar en cada tasa
-            # Solo se pueden operar numeros enteros.
-            long_rate_quantity = max_investment_amount // long_rate_buy_price
-            short_rate_quantity = max_investment_amount // short_rate_sell_price
+            # Solo se pueden operar numeros enteros. Dividir el mismo monto por el precio de cada subyacente puede dejar
+            # una operacion que no es rentable, por lo que se buscan las cantidades enteras (hasta las disponibles en
+            # el libro de ordenes) que mejor cumplen el objetivo lot_objective
+            lot_sizing = lot_optimizer.optimize_lots(
+                long_spot_price=long_rate_buy_price,
+                long_future_amounts=self.get_future_amounts(long_rate_sell_asset, SIDE_BID, best_long_quantity,
+                                                            long_rate_sell_price),
+                short_spot_price=short_rate_sell_price,
+                short_future_amounts=self.get_future_amounts(short_rate_buy_asset, SIDE_OFFER, best_short_quantity,
+                                                             short_rate_buy_price),
+                transaction_cost=self.transaction_cost, objective=self.lot_objective,
+                max_imbalance=self.max_imbalance)
+            if lot_sizing is None:
+                event_log.log(event_log.WARNING, "arbitrage_cancelled",
+                              "Ninguna cantidad entera de contratos hace rentable la operacion "
+                              "({long_rate_sell_asset}, {short_rate_buy_asset}). Cancelar operacion.",
+                              long_rate_sell_asset=long_rate_sell_asset, short_rate_buy_asset=short_rate_buy_asset)
+                latency.record(latency.STAGE_SIZING, start_time)
+                return
+            long_rate_quantity = lot_sizing.long_quantity
+            short_rate_quantity = lot_sizing.short_quantity
 
-            # Si el monto maximo es muy pequeño, la cantidad puede ser cero.
-            # Probar si la operacion es rentable con una unidad
-            if long_rate_quantity == 0:
-                long_rate_quantity = 1
-            if short_rate_quantity == 0:
-                short_rate_quantity == 1
+            # Precio de los futuros: promedio de los niveles del libro que se operan (VWAP) para calcular los flujos,
+            # y peor nivel alcanzado como precio limite de la orden
+            long_rate_sell_price, long_rate_sell_limit_price = self.get_future_execution_price(
+                long_rate_sell_asset, SIDE_BID, long_rate_quantity, long_rate_sell_price)
+            short_rate_buy_price, short_rate_buy_limit_price = self.get_future_execution_price(
+                short_rate_buy_asset, SIDE_OFFER, short_rate_quantity, short_rate_buy_price)
 
             # Inversion, retorno y ganancia de la operacion
             # Los montos positivos son ingresos de efectivo, los negativos son egresos
@@ -166,23 +471,32 @@ class RateWatchList:
             total_return = long_rate_return + short_rate_return
             total_profit = total_investment + total_return
 
-            # Mostrar en pantalla datos de la operacion
-            print()
-            print("Oportunidad de arbitraje de tasas!")
-            print("Tasa colocadora")
-            print(f"Comprar {long_rate_buy_asset}: {long_rate_quantity:.0f} x ${long_rate_buy_price:.2f} "
-                  f"= ${long_rate_investment:.2f} (incl. costos)")
-            print(f"Vender {long_rate_sell_asset}: {long_rate_quantity:.0f} x ${long_rate_sell_price:.2f} "
-                  f"= ${long_rate_return:.2f} (incl. costos)")
-            print("Tasa tomadora")
-            print(f"Vender {short_rate_sell_asset}: {short_rate_quantity:.0f} x ${short_rate_sell_price:.2f} "
-                  f"= ${short_rate_investment:.2f} (incl. costos)")
-            print(f"Comprar {short_rate_buy_asset}: {short_rate_quantity:.0f} x ${short_rate_buy_price:.2f} "
-                  f"= ${short_rate_return:.2f} (incl. costos)")
-            today_string = datetime.date.today().strftime("%d-%b-%Y")  # Convierte las fechas a formato dd-mmm-yyyy
-            maturity_date_string = future_asset.maturity_date.strftime("%d-%b-%Y")
-            print(f"Flujos netos: ${total_investment:.2f} ({today_string}) "
-                  f"${total_return:.2f} ({maturity_date_string})")
+            # Registrar los datos de la operacion
+            # Las fechas se muestran con formato dd-mmm-yyyy
+            event_log.log(event_log.INFO, "arbitrage_opportunity",
+                          "\nOportunidad de arbitraje de tasas!\n"
+                          "Tasa colocadora\n"
+                          "Comprar {long_rate_buy_asset}: {long_rate_quantity:.0f} x ${long_rate_buy_price:.2f} "
+                          "= ${long_rate_investment:.2f} (incl. costos)\n"
+                          "Vender {long_rate_sell_asset}: {long_rate_quantity:.0f} x ${long_rate_sell_price:.2f} "
+                          "= ${long_rate_return:.2f} (incl. costos)\n"
+                          "Tasa tomadora\n"
+                          "Vender {short_rate_sell_asset}: {short_rate_quantity:.0f} x ${short_rate_sell_price:.2f} "
+                          "= ${short_rate_investment:.2f} (incl. costos)\n"
+                          "Comprar {short_rate_buy_asset}: {short_rate_quantity:.0f} x ${short_rate_buy_price:.2f} "
+                          "= ${short_rate_return:.2f} (incl. costos)\n"
+                          "Flujos netos: ${total_investment:.2f} ({today:%d-%b-%Y}) "
+                          "${total_return:.2f} ({maturity_date:%d-%b-%Y})",
+                          long_rate_buy_asset=long_rate_buy_asset, long_rate_sell_asset=long_rate_sell_asset,
+                          long_rate_quantity=long_rate_quantity, long_rate_buy_price=long_rate_buy_price,
+                          long_rate_sell_price=long_rate_sell_price, long_rate_investment=long_rate_investment,
+                          long_rate_return=long_rate_return,
+                          short_rate_sell_asset=short_rate_sell_asset, short_rate_buy_asset=short_rate_buy_asset,
+                          short_rate_quantity=short_rate_quantity, short_rate_sell_price=short_rate_sell_price,
+                          short_rate_buy_price=short_rate_buy_price, short_rate_investment=short_rate_investment,
+                          short_rate_return=short_rate_return,
+                          total_investment=total_investment, total_return=total_return,
+                          today=today(), maturity_date=future_asset.maturity_date)
 
             # Según sean los signos de los flujos, hay 3 escenarios posibles:
             # 1- Ganancia hoy y ganancia al fin del proyecto
@@ -190,49 +504,55 @@ class RateWatchList:
             # 3- Invertir hoy para recuperar un monto mayor al vencimiento (el mas comun)
             if total_investment >= 0 and total_return >= 0:
                 # Caso 1- Ganancia hoy y ganancia al fin del proyecto
-                print(f"Ganancia neta: ${total_investment:.2f} al inicio + "
-                      f"${total_return:.2f} en la fecha de vencimiento ")
+                event_log.log(event_log.INFO, "arbitrage_profit",
+                              "Ganancia neta: ${total_investment:.2f} al inicio + "
+                              "${total_return:.2f} en la fecha de vencimiento\n",
+                              total_investment=total_investment, total_return=total_return)
             elif total_investment >= 0:
                 # Caso 2- Obtener una rentabilidad hoy y contar con fondos a tasa 0%
                 zero_rate_funds = abs(total_return)  # total_return es negativo
-                print(f"Ganancia neta: ${total_profit:.2f} al inicio + ${zero_rate_funds:.2f} "
-                      f"a tasa 0% por {days_to_maturity} dias")
+                event_log.log(event_log.INFO, "arbitrage_profit",
+                              "Ganancia neta: ${total_profit:.2f} al inicio + ${zero_rate_funds:.2f} "
+                              "a tasa 0% por {days_to_maturity} dias\n",
+                              total_profit=total_profit, zero_rate_funds=zero_rate_funds,
+                              days_to_maturity=days_to_maturity)
             else:
                 # Caso 3- Invertir hoy para recuperar un monto mayor al vencimiento
                 interest = abs(total_profit / total_investment)
                 tna, tea = rate.yearly_rates(interest=interest, days=days_to_maturity)
-                print(f"Ganancia neta: ${total_profit:.2f} ({days_to_maturity} dias) TNA {tna:.2%}")
-            print()
-
-            # Controlar que la operacion sea rentable. Si se ejecuta esta parte del código, debería serlo.
-            # Pero dado que solo pueden operarse cantidades enteras de contratos, si el margen es chico y la diferencia
-            # en montos a invertir en tasa colocadora y tomadora es grande, la operacion podría no ser rentable
-            # Mejora: buscar una cantidad entera distinta que haga la operacion rentable
-            if total_profit < 0:
-                print("Error. La operacion no es rentable. Cancelar operacion.")
-                return
+                event_log.log(event_log.INFO, "arbitrage_profit",
+                              "Ganancia neta: ${total_profit:.2f} ({days_to_maturity} dias) TNA {tna:.2%}\n",
+                              total_profit=total_profit, days_to_maturity=days_to_maturity, tna=tna)
 
-            # Eliminar los activos usados para no generar una nueva orden sobre estos mismos instrumentos
-            self.short_rate[days_to_maturity].pop(best_short_future)
-            self.long_rate[days_to_maturity].pop(best_long_future)
-            self.short_rate_quantity[days_to_maturity].pop(best_short_future)
-            self.long_rate_quantity[days_to_maturity].pop(best_long_future)
-            self.market_bid_price.pop(short_rate_sell_asset)
-            self.market_bid_price.pop(long_rate_sell_asset)
-            self.market_ask_price.pop(short_rate_buy_asset)
-            self.market_ask_price.pop(long_rate_buy_asset)
+            start_time = latency.record(latency.STAGE_SIZING, start_time)
 
-            # Tasa colocadora: vender el futuro
-            rofex.sell(ticker=long_rate_sell_asset, quantity=long_rate_quantity, price=long_rate_sell_price)
-
-            # Tasa colocadora: comprar el subyacente
-            byma.buy(ticker=long_rate_buy_asset, quantity=long_rate_quantity, price=long_rate_buy_price)
-
-            # Tasa tomadora: comprar el futuro
-            rofex.buy(ticker=short_rate_buy_asset, quantity=short_rate_quantity, price=short_rate_buy_price)
-
-            # Tasa tomadora: vender en corto el subyacente
-            byma.sell(ticker=short_rate_sell_asset, quantity=short_rate_quantity, price=short_rate_sell_price)
+            # Eliminar los activos usados para no generar una nueva orden sobre estos mismos instrumentos
+            current_short_rate.remove(best_short_future)
+            current_long_rate.remove(best_long_future)
+            instruments.short_rate[best_short_id] = instruments.ask_price[best_short_id] = NAN
+            instruments.ask_size[best_short_id] = NAN
+            instruments.long_rate[best_long_id] = instruments.bid_price[best_long_id] = NAN
+            instruments.bid_size[best_long_id] = NAN
+            # Los precios spot de los subyacentes se conservan: otros futuros del mismo subyacente los siguen usando
+            # El proximo evento de estos futuros debe volver a calcular sus tasas aunque no cambien los precios
+            self.last_fingerprint.pop(best_short_future, None)
+            self.last_fingerprint.pop(best_long_future, None)
+
+            # Enviar las 4 patas. Con un OrderExecutor como destino de ordenes, se envian en forma concurrente
+            self.send_orders([
+                # Tasa colocadora: vender el futuro
+                OrderLeg(MARKET_ROFEX, ORDER_SELL, long_rate_sell_asset, long_rate_quantity,
+                         long_rate_sell_limit_price),
+                # Tasa colocadora: comprar el subyacente
+                OrderLeg(MARKET_BYMA, ORDER_BUY, long_rate_buy_asset, long_rate_quantity, long_rate_buy_price),
+                # Tasa tomadora: comprar el futuro
+                OrderLeg(MARKET_ROFEX, ORDER_BUY, short_rate_buy_asset, short_rate_quantity,
+                         short_rate_buy_limit_price),
+                # Tasa tomadora: vender en corto el subyacente
+                OrderLeg(MARKET_BYMA, ORDER_SELL, short_rate_sell_asset, short_rate_quantity,
+                         short_rate_sell_price)])
+            latency.record(latency.STAGE_DISPATCH, start_time)
+            latency.record(latency.STAGE_TICK_TO_ORDER, received_time)
 
 
 
@@ -298,14 +618,20 @@ if __name__ == "__main__":
     # Mejor tasa colocadora a 70 dias: 43.55% (YPFD/AGO21, 7 unidades, $6447.00)
     # Mejor tasa tomadora a 70 dias: 35.31% (DLR/AGO21, 400 unidades, $40488.00)
     #
-    # Colocar tasa
+    # Oportunidad de arbitraje de tasas!
+    # Tasa colocadora
     # Comprar YPFD.BA: 7 x $850.00 = $-5950.00 (incl. costos)
     # Vender YPFD/AGO21: 7 x $921.00 = $6447.00 (incl. costos)
-    # Tomar tasa
-    # Vender DLR: 68 x $94.80 = $6446.40 (incl. costos)
-    # Comprar DLR/AGO21: 68 x $101.22 = $-6882.96 (incl. costos)
-    # Flujos netos: $496.40 (2021-06-22) $-435.96 (2021-08-31)
-    # Ganancia neta: $60.44 (70 dias)
+    # Tasa tomadora
+    # Vender DLR: 54 x $94.80 = $5119.20 (incl. costos)
+    # Comprar DLR/AGO21: 54 x $101.22 = $-5465.88 (incl. costos)
+    # Flujos netos: $-830.80 (22-Jun-2021) $981.12 (31-Aug-2021)
+    # Ganancia neta: $150.32 (70 dias) TNA 94.34%
+    #
+    # Orden de venta: 7 unidades YPFD/AGO21 a $921.00
+    # Orden de compra: 7 unidades de YPFD.BA a $850.00
+    # Orden de compra: 54 unidades de DLR/AGO21 a $101.22
+    # Orden de venta: 54 unidades DLR a $94.80
 
 
     print()
@@ -327,3 +653,28 @@ if __name__ == "__main__":
     # GGAL/AGO21 Spot bid: $160.3 Future ask: $168.95 Tasa tomadora: TNA 28.14% TEA 31.53%
     # Mejor tasa colocadora a 70 dias: 26.10% (PAMP/AGO21, 10 unidades, $1154.00)
     # Mejor tasa tomadora a 70 dias: 28.14% (GGAL/AGO21, 14 unidades, $2365.30)
+
+    # Futuros vencidos: despues del cambio de dia del 31-08-2021 al 01-09-2021, los futuros AGO21 salen de la watch
+    # list y sus eventos de market data se descartan
+    class TestClock:
+        def __init__(self, date):
+            self.date = date
+
+        def today(self):
+            return self.date
+
+    print()
+    clock = TestClock(datetime.date(2021, 8, 31))
+    set_clock(clock)
+    rate_watch_list = RateWatchList(transaction_cost=0.000)
+    for future_symbol, underlying_symbol in (("DLR/AGO21", "DLR"), ("DLR/SEP21", "DLR")):
+        rate_watch_list.add_watch_pair(future_asset=FinancialAsset(symbol=future_symbol, asset_type=ASSET_TYPE_FUTURE),
+                                       underlying_asset=FinancialAsset(symbol=underlying_symbol,
+                                                                       asset_type=ASSET_TYPE_CURRENCY))
+    clock.date = datetime.date(2021, 9, 1)
+    print(rate_watch_list.roll_day(clock.date), rate_watch_list.get_expired_symbols(),
+          rate_watch_list.instruments.group_days)  # 2 ['DLR/AGO21'] [29]
+    rate_watch_list.search_rate_arbitrage(future_symbol='DLR/AGO21', future_bid_price=101.1, future_bid_size=100,
+                                          future_ask_price=101.22, future_ask_size=400,
+                                          spot_bid_price=94.8, spot_ask_price=100.8)  # (no imprime nada)
+    print("DLR/AGO21" in rate_watch_list, rate_watch_list.get_watch_symbols())  # False ['DLR/SEP21']
@@ -0,0 +1,237 @@
+# replay.py
+# ---------
+# Reproduce un dia de market data grabado con market_data_recorder.py a traves de RateWatchList.search_rate_arbitrage,
+# tan rapido como lo permita el procesador
+#
+# Durante la reproduccion:
+#   la fecha actual la da un reloj simulado (SimulatedClock) que avanza con los timestamps grabados
+#   los precios spot los da una tabla con los precios grabados (RecordedQuoteSource), en lugar de Yahoo Finance o
+#   dolarsi
+#   las ordenes se guardan en una lista (OrderCaptureSink), en lugar de enviarse a ROFEX y BYMA
+# Con los mismos datos, dos reproducciones dan exactamente las mismas ordenes. Sirve para comparar cambios en la
+# estrategia
+#
+# Ejemplo de uso
+# --------------
+# engine = ReplayEngine("market_data/market_data_20210622.bin")
+# watch_list = RateWatchList(transaction_cost=0.001)
+# engine.build_watch_list(watch_list)
+# print(engine.run(watch_list))  # {'future_ticks': 48211, 'spot_quotes': 48190, 'skipped_ticks': 21, 'orders': 8, ...}
+# for order in engine.order_sink.orders:
+#     print(order)  # Order(timestamp=..., market='ROFEX', side='sell', ticker='PAMP/AGO21', quantity=16, price=115.0)
+#
+# Desde la linea de comandos (con el registro de eventos en modo silencioso):
+# python replay.py market_data/market_data_20210622.bin 0.001
+
+import collections
+import datetime
+import time
+import asset
+import market_data_recorder
+from spot_quote_poller import SpotQuote
+from watch_list_discovery import build_watch_list
+
+# Orden capturada durante una reproduccion
+Order = collections.namedtuple('Order', ['timestamp', 'market', 'side', 'ticker', 'quantity', 'price'])
+
+
+class SimulatedClock:
+
+    # Constructor
+    # -----------
+    # timestamp: momento actual en nanosegundos desde 1970 (como los timestamps de market_data_recorder.py)
+    def __init__(self, timestamp=0):
+        self.timestamp = timestamp
+
+    # set(timestamp)
+    # --------------
+    # Avanza el reloj al momento timestamp
+    def set(self, timestamp):
+        self.timestamp = timestamp
+
+    # time()
+    # ------
+    # Devuelve el momento actual en segundos desde 1970 (como time.time())
+    def time(self):
+        return self.timestamp / 1e9
+
+    # today()
+    # -------
+    # Devuelve la fecha actual (como datetime.date.today())
+    def today(self):
+        return datetime.date.fromtimestamp(self.timestamp / 1e9)
+
+
+class RecordedQuoteSource:
+
+    # Constructor
+    # -----------
+    # Tabla de precios spot grabados. Tiene la misma interfaz de lectura que SpotQuotePoller (get_quote), por lo que
+    # se instala como fuente de precios de los subyacentes (RateWatchList.set_price_source)
+    def __init__(self):
+        self.quotes = dict()  # ultima cotizacion grabada de cada activo. Ej: GGAL.BA: SpotQuote(161.5, 163.4, ...)
+
+    # update(symbol, bid_price, ask_price, timestamp)
+    # -----------------------------------------------
+    # Registra la cotizacion grabada de un activo. timestamp en nanosegundos
+    def update(self, symbol, bid_price, ask_price, timestamp):
+        self.quotes[symbol] = SpotQuote(bid=bid_price, ask=ask_price, timestamp=timestamp / 1e9)
+
+    # get_quote(symbol)
+    # -----------------
+    # Devuelve la ultima cotizacion grabada (SpotQuote) de un activo, o None si aun no hay cotizacion
+    def get_quote(self, symbol):
+        return self.quotes.get(symbol)
+
+
+class OrderCaptureSink:
+
+    # Constructor
+    # -----------
+    # Destino de ordenes que solo las guarda (ver RateWatchList.set_order_sink)
+    # clock: reloj con el que se registra el momento de cada orden
+    def __init__(self, clock):
+        self.clock = clock
+        self.orders = []
+
+    # send_order(market, side, ticker, quantity, price)
+    # -------------------------------------------------
+    # Guarda una orden
+    def send_order(self, market, side, ticker, quantity, price):
+        self.orders.append(Order(timestamp=self.clock.timestamp, market=market, side=side, ticker=ticker,
+                                 quantity=quantity, price=price))
+
+
+class ReplayEngine:
+
+    # Constructor
+    # -----------
+    # path: archivo grabado con market_data_recorder.py
+    def __init__(self, path):
+        self.path = path
+        self.clock = SimulatedClock()
+        self.quote_source = RecordedQuoteSource()
+        self.order_sink = OrderCaptureSink(self.clock)
+
+    # build_watch_list(watch_list, underlying_map)
+    # --------------------------------------------
+    # Agrega a watch_list los futuros grabados que tengan subyacente en underlying_map (ver watch_list_discovery.py)
+    # Los dias al vencimiento se calculan con la fecha del primer registro grabado
+    # Devuelve la cantidad de pares agregados
+    def build_watch_list(self, watch_list, underlying_map=None):
+        symbols = dict()  # futuros grabados, en orden de aparicion
+        with market_data_recorder.MarketDataReader(self.path) as reader:
+            for timestamp, symbol, kind, bid_price, bid_size, ask_price, ask_size in reader:
+                if not symbols and not self.clock.timestamp:
+                    self.clock.set(timestamp)
+                if kind == market_data_recorder.RECORD_FUTURE:
+                    symbols[symbol] = True
+        previous_clock = asset.clock
+        asset.set_clock(self.clock)
+        try:
+            return build_watch_list(watch_list, list(symbols), underlying_map)
+        finally:
+            asset.set_clock(previous_clock)
+
+    # run(watch_list)
+    # ---------------
+    # Reproduce todos los registros grabados a traves de watch_list.search_rate_arbitrage
+    # Los precios spot grabados despues de un mensaje de un futuro son los que se usaron al procesarlo, por lo que se
+    # aplican antes de reproducir ese mensaje
+    # Los mensajes de futuros que no estan en la watch list, con un lado del libro vacio o cuyo subyacente aun no
+    # tiene precio grabado, se descartan
+    # Devuelve un diccionario con la cantidad de registros reproducidos, mensajes descartados, ordenes y duracion
+    def run(self, watch_list):
+        stats = {'future_ticks': 0, 'spot_quotes': 0, 'skipped_ticks': 0, 'orders': 0, 'elapsed_time': 0.0}
+        previous_clock = asset.clock
+        previous_price_source = watch_list.price_source
+        asset.set_clock(self.clock)
+        watch_list.set_price_source(self.quote_source)
+        watch_list.set_order_sink(self.order_sink)
+        orders = len(self.order_sink.orders)
+        start_time = time.perf_counter()
+        try:
+            with market_data_recorder.MarketDataReader(self.path) as reader:
+                pending_tick = None
+                for record in reader:
+                    timestamp, symbol, kind, bid_price, bid_size, ask_price, ask_size = record
+                    if kind == market_data_recorder.RECORD_SPOT:
+                        self.quote_source.update(symbol, bid_price, ask_price, timestamp)
+                        stats['spot_quotes'] += 1
+                        continue
+                    if pending_tick is not None:
+                        self.process_tick(watch_list, pending_tick, stats)
+                    pending_tick = record
+                if pending_tick is not None:
+                    self.process_tick(watch_list, pending_tick, stats)
+        finally:
+            watch_list.set_order_sink(None)
+            watch_list.set_price_source(previous_price_source)
+            asset.set_clock(previous_clock)
+        stats['orders'] = len(self.order_sink.orders) - orders
+        stats['elapsed_time'] = time.perf_counter() - start_time
+        return stats
+
+    # process_tick(watch_list, record, stats)
+    # ---------------------------------------
+    # Reproduce un mensaje grabado de un futuro
+    def process_tick(self, watch_list, record, stats):
+        timestamp, symbol, kind, bid_price, bid_size, ask_price, ask_size = record
+        stats['future_ticks'] += 1
+        if symbol not in watch_list or bid_price != bid_price or ask_price != ask_price:  # NaN: sin precio
+            stats['skipped_ticks'] += 1
+            return
+        if self.quote_source.get_quote(watch_list.get_underlying_asset(symbol).symbol) is None:
+            stats['skipped_ticks'] += 1
+            return
+        self.clock.set(timestamp)
+        watch_list.search_rate_arbitrage(future_symbol=symbol,
+                                         future_bid_price=bid_price, future_bid_size=int(bid_size),
+                                         future_ask_price=ask_price, future_ask_size=int(ask_size))
+
+
+# Test replay.py
+if __name__ == "__main__":
+
+    import sys
+    import event_log
+    from rate_watch_list import RateWatchList
+
+    if len(sys.argv) > 1:
+        event_log.configure(level=event_log.WARNING, console=False)
+        engine = ReplayEngine(sys.argv[1])
+        watch_list = RateWatchList(transaction_cost=float(sys.argv[2]) if len(sys.argv) > 2 else 0.0)
+        print(f"{engine.build_watch_list(watch_list)} futuros")
+        print(engine.run(watch_list))
+        for order in engine.order_sink.orders:
+            print(order)
+        sys.exit()
+
+    # Grabar un dia sintetico y reproducirlo dos veces
+    import tempfile
+
+    event_log.configure(level=event_log.WARNING, console=False)
+    recorder = market_data_recorder.MarketDataRecorder(tempfile.mkdtemp())
+    timestamp = int(datetime.datetime(2021, 6, 22, 11).timestamp() * 1e9)
+    for i in range(10000):
+        timestamp += 1000000  # 1 ms
+        if i % 2:
+            recorder.record(market_data_recorder.RECORD_FUTURE, "GGAL/AGO21", 175.4, 10, 179.55, 10, timestamp)
+            recorder.record(market_data_recorder.RECORD_SPOT, "GGAL.BA", 161.5, 0, 163.4, 0, timestamp)
+        else:
+            recorder.record(market_data_recorder.RECORD_FUTURE, "PAMP/AGO21", 115.4 + (i % 7) * 0.1, 30, 119.55, 15,
+                            timestamp)
+            recorder.record(market_data_recorder.RECORD_SPOT, "PAMP.BA", 105, 0, 113 - (i % 5) * 0.5, 0, timestamp)
+    recorder.close()
+
+    results = []
+    for run in range(2):
+        engine = ReplayEngine(recorder.path)
+        watch_list = RateWatchList(transaction_cost=-0.01)
+        engine.build_watch_list(watch_list)
+        stats = engine.run(watch_list)
+        results.append(engine.order_sink.orders)
+        print(stats['future_ticks'], stats['orders'], f"{stats['elapsed_time']:.2f} s")  # 10000 20000 0.50 s
+    print(results[0] == results[1])  # True
+    print(results[0][0])
+    # Order(timestamp=1624359600002000000, market='ROFEX', side='sell', ticker='GGAL/AGO21', quantity=10, price=175.4)
@@ -5,6 +5,8 @@
 
 import pyRofex
 import configparser
+import event_log
+from order_book import OrderBook
 
 # Antes de invocar a cualquier funcion, es preciso conectarse a ROFEX con user, pass y account
 # pyrofex_setup_done es True si la conexion ya fue establecida
@@ -72,6 +74,98 @@ def get_symbol_list():
     return symbol_list
 
 
+# Cache de market data
+# --------------------
+# Ultimo libro de ordenes (bids y offers) recibido por websocket para cada futuro suscripto
+# main.market_data_handler lo actualiza con update_market_data() en cada evento de market data.
+# get_bid_price, get_ask_price y get_bid_ask responden desde el cache, sin consultar a ROFEX
+market_data_cache = dict()  # Ej: GGAL/AGO21: {'BI': [{'price': 170.5, 'size': 20}], 'OF': [...]}
+order_books = dict()  # libro de ordenes con todos los niveles recibidos. Ej: GGAL/AGO21: <OrderBook>
+subscribed_symbols = set()  # futuros suscriptos a market data por websocket
+market_data_depth = 1  # cantidad de niveles de precios pedidos en la suscripcion
+
+
+# market_data_subscription(tickers, entries, depth)
+# -------------------------------------------------
+# Suscribe una lista de futuros a market data por websocket y los registra como suscriptos
+# depth: cantidad de niveles de precios (bids y offers) que envia ROFEX en cada mensaje
+def market_data_subscription(tickers, entries, depth=1):
+    global market_data_depth
+    tickers = list(tickers)
+    market_data_depth = depth
+    pyRofex.market_data_subscription(tickers=tickers, entries=entries, depth=depth)
+    subscribed_symbols.update(tickers)
+
+
+# market_data_unsubscription(tickers)
+# -----------------------------------
+# Deja de usar el market data de una lista de futuros (e.g. futuros vencidos): los saca de los suscriptos y borra su
+# cache de precios y su libro de ordenes. pyRofex no permite cancelar una suscripcion, por lo que el websocket puede
+# seguir enviando mensajes de estos futuros: quien los recibe debe descartarlos (ver main.market_data_handler)
+def market_data_unsubscription(tickers):
+    for ticker in tickers:
+        subscribed_symbols.discard(ticker)
+        market_data_cache.pop(ticker, None)
+        order_books.pop(ticker, None)
+
+
+# update_market_data(message)
+# ---------------------------
+# Actualiza el cache de market data y el libro de ordenes con un mensaje recibido por websocket
+# Devuelve el libro de ordenes del futuro. Se actualiza en el lugar con cada mensaje: para usarlo fuera del thread
+# del websocket, hay que tomar una copia (OrderBook.snapshot)
+def update_market_data(message):
+    symbol = message['instrumentId']['symbol']
+    market_data = message['marketData']
+    market_data_cache[symbol] = market_data
+    order_book = order_books.get(symbol)
+    if order_book is None:
+        order_book = OrderBook(symbol, depth=max(market_data_depth, 1))
+        order_books[symbol] = order_book
+    order_book.update(market_data)
+    return order_book
+
+
+# get_order_book(ticker)
+# ----------------------
+# Devuelve el libro de ordenes (OrderBook) de un futuro suscripto, o None si aun no se recibio market data
+# El libro se actualiza en el lugar en el thread del websocket (ver update_market_data)
+def get_order_book(ticker):
+    return order_books.get(ticker)
+
+
+# get_market_data(ticker)
+# -----------------------
+# Devuelve el market data (bids y offers) de un activo y un string con el resultado de ejecucion
+# Si el activo tiene market data en el cache, no se consulta a ROFEX. Si no, se hace una unica consulta REST con
+# bids y offers. Si el activo esta suscripto pero todavia no llego ningun mensaje, el resultado se guarda en el cache
+def get_market_data(ticker):
+    market_data = market_data_cache.get(ticker)
+    if market_data is not None:
+        return market_data, "OK!"
+
+    initialize()
+    market_data_response = pyRofex.get_market_data(ticker=ticker,
+                                                   entries=[pyRofex.MarketDataEntry.BIDS,
+                                                            pyRofex.MarketDataEntry.OFFERS])
+    if market_data_response['status'] != 'OK':
+        return None, "Error. Verifique que exista el ticker " + ticker
+    market_data = market_data_response['marketData']
+    if ticker in subscribed_symbols:
+        market_data_cache.setdefault(ticker, market_data)
+    return market_data, "OK!"
+
+
+# get_best_price(market_data, entry)
+# ----------------------------------
+# Devuelve el mejor precio de un lado del libro ('BI' u 'OF'), o None si ese lado esta vacio
+def get_best_price(market_data, entry):
+    try:
+        return market_data[entry][0]['price']
+    except (IndexError, KeyError, TypeError):
+        return None
+
+
 # get_bid_price(ticker)
 # ---------------------
 # Devuelve el mayor precio de subasta actual de un activo que cotiza en ROFEX y un string con el resultado de ejecucion
@@ -81,18 +175,13 @@ def get_symbol_list():
 #     if bid_price:
 #         print(f"{symbol} bid price: ${bid_price}")
 def get_bid_price(ticker):
-    initialize()
-    get_market_data = pyRofex.get_market_data(ticker=ticker,
-                                              entries=[pyRofex.MarketDataEntry.BIDS])
-    try:
-        if get_market_data['status'] != 'OK':
-            return 0, "Error. Verifique que exista el ticker " + ticker
-        else:
-            bid_price = get_market_data['marketData']['BI'][0]['price']
-            return bid_price, "OK!"
-
-    except IndexError:
+    market_data, status = get_market_data(ticker)
+    if market_data is None:
+        return 0, status
+    bid_price = get_best_price(market_data, 'BI')
+    if bid_price is None:
         return 0, "No hay precios de mercado para el ticker " + ticker
+    return bid_price, "OK!"
 
 
 # get_ask_price(ticker)
@@ -104,34 +193,45 @@ def get_bid_price(ticker):
 #     if ask_price:
 #         print(f"{symbol} ask price: ${ask_price}")
 def get_ask_price(ticker):
-    initialize()
-    get_market_data = pyRofex.get_market_data(ticker=ticker,
-                                              entries=[pyRofex.MarketDataEntry.OFFERS])
-    try:
-        if get_market_data['status'] != 'OK':
-            return 0, "Error. Verifique que exista el ticker " + ticker
-        else:
-            ask_price = get_market_data['marketData']['OF'][0]['price']
-            return ask_price, "OK!"
-
-    except IndexError:
+    market_data, status = get_market_data(ticker)
+    if market_data is None:
+        return 0, status
+    ask_price = get_best_price(market_data, 'OF')
+    if ask_price is None:
         return 0, "No hay precios de mercado para el ticker " + ticker
+    return ask_price, "OK!"
+
+
+# get_bid_ask(ticker)
+# -------------------
+# Devuelve el mayor precio de subasta y el menor precio de compra de un activo que cotiza en ROFEX con una sola
+# consulta. Si un lado del libro esta vacio, su precio es 0
+#
+# Ejemplo de uso:
+#     bid_price, ask_price = get_bid_ask(symbol)
+def get_bid_ask(ticker):
+    market_data, status = get_market_data(ticker)
+    if market_data is None:
+        return 0, 0
+    return get_best_price(market_data, 'BI') or 0, get_best_price(market_data, 'OF') or 0
 
 
 # buy(ticker, quantity, price)
 # ----------------------------
 # Compra <quantity> unidades del instrumento <ticker> al precio <price>
-# Funcion no implementada aun. Solo imprime el pedido
+# Funcion no implementada aun. Solo registra el pedido (ver event_log.py)
 def buy(ticker, quantity, price):
-    print(f"Orden de compra: {quantity:.0f} unidades de {ticker} a ${price:.2f}")
+    event_log.log(event_log.INFO, "order", "Orden de compra: {quantity:.0f} unidades de {ticker} a ${price:.2f}",
+                  market="ROFEX", side="buy", ticker=ticker, quantity=quantity, price=price)
 
 
 # sell(ticker, quantity, price)
 # ----------------------------
 # Vende <quantity> unidades del instrumento <ticker> al precio <price>
-# Funcion no implementada aun. Solo imprime el pedido
+# Funcion no implementada aun. Solo registra el pedido (ver event_log.py)
 def sell(ticker, quantity, price):
-    print(f"Orden de venta: {quantity:.0f} unidades {ticker} a ${price:.2f}")
+    event_log.log(event_log.INFO, "order", "Orden de venta: {quantity:.0f} unidades {ticker} a ${price:.2f}",
+                  market="ROFEX", side="sell", ticker=ticker, quantity=quantity, price=price)
 
 
 # Test rofex.py
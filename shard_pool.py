@@ -0,0 +1,440 @@
+# shard_pool.py
+# -------------
+# Este modulo define la clase ShardPool
+# RateWatchList solo compara futuros con los mismos dias al vencimiento, por lo que cada grupo de vencimiento es
+# independiente de los demas. ShardPool reparte los grupos de vencimiento de una watch list entre varios procesos de
+# trabajo (shards). Los grupos se identifican por su fecha de vencimiento, que no cambia con el cambio de dia
+# Cada proceso tiene su propia RateWatchList con los futuros de sus grupos y busca oportunidades de arbitraje en su
+# propio nucleo, sin competir por el GIL con los demas
+#
+# El proceso principal (dispatcher) recibe el market data del websocket de ROFEX y, en dispatch, envia cada mensaje
+# al proceso de su futuro junto con los precios spot del subyacente (leidos del poller de precios spot del
+# dispatcher), por lo que los procesos de trabajo no consultan Yahoo Finance ni dolarsi ni se conectan a ROFEX:
+# las ordenes que generan vuelven al dispatcher, que las envia con su propio destino de ordenes (e.g. OrderExecutor)
+# Los mensajes de futuros cuyo subyacente todavia no tiene precio spot en el poller se descartan (unquoted): el
+# thread del websocket no consulta precios por la red
+#
+# Cada proceso lleva sus estadisticas: mensajes procesados, mensajes por segundo, tiempo ocupado, ordenes y un
+# histograma de latencias (latency.LatencyHistogram) desde la llegada del mensaje al dispatcher hasta el final de su
+# procesamiento en el shard (incluye el pasaje entre procesos)
+#
+# Los procesos se crean con el metodo spawn (un interprete nuevo): el dispatcher ya tiene threads corriendo
+# (websocket, poller, registro de eventos) y hacer fork de un proceso con threads puede dejar locks tomados
+#
+# Ejemplo de uso
+# --------------
+# pool = ShardPool(watch_list, workers=4)  # despues de armar la watch list
+# pool.start()
+# pool.dispatch(message, latency.now())  # desde market_data_handler
+# print(pool.report())
+#   shard  groups  futures      ticks  ticks/s   busy   orders  p50 (us)  p99 (us)  max (us)
+#       0       3        9      12034      401   2.1%        2     105.3     380.1    1203.7
+#       ...
+# pool.stop()
+
+import itertools
+import multiprocessing
+import threading
+import time
+import event_log
+import latency
+from order_book import OrderBook, DEFAULT_DEPTH
+from order_executor import OrderLeg
+
+DEFAULT_WORKERS = 2
+DEFAULT_REQUEST_TIMEOUT = 10.0  # segundos maximos de espera de las respuestas de los shards a un comando
+
+# Mensajes entre el dispatcher y los shards
+MESSAGE_TICK = 0  # dispatcher -> shard: (MESSAGE_TICK, symbol, market_data, spot_bid, spot_ask, received_time)
+MESSAGE_COMMAND = 1  # dispatcher -> shard: (MESSAGE_COMMAND, request_id, command, args)
+MESSAGE_REPLY = 2  # shard -> dispatcher: (MESSAGE_REPLY, shard, request_id, value)
+MESSAGE_ORDERS = 3  # shard -> dispatcher: (MESSAGE_ORDERS, shard, legs)
+
+# Comandos
+COMMAND_STATS = 'stats'  # devuelve las estadisticas del shard
+COMMAND_ROLL_DAY = 'roll_day'  # actualiza los dias al vencimiento (RateWatchList.roll_day). Devuelve los cambios
+COMMAND_STOP = 'stop'  # devuelve las estadisticas del shard y termina el proceso
+
+
+# assign_groups(group_sizes, workers)
+# -----------------------------------
+# Reparte los grupos de vencimiento entre los shards, de modo que todos tengan una cantidad parecida de futuros:
+# cada grupo, del mas grande al mas chico, va al shard con menos futuros
+# group_sizes: diccionario fecha de vencimiento -> cantidad de futuros. Ej: {date(2021, 8, 31): 3, ...}
+# Devuelve un diccionario fecha de vencimiento -> shard. Ej: {date(2021, 8, 31): 0, ...}
+def assign_groups(group_sizes, workers):
+    loads = [0] * workers
+    assignment = dict()
+    for maturity_date in sorted(group_sizes, key=lambda maturity_date: (-group_sizes[maturity_date], maturity_date)):
+        shard = loads.index(min(loads))
+        assignment[maturity_date] = shard
+        loads[shard] += group_sizes[maturity_date]
+    return assignment
+
+
+class ShardStats:
+
+    # Constructor
+    # -----------
+    # Estadisticas de procesamiento de un shard
+    def __init__(self):
+        self.ticks = 0  # mensajes procesados
+        self.busy_time = 0  # tiempo de procesamiento, en nanosegundos
+        self.first_time = None  # llegada del primer mensaje procesado (latency.now())
+        self.last_time = None  # fin del procesamiento del ultimo mensaje
+        self.histogram = latency.LatencyHistogram()  # llegada al dispatcher -> fin del procesamiento
+
+    # record(received_time, start_time, end_time)
+    # -------------------------------------------
+    # Registra un mensaje procesado entre start_time y end_time, que llego al dispatcher en received_time
+    def record(self, received_time, start_time, end_time):
+        self.ticks += 1
+        self.busy_time += end_time - start_time
+        if self.first_time is None:
+            self.first_time = received_time
+        self.last_time = end_time
+        self.histogram.record(end_time - received_time)
+
+    # to_dict()
+    # ---------
+    # Devuelve las estadisticas como diccionario (latencias en microsegundos)
+    def to_dict(self):
+        elapsed_time = (self.last_time - self.first_time) / 1e9 if self.ticks > 1 else 0.0
+        return {'ticks': self.ticks,
+                'ticks_per_second': self.ticks / elapsed_time if elapsed_time > 0 else 0.0,
+                'busy': self.busy_time / 1e9 / elapsed_time if elapsed_time > 0 else 0.0,
+                'p50_us': self.histogram.percentile(50) / 1000,
+                'p99_us': self.histogram.percentile(99) / 1000,
+                'max_us': self.histogram.max / 1000}
+
+
+class ShardOrderSink:
+
+    # Constructor
+    # -----------
+    # Destino de ordenes de la RateWatchList de un shard: envia las patas de cada operacion al dispatcher
+    def __init__(self, shard, results):
+        self.shard = shard
+        self.results = results
+        self.orders = 0  # operaciones enviadas
+
+    def send_orders(self, legs):
+        self.orders += 1
+        self.results.put((MESSAGE_ORDERS, self.shard, list(legs)))
+
+    def send_order(self, market, side, ticker, quantity, price):
+        self.send_orders([OrderLeg(market, side, ticker, quantity, price)])
+
+
+# run_shard(shard, pairs, watch_list_params, book_depth, log_config, ticks, results)
+# ---------------------------------------------------------------------------------
+# Cuerpo de un proceso de trabajo. Arma su RateWatchList con los pares (futuro, subyacente) de sus grupos de
+# vencimiento y procesa los mensajes del dispatcher hasta recibir COMMAND_STOP
+# pairs: lista de (future_symbol, maturity_date, underlying_symbol, underlying_type)
+def run_shard(shard, pairs, watch_list_params, book_depth, log_config, ticks, results):
+    from rate_watch_list import RateWatchList, FinancialAsset, ASSET_TYPE_FUTURE
+
+    path, level, console = log_config
+    event_log.configure(path=f"{path}.shard{shard}" if path else None, level=level, console=console)
+    watch_list = RateWatchList(**watch_list_params)
+    for future_symbol, maturity_date, underlying_symbol, underlying_type in pairs:
+        watch_list.add_watch_pair(future_asset=FinancialAsset(future_symbol, ASSET_TYPE_FUTURE, maturity_date),
+                                  underlying_asset=FinancialAsset(underlying_symbol, underlying_type))
+    order_sink = ShardOrderSink(shard, results)
+    watch_list.set_order_sink(order_sink)
+    books = dict()
+    stats = ShardStats()
+    now = latency.now
+
+    while True:
+        message = ticks.get()
+        if message[0] == MESSAGE_TICK:
+            start_time = now()
+            kind, symbol, market_data, spot_bid_price, spot_ask_price, received_time = message
+            book = books.get(symbol)
+            if book is None:
+                book = books[symbol] = OrderBook(symbol, depth=book_depth)
+            book.update(market_data)
+            try:
+                watch_list.search_rate_arbitrage(future_symbol=symbol,
+                                                 future_bid_price=market_data['BI'][0]['price'],
+                                                 future_bid_size=market_data['BI'][0]['size'],
+                                                 future_ask_price=market_data['OF'][0]['price'],
+                                                 future_ask_size=market_data['OF'][0]['size'],
+                                                 spot_bid_price=spot_bid_price,
+                                                 spot_ask_price=spot_ask_price,
+                                                 future_book=book,
+                                                 received_time=received_time)
+            except IndexError:
+                pass
+            stats.record(received_time if received_time is not None else start_time, start_time, now())
+            continue
+
+        kind, request_id, command, args = message
+        if command == COMMAND_ROLL_DAY:
+            value = watch_list.roll_day(*args)
+        else:
+            value = stats.to_dict()
+            value.update(skipped_ticks=watch_list.skipped_ticks, orders=order_sink.orders)
+        results.put((MESSAGE_REPLY, shard, request_id, value))
+        if command == COMMAND_STOP:
+            event_log.flush()  # los procesos de multiprocessing terminan sin ejecutar atexit
+            return
+
+
+class ShardPool:
+
+    # Constructor
+    # -----------
+    # watch_list: RateWatchList del dispatcher, ya armada. Sus grupos de vencimiento se reparten entre los shards, y
+    # de ella se toman los parametros de las RateWatchList de los shards y los precios spot de los subyacentes
+    # workers: cantidad de procesos de trabajo. Si hay menos grupos de vencimiento, se crea un proceso por grupo
+    # send_orders: funcion que envia las patas de las operaciones de los shards. Por defecto, watch_list.send_orders
+    # (el destino de ordenes de la watch list del dispatcher, o ROFEX y BYMA)
+    # book_depth: cantidad de niveles de precios de los libros de ordenes de los shards
+    def __init__(self, watch_list, workers=DEFAULT_WORKERS, send_orders=None, book_depth=DEFAULT_DEPTH):
+        self.watch_list = watch_list
+        self.send_orders = send_orders if send_orders is not None else watch_list.send_orders
+        self.book_depth = book_depth
+
+        instruments = watch_list.instruments
+        future_ids = instruments.get_futures()
+        group_sizes = dict()
+        for future_id in future_ids:
+            maturity_date = instruments.assets[future_id].maturity_date
+            group_sizes[maturity_date] = group_sizes.get(maturity_date, 0) + 1
+        self.workers = max(1, min(workers, len(group_sizes)))
+        self.assignment = assign_groups(group_sizes, self.workers)  # fecha de vencimiento -> shard
+        self.routes = dict()  # shard de cada futuro. Ej: GGAL/AGO21: 0
+        self.pairs = [[] for shard in range(self.workers)]  # pares (futuro, subyacente) de cada shard
+        for future_id in future_ids:
+            future_asset = instruments.assets[future_id]
+            underlying_asset = instruments.assets[instruments.underlying[future_id]]
+            shard = self.assignment[future_asset.maturity_date]
+            self.routes[future_asset.symbol] = shard
+            self.pairs[shard].append((future_asset.symbol, future_asset.maturity_date, underlying_asset.symbol,
+                                      underlying_asset.asset_type))
+
+        self.context = multiprocessing.get_context('spawn')
+        self.ticks = []  # cola de mensajes de cada shard
+        self.results = None  # cola de respuestas y ordenes de los shards
+        self.processes = []
+        self.results_thread = None
+        self.request_ids = itertools.count()
+        self.replies = dict()  # respuestas recibidas de cada comando. Ej: 3: {0: {...}, 1: {...}}
+        self.condition = threading.Condition()
+        self.dispatched = 0  # mensajes enviados a los shards
+        self.unrouted = 0  # mensajes de futuros que no estan en ningun shard
+        self.unquoted = 0  # mensajes descartados porque el subyacente no tiene precio spot en el poller
+        self.order_errors = 0  # operaciones de los shards que no se pudieron enviar
+
+    # start()
+    # -------
+    # Lanza los procesos de trabajo y el thread que recibe sus respuestas y ordenes. Vuelve cuando todos los procesos
+    # armaron su RateWatchList, para que el tiempo de arranque no se cuente como latencia del primer mensaje
+    def start(self):
+        watch_list = self.watch_list
+        watch_list_params = {'transaction_cost': watch_list.transaction_cost, 'max_slippage': watch_list.max_slippage,
+                             'price_tolerance': watch_list.price_tolerance, 'lot_objective': watch_list.lot_objective,
+                             'max_imbalance': watch_list.max_imbalance}
+        log = event_log.get_event_log()
+        log_config = (log.path, log.level, log.console)
+        self.results = self.context.Queue()
+        for shard in range(self.workers):
+            ticks = self.context.Queue()
+            process = self.context.Process(target=run_shard, name=f"Shard-{shard}", daemon=True,
+                                           args=(shard, self.pairs[shard], watch_list_params, self.book_depth,
+                                                 log_config, ticks, self.results))
+            process.start()
+            self.ticks.append(ticks)
+            self.processes.append(process)
+        self.results_thread = threading.Thread(target=self.receive_results, name="ShardResults", daemon=True)
+        self.results_thread.start()
+        self.request(COMMAND_STATS)
+
+    # dispatch(message, received_time)
+    # --------------------------------
+    # Envia un mensaje de market data del websocket de ROFEX al shard de su futuro, con los precios spot actuales del
+    # subyacente (una sola cotizacion, para que el bid y el ask sean del mismo momento). No espera a que el shard lo
+    # procese. Si el subyacente no tiene cotizacion en su fuente de precios o en el poller, descarta el mensaje
+    # received_time: momento de llegada del mensaje (latency.now()). Por defecto, el momento del envio
+    def dispatch(self, message, received_time=None):
+        symbol = message['instrumentId']['symbol']
+        shard = self.routes.get(symbol)
+        if shard is None:
+            self.unrouted += 1
+            return
+        if received_time is None:
+            received_time = latency.now()
+        spot_quote = self.watch_list.get_underlying_asset(symbol).cached_quote()
+        if spot_quote is None:
+            self.unquoted += 1
+            return
+        self.ticks[shard].put((MESSAGE_TICK, symbol, message['marketData'], spot_quote.bid, spot_quote.ask,
+                               received_time))
+        self.dispatched += 1
+
+    # receive_results()
+    # -----------------
+    # Cuerpo del thread que recibe los mensajes de los shards: envia sus ordenes y guarda sus respuestas
+    def receive_results(self):
+        while True:
+            message = self.results.get()
+            if message is None:
+                return
+            if message[0] == MESSAGE_ORDERS:
+                kind, shard, legs = message
+                try:
+                    self.send_orders(legs)
+                except Exception as e:
+                    self.order_errors += 1
+                    print(f"Error. No se pudieron enviar las ordenes del shard {shard}: {e}")
+                continue
+            kind, shard, request_id, value = message
+            with self.condition:
+                self.replies.setdefault(request_id, dict())[shard] = value
+                self.condition.notify_all()
+
+    # request(command, args, timeout)
+    # -------------------------------
+    # Envia un comando a todos los shards y espera sus respuestas. Los comandos se encolan detras de los mensajes de
+    # market data ya enviados, por lo que la respuesta refleja todos los mensajes anteriores
+    # Devuelve la lista de respuestas, una por shard (None si un shard no respondio antes del timeout)
+    def request(self, command, args=(), timeout=DEFAULT_REQUEST_TIMEOUT):
+        request_id = next(self.request_ids)
+        for ticks in self.ticks:
+            ticks.put((MESSAGE_COMMAND, request_id, command, args))
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while len(self.replies.get(request_id, ())) < self.workers:
+                remaining_time = deadline - time.monotonic()
+                if remaining_time <= 0:
+                    break
+                self.condition.wait(remaining_time)
+            replies = self.replies.pop(request_id, dict())
+        return [replies.get(shard) for shard in range(self.workers)]
+
+    # stats()
+    # -------
+    # Devuelve las estadisticas de cada shard: lista de diccionarios con los grupos de vencimiento y futuros del shard,
+    # mensajes procesados y descartados sin cambios, mensajes por segundo, fraccion de tiempo ocupado, operaciones
+    # enviadas y percentiles de latencia (en microsegundos)
+    def stats(self, command=COMMAND_STATS):
+        shard_stats = []
+        for shard, value in enumerate(self.request(command)):
+            groups = [maturity_date for maturity_date, assigned_shard in self.assignment.items()
+                      if assigned_shard == shard]
+            shard_stats.append(dict(shard=shard, groups=sorted(groups), futures=len(self.pairs[shard]),
+                                    **(value or {})))
+        return shard_stats
+
+    # roll_day(current_date)
+    # ----------------------
+    # Actualiza los dias al vencimiento de los futuros de todos los shards (ver RateWatchList.roll_day)
+    # Los futuros siguen en el mismo shard: los grupos se asignan por fecha de vencimiento
+    # Devuelve la cantidad de futuros actualizados
+    def roll_day(self, current_date=None):
+        return sum(changed or 0 for changed in self.request(COMMAND_ROLL_DAY, (current_date,)))
+
+    # expire(future_symbols)
+    # ----------------------
+    # Deja de enviar a los shards los mensajes de una lista de futuros vencidos (ver RateWatchList.get_expired_symbols)
+    # Los mensajes que lleguen despues se cuentan como unrouted
+    def expire(self, future_symbols):
+        for future_symbol in future_symbols:
+            self.routes.pop(future_symbol, None)
+
+    # stop()
+    # ------
+    # Detiene los procesos de trabajo despues de procesar los mensajes pendientes
+    # Devuelve las estadisticas finales de cada shard (ver stats)
+    def stop(self):
+        if not self.processes:
+            return []
+        shard_stats = self.stats(COMMAND_STOP)
+        for process in self.processes:
+            process.join(timeout=DEFAULT_REQUEST_TIMEOUT)
+        self.results.put(None)
+        self.results_thread.join()
+        self.processes = []
+        self.ticks = []
+        return shard_stats
+
+    # report(shard_stats)
+    # -------------------
+    # Devuelve un texto con las estadisticas de cada shard. Por defecto, las estadisticas actuales (ver stats)
+    def report(self, shard_stats=None):
+        if shard_stats is None:
+            shard_stats = self.stats()
+        lines = [f"{'shard':>5}{'groups':>8}{'futures':>9}{'ticks':>11}{'ticks/s':>9}{'busy':>7}{'orders':>9}"
+                 f"{'p50 (us)':>10}{'p99 (us)':>10}{'max (us)':>10}"]
+        for stats in shard_stats:
+            if 'ticks' not in stats:
+                lines.append(f"{stats['shard']:>5}{len(stats['groups']):>8}{stats['futures']:>9}  sin respuesta")
+                continue
+            lines.append(f"{stats['shard']:>5}{len(stats['groups']):>8}{stats['futures']:>9}{stats['ticks']:>11}"
+                         f"{stats['ticks_per_second']:>9.0f}{stats['busy']:>7.1%}{stats['orders']:>9}"
+                         f"{stats['p50_us']:>10.1f}{stats['p99_us']:>10.1f}{stats['max_us']:>10.1f}")
+        return "\n".join(lines)
+
+
+# Test shard_pool.py
+if __name__ == "__main__":
+
+    import datetime
+    import random
+    import asset
+    from rate_watch_list import RateWatchList, FinancialAsset, ASSET_TYPE_CURRENCY, ASSET_TYPE_STOCK, ASSET_TYPE_FUTURE
+    from spot_quote_poller import SpotQuote
+
+    print(assign_groups({datetime.date(2021, 8, 31): 3, datetime.date(2021, 9, 30): 3,
+                         datetime.date(2021, 10, 29): 1}, 2))
+    # {datetime.date(2021, 8, 31): 0, datetime.date(2021, 9, 30): 1, datetime.date(2021, 10, 29): 0}
+
+    # Curva de 12 futuros mensuales de DLR y de 4 acciones, con precios spot fijos (sin consultar dolarsi ni Yahoo)
+    class FixedQuoteSource:
+        def get_quote(self, symbol):
+            return SpotQuote(bid=100.0, ask=100.1, timestamp=time.time())
+
+    event_log.configure(level=event_log.WARNING, console=False)
+    watch_list = RateWatchList(transaction_cost=0.001)
+    watch_list.set_price_source(FixedQuoteSource())
+    for month in range(1, 13):
+        maturity_date = asset.today() + datetime.timedelta(days=30 * month)
+        for underlying_symbol in ("DLR", "GGAL.BA", "PAMP.BA", "YPFD.BA", "BMA.BA"):
+            underlying_type = ASSET_TYPE_CURRENCY if underlying_symbol == "DLR" else ASSET_TYPE_STOCK
+            watch_list.add_watch_pair(
+                future_asset=FinancialAsset(f"{underlying_symbol.split('.')[0]}/M{month}", ASSET_TYPE_FUTURE,
+                                            maturity_date),
+                underlying_asset=FinancialAsset(underlying_symbol, underlying_type))
+
+    orders = []
+    pool = ShardPool(watch_list, workers=4, send_orders=orders.append)
+    print(pool.workers, [len(pairs) for pairs in pool.pairs])  # 4 [15, 15, 15, 15]
+    pool.start()
+    symbols = watch_list.get_watch_symbols()
+    start_time = time.perf_counter()
+    for i in range(40000):
+        bid_price = round(random.uniform(102.0, 102.3), 2)
+        pool.dispatch({'instrumentId': {'symbol': symbols[i % len(symbols)]},
+                       'marketData': {'BI': [{'price': bid_price, 'size': 10}],
+                                      'OF': [{'price': bid_price + 1.0, 'size': 10}]}})
+    # Una tasa colocadora de DLR/M1 mayor a la tasa tomadora de GGAL/M1 (mismo vencimiento) genera una operacion
+    # en el shard, que vuelve al dispatcher como MESSAGE_ORDERS
+    pool.dispatch({'instrumentId': {'symbol': "DLR/M1"},
+                   'marketData': {'BI': [{'price': 105.0, 'size': 10}], 'OF': [{'price': 106.0, 'size': 10}]}})
+    pool.dispatch({'instrumentId': {'symbol': "GGAL/M1"},
+                   'marketData': {'BI': [{'price': 100.2, 'size': 10}], 'OF': [{'price': 100.3, 'size': 10}]}})
+    pool.expire([symbols[0]])  # un futuro vencido deja de enviarse a su shard
+    pool.dispatch({'instrumentId': {'symbol': symbols[0]}, 'marketData': {'BI': [], 'OF': []}})
+    print(pool.unrouted)  # 1
+    shard_stats = pool.stop()
+    elapsed_time = time.perf_counter() - start_time
+    print(pool.report(shard_stats))
+    # Con un solo nucleo, los 4 shards comparten el procesador y los mensajes se encolan: la latencia es la espera en
+    # la cola. Con un nucleo por shard, cada shard procesa sus mensajes en paralelo con los demas
+    # shard  groups  futures      ticks  ticks/s   busy   orders  p50 (us)  p99 (us)  max (us)
+    #     0       3       15      10002     3452  54.9%        2  822083.6 1366837.6 1366837.6
+    #     ...
+    print(f"{pool.dispatched / elapsed_time:.0f} mensajes por segundo, {len(orders)} operaciones")
+    # 13364 mensajes por segundo, 2 operaciones
@@ -0,0 +1,134 @@
+# spot_quote_poller.py
+# --------------------
+# Este modulo define la clase SpotQuotePoller
+# SpotQuotePoller mantiene actualizada una tabla con los precios spot (bid y ask) de los activos subyacentes
+# de la watch list. La tabla se refresca en un thread propio, de manera que el callback del websocket de ROFEX
+# no tenga que esperar las consultas HTTP a Yahoo Finance o dolarsi en cada evento de market data
+#
+# Ejemplo de uso
+# --------------
+# poller = SpotQuotePoller(refresh_interval=5)
+# poller.add_asset(FinancialAsset(symbol="GGAL.BA", asset_type=ASSET_TYPE_STOCK))
+# poller.start()
+# quote = poller.get_quote("GGAL.BA")
+# print(quote.bid, quote.ask, quote.timestamp)  # 161.5 163.4 1624377600.25
+
+import collections
+import threading
+import time
+
+DEFAULT_REFRESH_INTERVAL = 5  # segundos entre dos actualizaciones de la tabla de precios
+
+# Cotizacion spot de un activo
+# bid, ask: precios de compra y venta
+# timestamp: momento en que se obtuvo la cotizacion (segundos desde epoch, time.time())
+SpotQuote = collections.namedtuple('SpotQuote', ['bid', 'ask', 'timestamp'])
+
+
+class SpotQuotePoller:
+
+    # Constructor
+    # -----------
+    # refresh_interval: cantidad de segundos entre dos actualizaciones de la tabla de precios
+    # fetch_bid_ask_many: parametro opcional. Funcion que recibe una lista de activos y devuelve un diccionario
+    # symbol -> (bid, ask) (e.g. FinancialAsset.fetch_bid_ask_many). Permite actualizar todos los activos con una
+    # consulta en lote. Si no se especifica, se consulta cada activo por separado con asset.fetch_bid_ask()
+    # quote_board: parametro opcional. QuoteBoardWriter (ver quote_board.py) en el que tambien se publica cada
+    # cotizacion, para que la lean otros procesos
+    def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL, fetch_bid_ask_many=None, quote_board=None):
+        self.refresh_interval = refresh_interval
+        self.fetch_bid_ask_many = fetch_bid_ask_many
+        self.quote_board = quote_board
+        self.assets = dict()  # activos a actualizar. Ej: GGAL.BA: <FinancialAsset>, DLR: <FinancialAsset>
+        self.quotes = dict()  # ultima cotizacion de cada activo. Ej: GGAL.BA: SpotQuote(161.5, 163.4, ...)
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    # add_asset(asset)
+    # ----------------
+    # Agrega un activo a la lista de activos cuyos precios se actualizan en segundo plano
+    # El parametro asset debe ser un objeto de tipo FinancialAsset
+    def add_asset(self, asset):
+        self.assets[asset.symbol] = asset
+
+    # get_quote(symbol)
+    # -----------------
+    # Devuelve la ultima cotizacion (SpotQuote) disponible de un activo, o None si aun no hay cotizacion
+    # La lectura no bloquea: solo consulta la tabla de precios
+    def get_quote(self, symbol):
+        return self.quotes.get(symbol)
+
+    # refresh()
+    # ---------
+    # Consulta los precios de todos los activos y actualiza la tabla
+    # Si la consulta de un activo falla, se conserva la ultima cotizacion conocida
+    def refresh(self):
+        assets = list(self.assets.values())
+        if self.fetch_bid_ask_many is not None:
+            try:
+                bid_ask = self.fetch_bid_ask_many(assets)
+            except Exception as e:
+                print(f"Error. No se pudieron actualizar las cotizaciones: {e}")
+                return
+        else:
+            bid_ask = dict()
+            for asset in assets:
+                try:
+                    bid_ask[asset.symbol] = asset.fetch_bid_ask()
+                except Exception as e:
+                    print(f"Error. No se pudo actualizar la cotizacion de {asset.symbol}: {e}")
+
+        timestamp = time.time()
+        for symbol, (bid_price, ask_price) in bid_ask.items():
+            # Se reemplaza la tupla completa. La asignacion es atomica, por lo que los lectores nunca ven
+            # un bid de una cotizacion y un ask de otra
+            self.quotes[symbol] = SpotQuote(bid=bid_price, ask=ask_price, timestamp=timestamp)
+            if self.quote_board is not None:
+                self.quote_board.update(symbol, bid=bid_price, ask=ask_price, timestamp=timestamp)
+
+    # start()
+    # -------
+    # Carga la tabla de precios por primera vez y lanza el thread que la mantiene actualizada
+    def start(self):
+        if self.thread is not None:
+            return
+        self.refresh()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="SpotQuotePoller", daemon=True)
+        self.thread.start()
+
+    # stop()
+    # ------
+    # Detiene el thread de actualizacion
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    # run()
+    # -----
+    # Cuerpo del thread de actualizacion. Refresca la tabla cada refresh_interval segundos hasta que se invoca stop()
+    def run(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            self.refresh()
+
+
+# Test spot_quote_poller.py
+if __name__ == "__main__":
+
+    from asset import *
+
+    poller = SpotQuotePoller(refresh_interval=2, fetch_bid_ask_many=FinancialAsset.fetch_bid_ask_many)
+    poller.add_asset(FinancialAsset(symbol="DLR", asset_type=ASSET_TYPE_CURRENCY))
+    poller.add_asset(FinancialAsset(symbol="GGAL.BA", asset_type=ASSET_TYPE_STOCK))
+    poller.start()
+
+    for i in range(3):
+        for symbol in ["DLR", "GGAL.BA"]:
+            quote = poller.get_quote(symbol)
+            print(f"{symbol} Bid price:${quote.bid} Ask price:${quote.ask} ({time.time() - quote.timestamp:.1f}s)")
+        time.sleep(2)
+    poller.stop()
+    # DLR Bid price:$94.71 Ask price:$100.71 (0.3s)
+    # GGAL.BA Bid price:$161.5 Ask price:$163.4 (0.0s)
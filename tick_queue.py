@@ -0,0 +1,154 @@
+# tick_queue.py
+# -------------
+# Este modulo define la clase ConflatingTickQueue
+# ConflatingTickQueue desacopla el thread del websocket de ROFEX del procesamiento de los eventos de market data
+#
+# El callback del websocket solo encola el mensaje y vuelve de inmediato (nunca se bloquea). La cola guarda solo el
+# ultimo mensaje pendiente de cada futuro: si llega un mensaje nuevo de un futuro que todavia no se proceso, reemplaza
+# al anterior (conflacion). Asi, ante rafagas de mensajes, siempre se procesa el libro mas reciente
+#
+# Uno o mas threads de trabajo (start_workers) retiran los mensajes y los procesan. Un mismo futuro nunca se procesa
+# en dos threads a la vez
+#
+# Ejemplo de uso
+# --------------
+# tick_queue = ConflatingTickQueue()
+# start_workers(tick_queue, process_message, workers=1)
+# tick_queue.put("GGAL/AGO21", message)  # desde el callback del websocket
+# print(tick_queue.stats())  # {'received': 120, 'conflated': 85, 'dropped': 0, 'processed': 35, 'depth': 0, ...}
+
+import collections
+import threading
+
+DEFAULT_MAX_SYMBOLS = 1024  # cantidad maxima de futuros con mensajes pendientes
+
+
+class ConflatingTickQueue:
+
+    # Constructor
+    # -----------
+    # max_symbols: cantidad maxima de futuros con mensajes pendientes. Si se supera, los mensajes de futuros nuevos
+    # se descartan (y se cuentan en 'dropped')
+    def __init__(self, max_symbols=DEFAULT_MAX_SYMBOLS):
+        self.max_symbols = max_symbols
+        self.latest = dict()  # ultimo mensaje pendiente de cada futuro
+        self.pending = collections.deque()  # futuros con mensajes pendientes, en orden de llegada
+        self.in_flight = set()  # futuros que se estan procesando
+        self.condition = threading.Condition()
+        self.closed = False
+
+        # Contadores
+        self.received = 0  # mensajes recibidos
+        self.conflated = 0  # mensajes reemplazados por uno mas reciente antes de procesarse
+        self.dropped = 0  # mensajes descartados por cola llena
+        self.processed = 0  # mensajes procesados
+        self.max_depth = 0  # maxima cantidad de futuros pendientes observada
+
+    # put(symbol, message)
+    # --------------------
+    # Encola el mensaje de market data de un futuro. No se bloquea
+    def put(self, symbol, message):
+        with self.condition:
+            self.received += 1
+            if symbol in self.latest:
+                self.latest[symbol] = message
+                self.conflated += 1
+                return
+            if len(self.latest) >= self.max_symbols:
+                self.dropped += 1
+                return
+            self.latest[symbol] = message
+            self.pending.append(symbol)
+            self.max_depth = max(self.max_depth, len(self.pending))
+            self.condition.notify()
+
+    # get(timeout)
+    # ------------
+    # Retira el mensaje pendiente mas antiguo de un futuro que no se este procesando. Devuelve (symbol, message)
+    # Se bloquea hasta que haya un mensaje. Devuelve None si la cola se cierra o si se cumple el timeout
+    # Al terminar de procesar el mensaje hay que invocar task_done(symbol)
+    def get(self, timeout=None):
+        with self.condition:
+            while True:
+                if self.closed:
+                    return None
+                for index, symbol in enumerate(self.pending):
+                    if symbol not in self.in_flight:
+                        del self.pending[index]
+                        self.in_flight.add(symbol)
+                        return symbol, self.latest.pop(symbol)
+                if not self.condition.wait(timeout):
+                    return None
+
+    # task_done(symbol)
+    # -----------------
+    # Indica que termino el procesamiento del mensaje de un futuro
+    def task_done(self, symbol):
+        with self.condition:
+            self.in_flight.discard(symbol)
+            self.processed += 1
+            if symbol in self.latest:
+                self.condition.notify()  # Llego un mensaje nuevo de este futuro mientras se procesaba el anterior
+
+    # close()
+    # -------
+    # Cierra la cola. Los threads de trabajo terminan
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    # stats()
+    # -------
+    # Devuelve un diccionario con los contadores de la cola y la cantidad actual de futuros pendientes (depth)
+    def stats(self):
+        with self.condition:
+            return {'received': self.received, 'conflated': self.conflated, 'dropped': self.dropped,
+                    'processed': self.processed, 'depth': len(self.pending), 'max_depth': self.max_depth}
+
+
+# start_workers(tick_queue, process, workers)
+# -------------------------------------------
+# Lanza <workers> threads que retiran mensajes de la cola y los procesan con process(message)
+# Devuelve la lista de threads. Los threads terminan cuando se cierra la cola
+def start_workers(tick_queue, process, workers=1):
+    def work():
+        while True:
+            item = tick_queue.get()
+            if item is None:
+                return
+            symbol, message = item
+            try:
+                process(message)
+            except Exception as e:
+                print(f"Error procesando market data de {symbol}: {e}")
+            finally:
+                tick_queue.task_done(symbol)
+
+    threads = []
+    for i in range(workers):
+        thread = threading.Thread(target=work, name=f"TickWorker-{i + 1}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+# Test tick_queue.py
+if __name__ == "__main__":
+
+    import time
+
+    def process(message):
+        time.sleep(0.01)  # Simula el calculo de tasas
+
+    tick_queue = ConflatingTickQueue()
+    threads = start_workers(tick_queue, process, workers=1)
+
+    # Rafaga de 1000 mensajes de 5 futuros
+    for i in range(1000):
+        symbol = ["GGAL/AGO21", "PAMP/AGO21", "YPFD/AGO21", "DLR/AGO21", "DLR/SEP21"][i % 5]
+        tick_queue.put(symbol, {'instrumentId': {'symbol': symbol}, 'sequence': i})
+    time.sleep(0.2)
+    tick_queue.close()
+    print(tick_queue.stats())
+    # {'received': 1000, 'conflated': 995, 'dropped': 0, 'processed': 5, 'depth': 0, 'max_depth': 5}
@@ -0,0 +1,123 @@
+# watch_list_discovery.py
+# -----------------------
+# Arma una RateWatchList con todos los futuros que cotizan en ROFEX, en lugar de leerla de watch_list.csv
+#
+# Cada simbolo de la lista de instrumentos (rofex.get_symbol_list) se procesa una sola vez:
+#   se descartan los instrumentos que no son futuros simples (e.g. pases como DLR/OCT21/NOV21, o RFX20 sin subyacente)
+#   se descartan los futuros con sufijo "A" (e.g. DLR/OCT21A), salvo que se indique lo contrario
+#   el subyacente se obtiene de una tabla configurable (e.g. GGAL -> GGAL.BA, DLR -> DLR)
+#   la fecha de vencimiento se obtiene del simbolo con FinancialAsset.get_maturity_date
+#
+# Ejemplo de uso
+# --------------
+# watch_list = RateWatchList(transaction_cost=0.001)
+# underlying_map = {'DLR': 'DLR', 'GGAL': 'GGAL.BA', 'PAMP': 'PAMP.BA', 'YPFD': 'YPFD.BA'}
+# build_watch_list(watch_list, rofex.get_symbol_list(), underlying_map)
+# print(list(watch_list.get_watch_symbols()))  # ['DLR/OCT21', 'GGAL/AGO21', 'DLR/SEP21', ...]
+
+import functools
+import re
+from asset import *
+
+# Tabla de subyacentes por defecto: raiz del ticker del futuro -> simbolo del activo subyacente
+DEFAULT_UNDERLYING_MAP = {'DLR': 'DLR', 'GGAL': 'GGAL.BA', 'PAMP': 'PAMP.BA', 'YPFD': 'YPFD.BA'}
+
+# Ticker de futuro simple: raiz/MMMYY con sufijo opcional "A" (e.g. DLR/OCT21, DLR/OCT21A)
+FUTURE_SYMBOL_PATTERN = re.compile(r'^([A-Z0-9.]+)/(' + '|'.join(MONTH_LIST) + r')(\d{2})(A?)$')
+
+
+# parse_future_symbol(symbol)
+# ---------------------------
+# Descompone el ticker de un futuro simple. Devuelve una tupla (root, maturity_date, rolling) o None si el simbolo no
+# es un futuro simple
+#   root: raiz del ticker (e.g. DLR)
+#   maturity_date: fecha de vencimiento (datetime.date)
+#   rolling: True si el ticker tiene sufijo "A" (e.g. DLR/OCT21A)
+# El resultado se guarda en un cache: cada simbolo se procesa una sola vez
+#
+# Ejemplo de uso
+# --------------
+# print(parse_future_symbol("DLR/OCT21A"))  # ('DLR', datetime.date(2021, 10, 31), True)
+# print(parse_future_symbol("DLR/OCT21/NOV21"))  # None
+@functools.lru_cache(maxsize=None)
+def parse_future_symbol(symbol):
+    match = FUTURE_SYMBOL_PATTERN.match(symbol)
+    if match is None:
+        return None
+    root, month_string, year_string, rolling_suffix = match.groups()
+    maturity_date = FinancialAsset.get_maturity_date(f"{root}/{month_string}{year_string}")
+    return root, maturity_date, rolling_suffix == "A"
+
+
+# build_watch_list(watch_list, symbols, underlying_map, skip_rolling)
+# -------------------------------------------------------------------
+# Agrega a watch_list todos los futuros de la lista symbols que tengan subyacente en underlying_map
+# watch_list: objeto de tipo RateWatchList
+# symbols: lista de tickers (e.g. el resultado de rofex.get_symbol_list())
+# underlying_map: diccionario raiz del ticker -> simbolo del subyacente (e.g. {'GGAL': 'GGAL.BA'})
+# skip_rolling: si es True, se descartan los futuros con sufijo "A"
+# Devuelve la cantidad de pares agregados
+def build_watch_list(watch_list, symbols, underlying_map=None, skip_rolling=True):
+    if underlying_map is None:
+        underlying_map = DEFAULT_UNDERLYING_MAP
+    underlying_assets = dict()  # un unico FinancialAsset por subyacente, compartido por todos sus futuros
+    pairs = 0
+    for symbol in symbols:
+        parsed_symbol = parse_future_symbol(symbol)
+        if parsed_symbol is None:
+            continue
+        root, maturity_date, rolling = parsed_symbol
+        if (rolling and skip_rolling) or root not in underlying_map:
+            continue
+
+        underlying_asset_symbol = underlying_map[root]
+        underlying_asset = underlying_assets.get(underlying_asset_symbol)
+        if underlying_asset is None:
+            if underlying_asset_symbol == 'DLR':
+                underlying_asset_type = ASSET_TYPE_CURRENCY
+            else:
+                underlying_asset_type = ASSET_TYPE_STOCK
+            underlying_asset = FinancialAsset(symbol=underlying_asset_symbol, asset_type=underlying_asset_type)
+            underlying_assets[underlying_asset_symbol] = underlying_asset
+
+        future_asset = FinancialAsset(symbol=symbol, asset_type=ASSET_TYPE_FUTURE, maturity_date=maturity_date)
+        if future_asset.days_to_maturity < 0:
+            continue  # Futuro vencido
+        watch_list.add_watch_pair(future_asset=future_asset, underlying_asset=underlying_asset)
+        pairs += 1
+    return pairs
+
+
+# parse_underlying_map(text)
+# --------------------------
+# Convierte la tabla de subyacentes de config.ini en un diccionario
+# Ej: "DLR:DLR, GGAL:GGAL.BA" -> {'DLR': 'DLR', 'GGAL': 'GGAL.BA'}
+def parse_underlying_map(text):
+    underlying_map = dict()
+    for item in text.split(','):
+        if ':' in item:
+            root, underlying_asset_symbol = item.split(':', 1)
+            underlying_map[root.strip()] = underlying_asset_symbol.strip()
+    return underlying_map
+
+
+# Test watch_list_discovery.py
+if __name__ == "__main__":
+
+    from rate_watch_list import RateWatchList
+
+    print(parse_future_symbol("DLR/OCT21A"))  # ('DLR', datetime.date(2021, 10, 31), True)
+    print(parse_future_symbol("DLR/DIC21"))  # ('DLR', datetime.date(2021, 12, 31), False)
+    print(parse_future_symbol("DLR/OCT21/NOV21"))  # None
+    print(parse_underlying_map("DLR:DLR, GGAL:GGAL.BA"))  # {'DLR': 'DLR', 'GGAL': 'GGAL.BA'}
+
+    import rofex
+    watch_list = RateWatchList(transaction_cost=0.0)
+    pairs = build_watch_list(watch_list, rofex.get_symbol_list())
+    print(f"{pairs} pares agregados")
+    for symbol in watch_list.get_watch_symbols():
+        print(symbol)
+    # 27 pares agregados
+    # DLR/ENE22
+    # YPFD/AGO21
+    # ...